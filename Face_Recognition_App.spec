@@ -31,7 +31,7 @@ a = Analysis(
         (face_landmarks_path_2, 'face_recognition_models/models'),
         (face_landmarks_path_3, 'face_recognition_models/models')
     ],
-    hiddenimports=['face_recognition'],
+    hiddenimports=['face_recognition', 'capture_student', 'capture_widget', 'attendance_capture'],  # imported lazily by main.py
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,165 @@
+# archive.py
+"""
+Retention for the attendance table: move old marks to an archive database, or delete a range,
+in bounded batches.
+
+Each batch is its own short transaction, so the capture writer is never locked out for long
+and a cancelled or interrupted run leaves both databases consistent; running it again simply
+carries on. Archived marks keep counting in the report aggregates, deleted ones do not.
+
+    python -m archive --older-than-days 180
+"""
+import argparse
+import os
+import time
+import database
+
+BATCH_SIZE = 5000
+
+ARCHIVE_COLUMNS = "id, matric_number, name, timestamp, ts, session_id"
+
+
+def default_archive_path(db_path):
+    root, extension = os.path.splitext(db_path)
+    return f"{root}_archive{extension or '.db'}"
+
+
+def create_archive(archive_path):
+    conn = database.connect(archive_path)
+    try:
+        # Live ids are AUTOINCREMENT and never reused, so they key the archive too and make a
+        # batch that is copied twice (after a crash between the two commits) land only once
+        conn.execute('''CREATE TABLE IF NOT EXISTS attendance (
+                            id INTEGER PRIMARY KEY,
+                            matric_number TEXT,
+                            name TEXT,
+                            timestamp DATETIME,
+                            ts INTEGER,
+                            session_id INTEGER,
+                            archived_at INTEGER
+                          )''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance (ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_matric_ts ON attendance (matric_number, ts)")
+        conn.commit()
+        conn.execute("PRAGMA journal_mode=WAL")
+    finally:
+        conn.close()
+
+
+class AttendancePruner:
+    """
+    Archives or deletes the attendance rows matching a ts range, batch_size rows per transaction.
+
+    before/after are epoch seconds (ts < before, ts >= after); with neither every row matches.
+    """
+
+    def __init__(self, db_path, archive_path=None, batch_size=BATCH_SIZE):
+        self.db_path = db_path
+        self.archive_path = archive_path or default_archive_path(db_path)
+        self.batch_size = batch_size
+
+    def _where(self, before, after):
+        conditions = []
+        params = []
+        if before is not None:
+            conditions.append("ts < ?")
+            params.append(before)
+        if after is not None:
+            conditions.append("ts >= ?")
+            params.append(after)
+        return (" AND ".join(conditions) or "1"), params
+
+    def count(self, conn, before=None, after=None):
+        where, params = self._where(before, after)
+        return conn.execute(f"SELECT COUNT(*) FROM attendance WHERE {where}", params).fetchone()[0]
+
+    def _keep_aggregates(self, conn):
+        # The delete trigger subtracts these marks from the report aggregates; add them once more
+        # first so archived marks still count in reports
+        course = "COALESCE((SELECT course_id FROM sessions WHERE id = a.session_id), 0)"
+        conn.execute(f"""INSERT INTO attendance_daily (day, matric_number, course_id, marks)
+                         SELECT date(a.timestamp), a.matric_number, {course}, COUNT(*)
+                         FROM attendance a WHERE a.id IN (SELECT id FROM temp.batch) GROUP BY 1, 2, 3
+                         ON CONFLICT (day, matric_number, course_id) DO UPDATE SET marks = marks + excluded.marks""")
+        conn.execute("""INSERT INTO session_attendance (session_id, present)
+                        SELECT session_id, COUNT(*) FROM attendance
+                        WHERE id IN (SELECT id FROM temp.batch) AND session_id IS NOT NULL GROUP BY session_id
+                        ON CONFLICT (session_id) DO UPDATE SET present = present + excluded.present""")
+        conn.execute("""INSERT INTO session_students (session_id, matric_number, marks)
+                        SELECT session_id, matric_number, COUNT(*) FROM attendance
+                        WHERE id IN (SELECT id FROM temp.batch) AND session_id IS NOT NULL
+                        GROUP BY session_id, matric_number
+                        ON CONFLICT (session_id, matric_number) DO UPDATE SET marks = marks + excluded.marks""")
+
+    def run(self, before=None, after=None, archive=True, progress=None, cancel_event=None):
+        """
+        Archive (or, with archive=False, delete) the matching rows. progress(done, total) is called
+        after every batch; setting cancel_event stops before the next one. Returns (done, cancelled).
+        """
+        database.migrate(self.db_path)
+        if archive:
+            create_archive(self.archive_path)
+
+        conn = database.connect(self.db_path)
+        try:
+            if archive:
+                conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch (id INTEGER PRIMARY KEY)")
+
+            where, params = self._where(before, after)
+            total = self.count(conn, before, after)
+            done = 0
+            if progress:
+                progress(done, total)
+
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return done, True
+
+                with conn:
+                    conn.execute("DELETE FROM temp.batch")
+                    # Oldest first along idx_attendance_ts; rows already moved are gone, so no offset is needed
+                    conn.execute(f"INSERT INTO temp.batch SELECT id FROM attendance WHERE {where} "
+                                 f"ORDER BY ts, id LIMIT ?", params + [self.batch_size])
+                    moved = conn.execute("SELECT COUNT(*) FROM temp.batch").fetchone()[0]
+                    if moved:
+                        if archive:
+                            conn.execute(f"INSERT OR IGNORE INTO archive.attendance ({ARCHIVE_COLUMNS}, archived_at) "
+                                         f"SELECT {ARCHIVE_COLUMNS}, ? FROM attendance "
+                                         f"WHERE id IN (SELECT id FROM temp.batch)", (int(time.time()),))
+                            self._keep_aggregates(conn)
+                        conn.execute("DELETE FROM attendance WHERE id IN (SELECT id FROM temp.batch)")
+                if not moved:
+                    return done, False
+
+                done += moved
+                if progress:
+                    progress(done, max(total, done))
+        finally:
+            conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive or delete old attendance records in batches")
+    parser.add_argument("--older-than-days", type=int, required=True, help="Move marks older than this many days")
+    parser.add_argument("--delete", action="store_true", help="Delete the marks instead of archiving them")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    parser.add_argument("--archive", default=None, help="Archive database (default: <db>_archive.db)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows moved per transaction")
+    args = parser.parse_args()
+
+    # ts holds wall-clock time, see database.to_epoch
+    before = database.to_epoch(database.now_timestamp()) - args.older_than_days * 24 * 60 * 60
+    pruner = AttendancePruner(args.db, args.archive, args.batch_size)
+
+    def report(done, total):
+        print(f"\r{done}/{total} records", end="", flush=True)
+
+    start = time.perf_counter()
+    done, _ = pruner.run(before=before, archive=not args.delete, progress=report)
+    action = "Deleted" if args.delete else f"Archived to {pruner.archive_path}"
+    print(f"\n{action}: {done} records in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
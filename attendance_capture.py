@@ -1,138 +1,393 @@
 # attendance_capture.py
+import argparse
 import cv2
-import face_recognition
-import sqlite3
+import logging
 import os
-import sys
-from datetime import datetime
+import threading
+import time
+from face_store import EncodingStore
+from face_matcher import DEFAULT_TOLERANCE, FaceMatcher
+from face_prototypes import GALLERY_MODES, make_compaction
+from face_index import make_index
+from capture_pipeline import RecognitionPipeline, StageStats, make_executor, open_source
+from face_tracker import FaceTracker
+from attendance_writer import AttendanceWriter
+from gallery_sync import GallerySync, latest_change_id
+from sessions import SessionTracker, DEFAULT_COURSE, DEFAULT_SESSION_LENGTH
+from unknown_faces import UnknownFaceCache
+import calibration
+import database
+from metrics import Metrics, MetricsReporter, NULL_METRICS, overlay_lines
+
+log = logging.getLogger(__name__)
+
+
+class Camera:
+    """ One capture source with its own grabber, tracker and statistics, feeding a shared worker pool. """
+
+    def __init__(self, name, source, capture, tracker, executor, slots, drop_frames=True, metrics=NULL_METRICS,
+                 number=0):
+        self.name = name
+        self.number = number
+        self.source = source
+        self.capture = capture
+        self.tracker = tracker
+        self.window_title = f"Attendance Capture - {name}" if name else "Attendance Capture"
+        self.pipeline = RecognitionPipeline(capture, make_task=tracker.make_task, drop_frames=drop_frames,
+                                            executor=executor, slots=slots, name=name, metrics=metrics)
+        self.recognition_stats = StageStats("recognise")
+        self.last_frame_id = 0
+
 
 class AttendanceCapture:
-    def __init__(self):
-        # Load student images and their encodings
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.known_face_matrics = []
+    def __init__(self, index_kind="auto", workers=2, use_processes=False,
+                 detect_interval=5, detect_scale=0.5, tracking="iou", db_path=None,
+                 course=DEFAULT_COURSE, session_length=DEFAULT_SESSION_LENGTH, gallery_mode="full", prototypes=3,
+                 metrics=False, overlay=False, progress=None, tolerance=None, unknown_attempts=3):
+        # Database holding students, encodings and attendance
+        self.db_path = db_path or database.resource_path('student_attendance.db')
+
+        # Nearest-neighbour index for the gallery: "exact", "ivf", "ivfpq" or "auto" (by gallery size)
+        self.index_kind = index_kind
+
+        # Detection/encoding worker pool size and whether it uses processes instead of threads
+        self.workers = workers
+        self.use_processes = use_processes
+
+        # Detect on every detect_interval-th frame at detect_scale resolution, tracking faces in between
+        self.detect_interval = detect_interval
+        self.detect_scale = detect_scale
+        self.tracking = tracking
+
+        # A face that matches nobody is encoded at most unknown_attempts times while it is tracked
+        self.unknown_attempts = unknown_attempts
+
+        # Stage timers, counters and gauges; a no-op recorder unless metrics are enabled
+        self.metrics = Metrics() if metrics or overlay else NULL_METRICS
+        self.overlay = overlay
+        self._overlay_lines = []
+        self._overlay_at = 0.0
+
+        # Match tolerance: as given, else the one saved by python -m calibration, else the library default
+        if tolerance is None:
+            try:
+                tolerance = calibration.load_tolerance(self.db_path)
+            except Exception:
+                log.exception("Error loading the calibrated tolerance")
+                tolerance = DEFAULT_TOLERANCE
+
+        # Load student images and their encodings; "centroid" or "medoids" keep a few prototypes per student
+        self.matcher = FaceMatcher(tolerance=tolerance, compaction=make_compaction(gallery_mode, prototypes))
+        self.metrics.gauge("gallery_rows", lambda: len(self.matcher))
+        self.metrics.gauge("gallery_students", lambda: len(self.matcher.identities))
+        self.synced_change_id = 0
+
+        # Unknown faces, clustered so each person gets one label and is saved once for enrolment
+        self.unknown_faces = UnknownFaceCache(radius=tolerance)
+        self.metrics.gauge("unknown_faces", lambda: len(self.unknown_faces))
 
         try:
-            self.load_known_faces()
-        except Exception as e:
-            print(f"Error loading known faces: {e}")
-
-        # Dictionary to keep track of attendance
-        self.attendance_marked = {}
-
-    def resource_path(self, relative_path):
-        """ Get the absolute path to the resource, works for development and PyInstaller. """
-        base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-        return os.path.join(base_path, relative_path)
-
-    def load_known_faces(self):
-        # Load all images from the student_images directory
-        db_path = self.resource_path('student_attendance.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT matric_number, name, image_path FROM students")
-        students = cursor.fetchall()
-
-        for student in students:
-            matric, name, image_folder = student
-            if not os.path.exists(image_folder):
-                continue
+            self.load_known_faces(progress)
+        except Exception:
+            log.exception("Error loading known faces")
+
+        # Students already marked in the current session of the course
+        self.sessions = SessionTracker(self.db_path, course, session_length, on_ready=self.record_mark)
+
+        # Background attendance writer, running while capture is active
+        self.writer = None
+
+        # Optional callback(matric, name, session_id) run for each new mark, e.g. to update a UI
+        self.on_mark = None
 
-            # Iterate through each image in the folder and encode it
-            for img_name in os.listdir(image_folder):
-                img_path = os.path.join(image_folder, img_name)
-                image = face_recognition.load_image_file(img_path)
-                encodings = face_recognition.face_encodings(image)
+    def load_known_faces(self, progress=None):
+        # Enrolment changes after this point are applied live by GallerySync. The id is read before
+        # the gallery, so a change committed while it loads is replayed rather than missed.
+        conn = database.connect(self.db_path)
+        try:
+            database.migrate_connection(conn)
+            change_id = latest_change_id(conn)
+            self.unknown_faces.load(conn)
+        finally:
+            conn.close()
 
-                if encodings:  # Check if encodings are not empty
-                    self.known_face_encodings.append(encodings[0])
-                    self.known_face_names.append(name)
-                    self.known_face_matrics.append(matric)
+        # Load cached encodings for all student images, only encoding images that are new or changed
+        store = EncodingStore(self.db_path, self.metrics)
+        encodings, labels, identities = store.load_gallery(progress)
+        self.synced_change_id = change_id
 
-        conn.close()
+        # Build the matching gallery once so the capture loop never converts lists per face
+        self.matcher.clear()
+        self.matcher.add_gallery(encodings, labels, identities)
 
-    def start_attendance_capture(self):
-        # Start webcam feed
-        cap = cv2.VideoCapture(0)
-        if not cap.isOpened():
-            print("Error: Unable to access the camera.")
+        # Large galleries get an approximate index, reused from disk while the gallery is unchanged
+        index = make_index(self.index_kind, len(self.matcher))
+        if not index.exhaustive:
+            self.matcher.set_index(index, os.path.join(os.path.dirname(self.db_path), 'face_index.npz'))
+
+    def start_attendance_capture(self, source=0, display=True, drop_frames=True, stats_interval=None,
+                                 reporter=None, on_frame=None, stop_event=None):
+        """
+        Run recognition on one or more sources (camera indexes, video files/stream URLs or image
+        directories) until every source ends, 'q' is pressed or stop_event is set. With
+        display=False no window is opened, so it can run headless. on_frame(camera number, frame)
+        receives every rendered frame, for showing them somewhere other than an OpenCV window.
+        """
+        sources = source if isinstance(source, (list, tuple)) else [source]
+
+        # All cameras share one detection/encoding pool; matching and marking stay in this process
+        executor = make_executor(self.workers, self.use_processes)
+        slots = threading.Semaphore(self.workers)
+        cameras = []
+        for number, camera_source in enumerate(sources):
+            cap = open_source(camera_source)
+            if not cap.isOpened():
+                log.error("Unable to open video source %s", camera_source)
+                continue
+            cameras.append(Camera(f"camera {number}" if len(sources) > 1 else None, camera_source, cap,
+                                  self.make_tracker(), executor, slots, drop_frames, self.metrics, number))
+        if not cameras:
+            executor.shutdown()
             return
 
+        # Attendance marks from every camera go through one writer and one session register
+        self.writer = AttendanceWriter(self.db_path, metrics=self.metrics)
+        self.writer.start()
+        self.sessions.start()
+
+        # Optional periodic metrics logs / file dump / local endpoint
+        if reporter is not None:
+            reporter.start()
+
+        # Students enrolled or deleted while capture runs are added to / dropped from the gallery
+        sync = GallerySync(self.db_path, self.matcher, self.synced_change_id, metrics=self.metrics)
+        sync.start()
+
+        for camera in cameras:
+            camera.pipeline.start()
+
+        active = list(cameras)
+        last_report = time.perf_counter()
+
         try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    print("Error: Failed to capture frame from camera.")
-                    break
+            while active and not (stop_event is not None and stop_event.is_set()):
+                # Match and mark attendance for every newly processed frame
+                for camera in active:
+                    for result in camera.pipeline.poll_results():
+                        self.recognise_faces(result, camera)
+
+                if stats_interval and time.perf_counter() - last_report >= stats_interval:
+                    print(self.report(cameras))
+                    last_report = time.perf_counter()
+
+                quit_requested = False
+                for camera in list(active):
+                    packet = camera.pipeline.wait_for_frame(camera.last_frame_id, timeout=0.1 / len(active))
+                    if packet is None:
+                        if camera.pipeline.finished:
+                            # Pick up results that completed after the last poll
+                            for result in camera.pipeline.poll_results():
+                                self.recognise_faces(result, camera)
+                            if isinstance(camera.source, int):
+                                log.error("Failed to capture frame from camera %s", camera.source)
+                            active.remove(camera)
+                        continue
+                    camera.last_frame_id = packet.frame_id
+
+                    if not display and on_frame is None:
+                        continue
+
+                    # Draw the most recent recognition results over the live frame
+                    with self.metrics.timer("render"):
+                        frame = packet.frame.copy()
+                        camera.tracker.follow(packet.frame)
+                        self.draw_overlays(frame, camera.tracker.overlays())
+                        if self.overlay:
+                            self.draw_metrics(frame)
 
-                # Convert the frame to RGB for face_recognition
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-
-                # Find all face locations and encodings in the current frame
-                face_locations = face_recognition.face_locations(rgb_frame)
-                face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-                # Iterate through each face in the frame
-                for face_encoding, face_location in zip(face_encodings, face_locations):
-                    matches = face_recognition.compare_faces(self.known_face_encodings, face_encoding)
-                    face_distances = face_recognition.face_distance(self.known_face_encodings, face_encoding)
-                    best_match_index = face_distances.argmin() if matches else None
-
-                    # Check if a match is found
-                    if best_match_index is not None and matches[best_match_index]:
-                        name = self.known_face_names[best_match_index]
-                        matric = self.known_face_matrics[best_match_index]
-
-                        # Check if the student has already been marked for attendance
-                        if matric not in self.attendance_marked:
-                            self.mark_attendance(matric, name)
-
-                        # Display the name on the webcam feed
-                        top, right, bottom, left = face_location
-                        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                        cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                    else:
-                        # Display "Unknown" for faces that do not match
-                        top, right, bottom, left = face_location
-                        cv2.rectangle(frame, (left, top), (right, bottom), (0, 0, 255), 2)
-                        cv2.putText(frame, "Unknown", (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 0, 255), 2)
-
-                # Display instruction to press 'q' to quit
-                cv2.putText(frame, "Press 'q' to quit", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-
-                cv2.imshow("Attendance Capture", frame)
-
-                # Press 'q' to exit the capture process
-                if cv2.waitKey(1) & 0xFF == ord('q'):
+                        if on_frame is not None:
+                            on_frame(camera.number, frame)
+                        if display:
+                            # Display instruction to press 'q' to quit
+                            cv2.putText(frame, "Press 'q' to quit", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                                        (255, 255, 255), 2)
+                            cv2.imshow(camera.window_title, frame)
+                    camera.pipeline.display_stats.record(time.perf_counter() - packet.captured_at)
+
+                    # Press 'q' to exit the capture process
+                    if display and cv2.waitKey(1) & 0xFF == ord('q'):
+                        quit_requested = True
+                        break
+
+                if quit_requested:
                     break
 
-        except Exception as e:
-            print(f"Error during attendance capture: {e}")
+        except Exception:
+            log.exception("Error during attendance capture")
 
         finally:
             # Ensure the resources are released properly
-            cap.release()
-            cv2.destroyAllWindows()
+            for camera in cameras:
+                camera.pipeline.stop()
+                camera.capture.release()
+            executor.shutdown(wait=True, cancel_futures=True)
+            if display:
+                cv2.destroyAllWindows()
+            # Deferred marks reach the writer before it flushes and stops
+            self.sessions.stop()
+            self.writer.stop()
+            sync.stop()
+            if reporter is not None:
+                reporter.stop()
+            self.synced_change_id = sync.last_id
+            self.save_unknown_faces()
+            print(self.report(cameras))
+            print(f"Students marked: {self.sessions.marked}")
 
-    def mark_attendance(self, matric, name):
-        # Connect to the database and insert the attendance record
-        try:
-            db_path = self.resource_path('student_attendance.db')
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
+    def make_tracker(self):
+        # Each camera tracks its own faces
+        return FaceTracker(detect_interval=self.detect_interval, detect_scale=self.detect_scale, mode=self.tracking,
+                           max_attempts=self.unknown_attempts)
+
+    def report(self, cameras):
+        return "\n".join(camera.pipeline.report([camera.recognition_stats]) for camera in cameras)
 
-            # Insert the attendance record based on matric and name
-            attendance_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute("INSERT INTO attendance (matric_number, name, timestamp) VALUES (?, ?, ?)",
-                           (matric, name, attendance_time))
-            conn.commit()
+    def recognise_faces(self, result, camera):
+        # Update tracks from a detection result; only faces without an identity were encoded
+        pending = camera.tracker.update(result.locations, result.encodings, result.frame)
+        if pending:
+            # Match every new face in the frame against the gallery in a single batch
+            with self.metrics.timer("match"):
+                matches = self.matcher.match([encoding for _, encoding in pending])
+            timestamp = database.now_timestamp()
+            for (track, encoding), match in zip(pending, matches):
+                if match.is_match:
+                    track.match = match
+                    self.mark_attendance(match.matric, match.name)
+                    continue
 
-            # Add matric number to the marked attendance list
-            self.attendance_marked[matric] = True
+                # Unknown faces join a cluster, so the same person keeps one label across tracks
+                unknown = self.unknown_faces.add(encoding, timestamp, new_sighting=track.attempts == 1,
+                                                 frame=result.frame, location=track.location)
+                track.match = match._replace(name=unknown.label)
 
-        except Exception as e:
-            print(f"Error marking attendance: {e}")
+        # Grab-to-decision latency, the delay before a student in view is marked
+        latency = time.perf_counter() - result.captured_at
+        camera.recognition_stats.record(latency)
+        self.metrics.observe("recognise", latency)
 
+    def save_unknown_faces(self):
+        # Keep the unknown faces seen this session for python -m unknown_faces
+        conn = database.connect(self.db_path)
+        try:
+            with conn:
+                saved = self.unknown_faces.save(conn)
+            if saved:
+                print(f"Unknown faces saved: {saved} (python -m unknown_faces list)")
+        except Exception:
+            log.exception("Error saving unknown faces")
         finally:
             conn.close()
+
+    def draw_metrics(self, frame):
+        # Live stage timings and gauges in the bottom-left corner of the preview
+        # Percentiles are recomputed at most twice a second, not on every frame
+        now = time.perf_counter()
+        if now - self._overlay_at >= 0.5:
+            self._overlay_lines = overlay_lines(self.metrics.snapshot())
+            self._overlay_at = now
+        lines = self._overlay_lines
+        y = frame.shape[0] - 10 - 18 * max(0, len(lines) - 1)
+        for line in lines:
+            cv2.putText(frame, line, (10, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (255, 255, 0), 1)
+            y += 18
+
+    def draw_overlays(self, frame, overlays):
+        for (top, right, bottom, left), name, is_match in overlays:
+            # Green box with the name for students, red "Unknown" for faces that do not match
+            colour = (0, 255, 0) if is_match else (0, 0, 255)
+            cv2.rectangle(frame, (left, top), (right, bottom), colour, 2)
+            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, colour, 2)
+
+    def mark_attendance(self, matric, name):
+        # Check if the student has already been marked in the current session; a mark that needs
+        # the database first (a new session, a student enrolled mid-session) arrives via record_mark
+        timestamp = database.now_timestamp()
+        session_id = self.sessions.mark(matric, name, timestamp)
+        if session_id is not None:
+            self.record_mark(matric, name, timestamp, session_id)
+
+    def record_mark(self, matric, name, timestamp, session_id):
+        # Queue the attendance record; the background writer commits marks in batches
+        self.writer.mark(matric, name, timestamp, session_id)
+        if self.on_mark is not None:
+            self.on_mark(matric, name, session_id)
+
+
+def main():
+    # Headless entry point: python -m attendance_capture --source lecture.mp4 --no-display
+    # Several cameras: python -m attendance_capture --source 0 --source 1 --source rtsp://door-2/stream
+    parser = argparse.ArgumentParser(description="Run face recognition attendance capture without the GUI.")
+    parser.add_argument("--source", action="append", default=None,
+                        help="Camera index, video file, stream URL or directory of images (default: camera 0); "
+                             "repeat for several cameras")
+    parser.add_argument("--no-display", action="store_true", help="Do not open a preview window")
+    parser.add_argument("--db", default=None, help="Path to student_attendance.db")
+    parser.add_argument("--workers", type=int, default=2, help="Detection/encoding workers")
+    parser.add_argument("--processes", action="store_true", help="Use worker processes instead of threads")
+    parser.add_argument("--index", default="auto", choices=["auto", "exact", "ivf", "ivfpq"], help="Gallery index")
+    parser.add_argument("--gallery", default="full", choices=GALLERY_MODES,
+                        help="Keep every encoding, one centroid, or up to --prototypes medoids per student")
+    parser.add_argument("--prototypes", type=int, default=3, help="Medoids kept per student with --gallery medoids")
+    parser.add_argument("--detect-interval", type=int, default=None,
+                        help="Detect every Nth frame (default 5 for video, 1 for image directories)")
+    parser.add_argument("--detect-scale", type=float, default=0.5, help="Downscale factor used for detection")
+    parser.add_argument("--tracking", default="iou", choices=["iou", "opencv"], help="Tracking between detections")
+    parser.add_argument("--every-frame", action="store_true",
+                        help="Process every frame instead of dropping stale ones (for replaying recordings)")
+    parser.add_argument("--course", default=DEFAULT_COURSE, help="Course code attendance is recorded for")
+    parser.add_argument("--session-minutes", type=int, default=DEFAULT_SESSION_LENGTH // 60,
+                        help="Length of a session when none is scheduled for the course")
+    parser.add_argument("--stats-interval", type=float, default=5.0, help="Seconds between throughput reports")
+    parser.add_argument("--metrics", action="store_true", help="Log stage timings, rates and gauges as JSON lines")
+    parser.add_argument("--metrics-file", default=None, help="Also keep the latest metrics snapshot in this JSON file")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="Also serve the latest snapshot on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--overlay", action="store_true", help="Draw live metrics on the preview window")
+    parser.add_argument("--tolerance", type=float, default=None,
+                        help="Match tolerance (default: the one saved by python -m calibration, else 0.6)")
+    parser.add_argument("--unknown-attempts", type=int, default=3,
+                        help="Times a face that matches nobody is encoded while it stays in view")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+    collect_metrics = args.metrics or args.metrics_file or args.metrics_port is not None
+
+    sources = [int(source) if source.isdigit() else source for source in args.source or ["0"]]
+    detect_interval = args.detect_interval
+    if detect_interval is None:
+        detect_interval = 1 if all(os.path.isdir(str(source)) for source in sources) else 5
+
+    attendance = AttendanceCapture(index_kind=args.index, workers=args.workers, use_processes=args.processes,
+                                   detect_interval=detect_interval, detect_scale=args.detect_scale,
+                                   tracking=args.tracking, db_path=args.db,
+                                   course=args.course, session_length=args.session_minutes * 60,
+                                   gallery_mode=args.gallery, prototypes=args.prototypes,
+                                   metrics=collect_metrics, overlay=args.overlay, tolerance=args.tolerance,
+                                   unknown_attempts=args.unknown_attempts)
+    print(f"Loaded {len(attendance.matcher)} encodings for {len(attendance.matcher.identities)} students, "
+          f"matching within {attendance.matcher.tolerance:.3f}")
+
+    try:
+        reporter = None
+        if collect_metrics:
+            reporter = MetricsReporter(attendance.metrics, args.stats_interval, log_records=args.metrics,
+                                       path=args.metrics_file, port=args.metrics_port)
+        attendance.start_attendance_capture(sources, display=not args.no_display, drop_frames=not args.every_frame,
+                                            stats_interval=args.stats_interval, reporter=reporter)
+    except KeyboardInterrupt:
+        print("Capture stopped.")
+
+
+if __name__ == "__main__":
+    main()
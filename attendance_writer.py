@@ -0,0 +1,177 @@
+# attendance_writer.py
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import database
+from metrics import NULL_METRICS
+
+log = logging.getLogger(__name__)
+
+# Sentinel telling the writer thread to flush and exit
+_STOP = object()
+
+
+class AttendanceWriter(threading.Thread):
+    """
+    Background writer for attendance marks.
+
+    Marks are appended to a journal file and queued; the writer thread fsyncs the journal once
+    for every group of marks it receives, keeps one WAL-mode connection open and inserts them in
+    batched transactions once batch_size marks are waiting or flush_interval seconds have passed.
+    The journal is replayed on start-up, so marks that were queued but not committed when the
+    process died, or the machine lost power, are not lost.
+    """
+
+    def __init__(self, db_path, journal_path=None, batch_size=50, flush_interval=1.0, metrics=NULL_METRICS):
+        super().__init__(name="AttendanceWriter", daemon=True)
+        self.db_path = db_path
+        self.journal_path = journal_path or db_path + ".marks"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.metrics = metrics
+        metrics.gauge("writer_queue", self._queue_size)
+
+        self._queue = queue.Queue()
+        self._journal_lock = threading.Lock()
+        self._journal = None
+        self._journaled = 0
+        self._committed = 0
+
+    def mark(self, matric, name, timestamp=None, session_id=None):
+        # Called from the capture thread: journal the mark and hand it to the writer, never blocking on SQLite
+        if timestamp is None:
+            timestamp = database.now_timestamp()
+        record = (matric, name, timestamp, session_id)
+
+        with self._journal_lock:
+            if self._journal is None:
+                self._journal = open(self.journal_path, "a", encoding="utf-8")
+            self._journal.write(json.dumps(record) + "\n")
+            self._journal.flush()
+            self._journaled += 1
+        self._queue.put(record)
+
+    def _queue_size(self):
+        return self._queue.qsize()
+
+    def stop(self):
+        # Flush everything still queued and wait for the writer to finish
+        self._queue.put(_STOP)
+        self.join()
+
+    def _connect(self):
+        conn = database.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # A batch must be on disk before its journal is deleted, so this connection syncs every commit
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _sync_journal(self):
+        # Only this thread closes the journal, so it can be synced without holding up mark()
+        journal = self._journal
+        if journal is not None:
+            os.fsync(journal.fileno())
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        records = []
+        with open(self.journal_path, encoding="utf-8") as journal:
+            for line in journal:
+                try:
+                    records.append(tuple(json.loads(line)))
+                except ValueError:
+                    # A torn last line from a crash mid-write
+                    continue
+        return records
+
+    def _recover(self, conn):
+        # Replay marks journaled by a previous run that never reached the database
+        with self._journal_lock:
+            leftover = self._read_journal()
+            if not leftover:
+                return
+            self._write(conn, leftover)
+
+            # Keep the file if marks from this run were already appended to it
+            if self._journal is None:
+                os.remove(self.journal_path)
+
+    def _write(self, conn, records):
+        # One transaction per batch; the unique constraints make replays and marks from other
+        # capture processes idempotent. The name is stored with each mark so the record still
+        # reads correctly after the student is deleted or renamed.
+        # Journals written before sessions existed hold (matric, name, timestamp) records.
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO attendance (matric_number, name, timestamp, ts, session_id) "
+                             "VALUES (?, ?, ?, ?, ?)",
+                             [(matric, name, timestamp, database.to_epoch(timestamp), session[0] if session else None)
+                              for matric, name, timestamp, *session in records])
+
+    def _commit(self, conn, batch):
+        try:
+            with self.metrics.timer("db_write"):
+                self._write(conn, batch)
+            self.metrics.increment("marks_written", len(batch))
+        except Exception:
+            # The marks stay journaled and are retried on the next flush (or replayed on restart)
+            log.exception("Error writing %d attendance marks", len(batch))
+            self.metrics.increment("write_errors")
+            return False
+
+        with self._journal_lock:
+            self._committed += len(batch)
+
+            # Everything journaled is now in the database, start a fresh journal
+            if self._committed == self._journaled:
+                if self._journal is not None:
+                    self._journal.close()
+                    self._journal = None
+                if os.path.exists(self.journal_path):
+                    os.remove(self.journal_path)
+                self._journaled = self._committed = 0
+        return True
+
+    def run(self):
+        conn = self._connect()
+        try:
+            # Replay marks left over from a previous run before accepting new ones
+            self._recover(conn)
+
+            batch = []
+            deadline = None
+            stopping = False
+            while not stopping:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    record = self._queue.get(timeout=timeout)
+                    received = 0
+                    # Take every mark already waiting, so one fsync covers the whole group
+                    while True:
+                        if record is _STOP:
+                            stopping = True
+                        else:
+                            batch.append(record)
+                            received += 1
+                        try:
+                            record = self._queue.get_nowait()
+                        except queue.Empty:
+                            break
+                    if received:
+                        self._sync_journal()
+                        if deadline is None:
+                            deadline = time.monotonic() + self.flush_interval
+                except queue.Empty:
+                    pass
+
+                if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                    if self._commit(conn, batch):
+                        batch = []
+                        deadline = None
+                    else:
+                        deadline = time.monotonic() + self.flush_interval
+        finally:
+            conn.close()
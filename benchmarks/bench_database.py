@@ -0,0 +1,115 @@
+# benchmarks/bench_database.py
+"""
+Attendance query benchmark for the indexed schema.
+
+Builds a synthetic attendance table in the original layout (text timestamps, no indexes),
+times the history view's date filter, a paged scroll and a range delete, then runs the
+migrations on the same file and times them again. Run from the project root:
+
+    python -m benchmarks.bench_database --rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+import database
+
+START = database.to_epoch("2024-01-01 08:00:00")
+DAY = 24 * 60 * 60
+
+
+def build_legacy(db_path, rows, students):
+    conn = sqlite3.connect(db_path)
+    database.MIGRATIONS[0](conn)
+    conn.execute("PRAGMA user_version = 1")
+    matrics = [f"19/52HA{i:04d}" for i in range(students)]
+    conn.executemany("INSERT INTO students (matric_number, name) VALUES (?, ?)",
+                     [(matric, f"Student {i}") for i, matric in enumerate(matrics)])
+
+    rng = random.Random(0)
+    batch = []
+    for i in range(rows):
+        ts = START + rng.randrange(365 * DAY)
+        batch.append((rng.choice(matrics), None, database.from_epoch(ts)))
+        if len(batch) == 50000:
+            conn.executemany("INSERT OR IGNORE INTO attendance (matric_number, name, timestamp) VALUES (?, ?, ?)", batch)
+            batch = []
+    conn.executemany("INSERT OR IGNORE INTO attendance (matric_number, name, timestamp) VALUES (?, ?, ?)", batch)
+    conn.commit()
+    conn.close()
+
+
+def timed(conn, sql, params, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run_queries(conn, migrated, repeats):
+    week_start = database.from_epoch(START + 200 * DAY)
+    week_end = database.from_epoch(START + 207 * DAY)
+    if migrated:
+        column, low, high = "a.ts", database.to_epoch(week_start), database.to_epoch(week_end)
+        order = "a.ts DESC, a.id DESC"
+    else:
+        column, low, high = "a.timestamp", week_start, week_end
+        order = "a.timestamp DESC, a.id DESC"
+
+    select = ("SELECT a.matric_number, COALESCE(a.name, s.name), a.timestamp, a.id FROM attendance a "
+              "LEFT JOIN students s ON s.matric_number = a.matric_number")
+    results = {
+        "week filter": timed(conn, f"{select} WHERE {column} BETWEEN ? AND ? ORDER BY {order}",
+                             (low, high), repeats),
+        "first page": timed(conn, f"{select} ORDER BY {order} LIMIT 200", (), repeats),
+        "student history": timed(conn, f"{select} WHERE a.matric_number = ? ORDER BY {order}",
+                                 ("19/52HA0042",), repeats),
+    }
+
+    # Delete the last week inside a transaction that is rolled back, so every run sees the same data
+    last_week = database.from_epoch(START + 358 * DAY)
+    start = time.perf_counter()
+    conn.execute(f"DELETE FROM attendance WHERE {column.split('.')[1]} >= ?",
+                 (database.to_epoch(last_week) if migrated else last_week,))
+    results["range delete"] = time.perf_counter() - start
+    conn.rollback()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs migrated attendance schema benchmark")
+    parser.add_argument("--rows", type=int, default=1000000, help="Attendance rows to generate")
+    parser.add_argument("--students", type=int, default=5000, help="Distinct students")
+    parser.add_argument("--repeats", type=int, default=3, help="Runs per query (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        build_legacy(db_path, args.rows, args.students)
+
+        conn = sqlite3.connect(db_path)
+        legacy = run_queries(conn, False, args.repeats)
+        conn.close()
+
+        start = time.perf_counter()
+        version = database.migrate(db_path)
+        migration = time.perf_counter() - start
+
+        conn = database.connect(db_path)
+        migrated = run_queries(conn, True, args.repeats)
+        conn.close()
+
+    print(f"{args.rows} attendance rows, schema migrated to version {version} in {migration:.1f} s")
+    print(f"{'query':<18}{'legacy ms':>12}{'indexed ms':>12}{'speed-up':>10}")
+    for name in legacy:
+        speedup = legacy[name] / migrated[name] if migrated[name] > 0 else float("inf")
+        print(f"{name:<18}{legacy[name] * 1000:>12.1f}{migrated[name] * 1000:>12.1f}{speedup:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
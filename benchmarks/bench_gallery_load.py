@@ -0,0 +1,49 @@
+# benchmarks/bench_gallery_load.py
+"""
+Startup benchmark for AttendanceCapture.load_known_faces.
+
+Compares a cold load (every image run through face_recognition) against a warm load
+(encodings read back from the face_encodings table). Run from the project root:
+
+    python -m benchmarks.bench_gallery_load --db student_attendance.db
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from face_store import EncodingStore
+
+
+def time_load(store):
+    start = time.perf_counter()
+    encodings, labels, identities = store.load_gallery()
+    return time.perf_counter() - start, len(encodings), len(identities)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold vs warm gallery load benchmark")
+    parser.add_argument("--db", default="student_attendance.db", help="Database to benchmark (copied, never modified)")
+    parser.add_argument("--warm-runs", type=int, default=5, help="Number of warm loads to average")
+    args = parser.parse_args()
+
+    # Work on a copy so the real encoding cache is left untouched
+    with tempfile.TemporaryDirectory() as tmp:
+        db_copy = os.path.join(tmp, "bench.db")
+        shutil.copy(args.db, db_copy)
+        store = EncodingStore(db_copy)
+        store.clear()
+
+        cold, rows, students = time_load(store)
+        warm = [time_load(store)[0] for _ in range(args.warm_runs)]
+
+    warm_avg = sum(warm) / len(warm)
+    print(f"Gallery: {rows} encodings for {students} students")
+    print(f"Cold load (full encode): {cold * 1000:.1f} ms")
+    print(f"Warm load (cached):      {warm_avg * 1000:.1f} ms (best {min(warm) * 1000:.1f} ms)")
+    if warm_avg > 0:
+        print(f"Speed-up: {cold / warm_avg:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
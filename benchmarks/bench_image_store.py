@@ -0,0 +1,135 @@
+# benchmarks/bench_image_store.py
+"""
+Disk footprint and load time of the enrolment image layouts on a synthetic roster.
+
+Builds the same roster three ways: whole grayscale webcam frames per capture (the original
+layout), loose aligned crops from image_store, and crops packed into one file per student.
+For each it reports files, bytes and allocated disk space, the warm gallery load (encodings
+cached) and the time to read and decode a sample of images, which is what a cold load pays
+before face_recognition runs:
+
+    python -m benchmarks.bench_image_store --students 1000 --images 10
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import cv2
+import numpy as np
+import database
+import image_store
+from face_store import ENCODING_SIZE, EncodingStore
+from image_store import ImageStore
+
+FRAME_SIZE = (1280, 720)
+
+
+def synthetic_frame(rng):
+    # Smooth shapes plus sensor noise, so JPEG sizes resemble a real frame rather than pure noise
+    low = rng.integers(0, 256, (FRAME_SIZE[1] // 40, FRAME_SIZE[0] // 40), dtype=np.uint8)
+    frame = cv2.resize(low, FRAME_SIZE, interpolation=cv2.INTER_CUBIC)
+    noise = rng.normal(0, 4, frame.shape)
+    return np.clip(frame + noise, 0, 255).astype(np.uint8)
+
+
+def face_location(rng):
+    side = int(rng.integers(160, 260))
+    top = int(rng.integers(100, FRAME_SIZE[1] - side - 100))
+    left = int(rng.integers(300, FRAME_SIZE[0] - side - 300))
+    return top, left + side, top + side, left
+
+
+def build(root, db_path, layout, students, images, seed):
+    """ Enrol the synthetic roster in the given layout, with every encoding already cached. """
+    rng = np.random.default_rng(seed)
+    database.migrate(db_path)
+    conn = database.connect(db_path)
+    store = ImageStore(root)
+    encodings = []
+    with conn:
+        for student in range(students):
+            matric = f"19/52HA{student:04d}"
+            folder = store.folder(matric)
+            os.makedirs(folder, exist_ok=True)
+            conn.execute("INSERT INTO students (matric_number, name, image_path) VALUES (?, ?, ?)",
+                         (matric, f"Student {student}", folder))
+            for image in range(images):
+                frame = synthetic_frame(rng)
+                encoding = rng.standard_normal(ENCODING_SIZE).astype(np.float32).tobytes()
+                if layout == "frames":
+                    path = os.path.join(folder, f"{os.path.basename(folder)}_{image}.jpg")
+                    cv2.imwrite(path, frame)
+                    conn.execute("INSERT INTO student_images (matric_number, image_path) VALUES (?, ?)",
+                                 (matric, path))
+                    stat = os.stat(path)
+                    encodings.append((path, matric, stat.st_mtime_ns, stat.st_size, encoding))
+                else:
+                    # Synthetic frames have no landmarks, so the crop is taken unrotated
+                    path, _ = store.add(conn, matric, frame, face_location(rng), angle=0.0)
+                    encodings.append((path, matric, 0, 0, encoding))
+        EncodingStore(db_path).write_encodings(conn, encodings)
+    if layout == "packed":
+        store.pack_all(conn)
+    conn.close()
+
+
+def disk_usage(root):
+    files, size = image_store.folder_usage(root)
+    allocated = 0
+    for folder, _, names in os.walk(root):
+        for name in names:
+            # st_blocks is not available on Windows; fall back to the file size there
+            stat = os.stat(os.path.join(folder, name))
+            allocated += getattr(stat, "st_blocks", 0) * 512 or stat.st_size
+    return files, size, allocated
+
+
+def time_warm_load(db_path, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encodings, _, _ = EncodingStore(db_path).load_gallery()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)), len(encodings)
+
+
+def time_decode(db_path, sample):
+    conn = database.connect(db_path)
+    paths = [path for (path,) in conn.execute("SELECT image_path FROM student_images")]
+    conn.close()
+    paths = random.Random(0).sample(paths, min(sample, len(paths)))
+    start = time.perf_counter()
+    for path in paths:
+        data = np.frombuffer(image_store.read_bytes(path), dtype=np.uint8)
+        cv2.imdecode(data, cv2.IMREAD_COLOR)
+    return (time.perf_counter() - start) / len(paths)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Image store footprint and load time benchmark")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--images", type=int, default=10, help="Images per student")
+    parser.add_argument("--repeats", type=int, default=3, help="Warm loads per layout")
+    parser.add_argument("--sample", type=int, default=300, help="Images decoded per layout")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{args.students} students x {args.images} images")
+    print(f"{'layout':<8}{'files':>8}{'MB':>9}{'disk MB':>9}{'warm load ms':>14}{'decode ms/img':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for layout in ("frames", "crops", "packed"):
+            root = os.path.join(tmp, layout, "student_images")
+            db_path = os.path.join(tmp, layout, "bench.db")
+            os.makedirs(root)
+            build(root, db_path, layout, args.students, args.images, args.seed)
+
+            files, size, allocated = disk_usage(root)
+            warm, rows = time_warm_load(db_path, args.repeats)
+            decode = time_decode(db_path, args.sample)
+            print(f"{layout:<8}{files:>8}{size / 2 ** 20:>9.1f}{allocated / 2 ** 20:>9.1f}"
+                  f"{warm * 1000:>14.1f}{decode * 1000:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
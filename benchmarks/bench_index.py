@@ -0,0 +1,58 @@
+# benchmarks/bench_index.py
+"""
+Recall@1 and latency of the face index implementations on synthetic galleries.
+
+Recall@1 is the fraction of queries whose best identity matches the exact brute-force answer.
+
+    python -m benchmarks.bench_index --sizes 10000 100000 1000000 --kinds exact ivf ivfpq
+"""
+import argparse
+import time
+import numpy as np
+from face_index import make_index, IVFIndex
+from face_matcher import FaceMatcher
+from face_store import ENCODING_SIZE
+from benchmarks.bench_matcher import synthetic_gallery
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face index recall/latency benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--kinds", nargs="+", default=["exact", "ivf", "ivfpq"])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--noise", type=float, default=0.03, help="Std-dev of noise added to each query")
+    parser.add_argument("--nprobe", type=int, default=None, help="Override the number of probed lists")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'index':>6} {'build s':>8} {'recall@1':>9} {'ms/face':>8}")
+
+    for size in args.sizes:
+        gallery = synthetic_gallery(size, rng)
+        picks = rng.integers(0, size, args.queries)
+        queries = gallery[picks] + args.noise * rng.standard_normal((args.queries, ENCODING_SIZE)).astype(np.float32)
+
+        matcher = FaceMatcher(capacity=size)
+        matcher.add_many(gallery, [str(i) for i in range(size)], [str(i) for i in range(size)])
+        truth = np.array([result.identity for result in matcher.match(queries)])
+
+        for kind in args.kinds:
+            index = make_index(kind)
+            if args.nprobe and isinstance(index, IVFIndex):
+                index.nprobe = args.nprobe
+
+            start = time.perf_counter()
+            matcher.set_index(index)
+            build = time.perf_counter() - start
+
+            # Match one face at a time, as a camera frame with a single student would
+            start = time.perf_counter()
+            found = np.array([matcher.match(query[None, :])[0].identity for query in queries])
+            per_face = (time.perf_counter() - start) / args.queries
+
+            recall = float(np.mean(found == truth))
+            print(f"{size:>10} {kind:>6} {build:>8.2f} {recall:>9.3f} {per_face * 1000:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# benchmarks/bench_matcher.py
+"""
+Micro-benchmark of FaceMatcher.match against the old per-face compare_faces/face_distance path.
+
+Uses synthetic 128-d encodings so it runs without a camera or enrolled students:
+
+    python -m benchmarks.bench_matcher --sizes 1000 10000 50000 100000 --faces 5
+"""
+import argparse
+import time
+import numpy as np
+from face_matcher import FaceMatcher
+from face_store import ENCODING_SIZE
+
+
+def synthetic_gallery(size, rng):
+    # Unit-ish vectors scaled like dlib embeddings (norm around 1)
+    encodings = rng.standard_normal((size, ENCODING_SIZE)).astype(np.float32)
+    encodings /= np.linalg.norm(encodings, axis=1, keepdims=True)
+    return encodings
+
+
+def legacy_match(known_face_encodings, face_encodings, tolerance=0.6):
+    # Equivalent of the previous loop: list -> array conversion and two distance passes per face
+    results = []
+    for face_encoding in face_encodings:
+        matches = list(np.linalg.norm(np.array(known_face_encodings) - face_encoding, axis=1) <= tolerance)
+        face_distances = np.linalg.norm(np.array(known_face_encodings) - face_encoding, axis=1)
+        best_match_index = face_distances.argmin() if matches else None
+        results.append(best_match_index)
+    return results
+
+
+def time_call(func, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FaceMatcher micro-benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--faces", type=int, default=5, help="Faces matched per frame")
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the batched matcher")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'gallery':>10} {'batched ms/frame':>18} {'legacy ms/frame':>16} {'speed-up':>9}")
+
+    for size in args.sizes:
+        gallery = synthetic_gallery(size, rng)
+        matcher = FaceMatcher()
+        matcher.add_many(gallery, [str(i // 10) for i in range(size)], [f"Student {i // 10}" for i in range(size)])
+
+        # Queries are noisy copies of enrolled encodings
+        picks = rng.integers(0, size, args.faces)
+        queries = gallery[picks] + 0.02 * rng.standard_normal((args.faces, ENCODING_SIZE)).astype(np.float32)
+
+        batched = time_call(lambda: matcher.match(queries), args.repeats)
+        if args.skip_legacy:
+            print(f"{size:>10} {batched * 1000:>18.3f} {'-':>16} {'-':>9}")
+            continue
+
+        known_face_encodings = list(gallery.astype(np.float64))
+        legacy = time_call(lambda: legacy_match(known_face_encodings, queries), max(1, args.repeats // 4))
+        print(f"{size:>10} {batched * 1000:>18.3f} {legacy * 1000:>16.3f} {legacy / batched:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
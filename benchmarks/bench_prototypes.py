@@ -0,0 +1,131 @@
+# benchmarks/bench_prototypes.py
+"""
+Accuracy vs gallery size/latency for the compact gallery modes.
+
+Each student's encodings are split into enrolment and held-out samples. The gallery is built
+from the enrolment samples in full, centroid and medoids modes, and every held-out sample is
+matched against it; a set of students who are never enrolled measures false accepts. Uses
+synthetic encodings with several looks per student, or the real encodings in a database:
+
+    python -m benchmarks.bench_prototypes --students 2000 --images 30
+    python -m benchmarks.bench_prototypes --db student_attendance.db
+"""
+import argparse
+import sqlite3
+import time
+import numpy as np
+from face_matcher import FaceMatcher
+from face_prototypes import make_compaction
+from face_store import ENCODING_SIZE
+
+
+def synthetic_encodings(students, images, looks, rng):
+    # Student centres about 1.0 apart, looks ~0.3 from the centre, samples ~0.25 from their look
+    centres = rng.standard_normal((students, ENCODING_SIZE)) * (0.7 / np.sqrt(ENCODING_SIZE))
+    offsets = rng.standard_normal((students, looks, ENCODING_SIZE)) * (0.3 / np.sqrt(ENCODING_SIZE))
+    labels = np.repeat(np.arange(students), images)
+    look = rng.integers(0, looks, size=len(labels))
+    noise = rng.standard_normal((len(labels), ENCODING_SIZE)) * (0.25 / np.sqrt(ENCODING_SIZE))
+    encodings = centres[labels] + offsets[labels, look] + noise
+    return encodings.astype(np.float32), labels.astype(np.int32)
+
+
+def database_encodings(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT matric_number, encoding FROM face_encodings "
+                            "WHERE encoding IS NOT NULL ORDER BY matric_number, image_path").fetchall()
+    finally:
+        conn.close()
+    ids = {}
+    labels = np.array([ids.setdefault(matric, len(ids)) for matric, _ in rows], dtype=np.int32)
+    encodings = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    return encodings, labels
+
+
+def split(encodings, labels, holdout, unknown_fraction, rng):
+    # Hold out samples per student, and keep some students out of the gallery entirely
+    students = np.unique(labels)
+    unknown = set(rng.choice(students, size=int(len(students) * unknown_fraction), replace=False).tolist())
+
+    enrol, test = [], []
+    for student in students:
+        rows = rng.permutation(np.flatnonzero(labels == student))
+        if student in unknown:
+            test.extend(rows[:holdout])
+        elif len(rows) > holdout:
+            test.extend(rows[:holdout])
+            enrol.extend(rows[holdout:])
+    return np.array(enrol), np.array(test), unknown
+
+
+def evaluate(mode, k, encodings, labels, enrol, test, unknown, tolerance, batch):
+    matcher = FaceMatcher(tolerance=tolerance, compaction=make_compaction(mode, k))
+    identities = [(str(label), str(label)) for label in range(labels.max() + 1)]
+    start = time.perf_counter()
+    matcher.add_gallery(encodings[enrol], labels[enrol], identities)
+    build = time.perf_counter() - start
+
+    queries = encodings[test]
+    results = []
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch):
+        results.extend(matcher.match(queries[offset:offset + batch]))
+    per_face = (time.perf_counter() - start) / max(1, len(queries))
+
+    known_total = correct = false_rejects = unknown_total = false_accepts = 0
+    for label, result in zip(labels[test].tolist(), results):
+        if label in unknown:
+            unknown_total += 1
+            false_accepts += result.is_match
+        else:
+            known_total += 1
+            if result.is_match and result.matric == str(label):
+                correct += 1
+            elif not result.is_match:
+                false_rejects += 1
+
+    return {
+        "rows": len(matcher),
+        "memory_mb": len(matcher) * ENCODING_SIZE * 4 / 1e6,
+        "build_ms": build * 1000,
+        "match_us": per_face * 1e6,
+        "accuracy": correct / known_total if known_total else 0.0,
+        "false_reject": false_rejects / known_total if known_total else 0.0,
+        "false_accept": false_accepts / unknown_total if unknown_total else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full vs centroid vs medoids gallery benchmark")
+    parser.add_argument("--db", default=None, help="Use the encodings stored in this database instead of synthetic ones")
+    parser.add_argument("--students", type=int, default=2000, help="Synthetic students")
+    parser.add_argument("--images", type=int, default=30, help="Synthetic images per student")
+    parser.add_argument("--looks", type=int, default=3, help="Distinct looks per synthetic student")
+    parser.add_argument("--holdout", type=int, default=2, help="Held-out samples per student")
+    parser.add_argument("--unknown", type=float, default=0.1, help="Fraction of students never enrolled")
+    parser.add_argument("--prototypes", type=int, nargs="+", default=[1, 3, 5], help="Medoid counts to try")
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--batch", type=int, default=5, help="Faces matched per call, like one frame")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.db:
+        encodings, labels = database_encodings(args.db)
+    else:
+        encodings, labels = synthetic_encodings(args.students, args.images, args.looks, rng)
+    enrol, test, unknown = split(encodings, labels, args.holdout, args.unknown, rng)
+    print(f"{len(np.unique(labels))} students, {len(enrol)} enrolment and {len(test)} held-out encodings")
+
+    configs = [("full", 0), ("centroid", 1)] + [("medoids", k) for k in args.prototypes]
+    print(f"{'mode':<12}{'rows':>9}{'MB':>8}{'build ms':>10}{'us/face':>9}{'accuracy':>10}{'FRR':>8}{'FAR':>8}")
+    for mode, k in configs:
+        stats = evaluate(mode, k, encodings, labels, enrol, test, unknown, args.tolerance, args.batch)
+        name = f"medoids-{k}" if mode == "medoids" else mode
+        print(f"{name:<12}{stats['rows']:>9}{stats['memory_mb']:>8.1f}{stats['build_ms']:>10.1f}"
+              f"{stats['match_us']:>9.1f}{stats['accuracy']:>10.3f}{stats['false_reject']:>8.3f}"
+              f"{stats['false_accept']:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/bench_shared_gallery.py
+"""
+Memory per recognition worker process with and without the shared-memory gallery.
+
+Starts a process pool whose workers either receive their own copy of the gallery (the
+baseline) or attach to one published with shared_gallery, has every worker match a batch of
+faces, and reports each worker's resident memory split into private and shared pages (Linux
+/proc; elsewhere only the peak RSS is available). Also times publishing a new gallery version
+and how long running workers take to start matching against it:
+
+    python -m benchmarks.bench_shared_gallery --size 200000 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import shared_gallery
+from benchmarks.bench_matcher import synthetic_gallery
+from face_matcher import FaceMatcher
+from face_store import ENCODING_SIZE
+
+# Gallery of a worker started with copy_worker
+_worker_matcher = None
+
+
+def copy_worker(encodings, labels, identities):
+    # Baseline initializer: every worker builds a private matcher from its own pickled copy
+    global _worker_matcher
+    _worker_matcher = FaceMatcher(capacity=len(encodings))
+    _worker_matcher.add_gallery(encodings, labels, identities)
+
+
+def memory_usage():
+    # (rss, private, shared) in MB for this process
+    try:
+        with open("/proc/self/status") as status:
+            fields = dict(line.split(":", 1) for line in status)
+        kb = {key: int(fields[key].split()[0]) for key in ("VmRSS", "RssAnon", "RssShmem")}
+        return kb["VmRSS"] / 1024, kb["RssAnon"] / 1024, kb["RssShmem"] / 1024
+    except (OSError, KeyError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return peak, None, None
+
+
+def worker_task(queries, shared, hold):
+    matcher = shared_gallery._worker_gallery.matcher() if shared else _worker_matcher
+    matches = matcher.match(queries)
+    # Keep this worker busy so the other tasks land on the other workers
+    time.sleep(hold)
+    return os.getpid(), sum(match.is_match for match in matches), memory_usage()
+
+
+def version_task(expected, hold):
+    # Time for this worker to move to version expected, which is already published
+    start = time.perf_counter()
+    gallery = shared_gallery._worker_gallery
+    while gallery.matcher() is None or gallery.version < expected:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    time.sleep(hold)
+    return os.getpid(), elapsed
+
+
+def run(mode, encodings, labels, identities, queries, workers):
+    publisher = None
+    if mode == "shared":
+        publisher = shared_gallery.GalleryPublisher()
+        publisher.publish(encodings, labels, identities)
+        initializer, initargs = shared_gallery.attach_worker, (publisher.name,)
+    else:
+        initializer, initargs = copy_worker, (encodings, labels, identities)
+
+    try:
+        start = time.perf_counter()
+        # Spawned workers, as on Windows, so pages inherited from this process don't blur the numbers
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=initializer, initargs=initargs) as executor:
+            # Workers start one by one, so repeat until every one of them has reported
+            per_worker = {}
+            for _ in range(5):
+                for pid, matched, memory in executor.map(worker_task, [queries] * workers,
+                                                         [mode == "shared"] * workers, [0.5] * workers):
+                    per_worker[pid] = (matched, memory)
+                if len(per_worker) == workers:
+                    break
+            ready = time.perf_counter() - start
+
+            swap = None
+            if publisher is not None:
+                # Publish a second version and wait until the workers have moved to it
+                swap_start = time.perf_counter()
+                version = publisher.publish(encodings, labels, identities)
+                published = time.perf_counter() - swap_start
+                seen = list(executor.map(version_task, [version] * workers, [0.5] * workers))
+                swap = (published, max(seconds for _, seconds in seen))
+    finally:
+        if publisher is not None:
+            publisher.close()
+    return per_worker, ready, swap
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-worker memory with and without a shared gallery")
+    parser.add_argument("--size", type=int, default=200000, help="Gallery rows")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--faces", type=int, default=5, help="Faces matched per worker")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    encodings = synthetic_gallery(args.size, rng)
+    labels = np.arange(args.size, dtype=np.int32) // 10
+    identities = [(f"19/52HA{i:05d}", f"Student {i}") for i in range(labels[-1] + 1)]
+    picks = rng.integers(0, args.size, args.faces)
+    queries = encodings[picks] + 0.02 * rng.standard_normal((args.faces, ENCODING_SIZE)).astype(np.float32)
+
+    print(f"Gallery: {args.size} rows, {encodings.nbytes / 2 ** 20:.1f} MB of encodings, {args.workers} workers")
+    for mode in ("copy", "shared"):
+        per_worker, ready, swap = run(mode, encodings, labels, identities, queries, args.workers)
+        print(f"\n{mode}: every worker started and matched within {ready:.2f} s")
+        print(f"{'pid':>8}{'matched':>9}{'rss MB':>9}{'private MB':>12}{'shared MB':>11}")
+        for pid, (matched, (rss, private, shared)) in sorted(per_worker.items()):
+            private = "-" if private is None else f"{private:.1f}"
+            shared = "-" if shared is None else f"{shared:.1f}"
+            print(f"{pid:>8}{matched:>9}{rss:>9.1f}{private:>12}{shared:>11}")
+        if swap is not None:
+            print(f"New version published in {swap[0] * 1000:.1f} ms, picked up by every worker within "
+                  f"{swap[1] * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
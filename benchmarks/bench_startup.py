@@ -0,0 +1,60 @@
+# benchmarks/bench_startup.py
+"""
+Time from launching the app to its main window being shown.
+
+Starts the application repeatedly with ATTENDANCE_STARTUP_REPORT set, so it writes the moment
+the window is up to a file and quits. With --eager the face recognition models are loaded
+before the window (ATTENDANCE_PRELOAD_MODELS), which is how the app started before models
+were loaded lazily. Works for the source tree and for a PyInstaller build:
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --command dist/FaceRecognitionApp.exe --runs 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+
+def launch(command, eager, timeout):
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = os.path.join(tmp, "startup.json")
+        env = dict(os.environ, ATTENDANCE_STARTUP_REPORT=report_path)
+        if eager:
+            env["ATTENDANCE_PRELOAD_MODELS"] = "1"
+        else:
+            env.pop("ATTENDANCE_PRELOAD_MODELS", None)
+
+        launched = time.time()
+        subprocess.run(command, env=env, timeout=timeout, check=True)
+        with open(report_path, encoding="utf-8") as report_file:
+            report = json.load(report_file)
+    report["window_ms"] = (report["shown_at"] - launched) * 1000
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Application startup benchmark")
+    parser.add_argument("--command", nargs="+", default=[sys.executable, "main.py"],
+                        help="How to launch the app (default: python main.py)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'window ms':>11}{'in-process ms':>15}{'models loaded':>15}")
+    for eager in (False, True):
+        # The first launch warms the OS file cache and is not counted
+        launch(args.command, eager, args.timeout)
+        reports = [launch(args.command, eager, args.timeout) for _ in range(args.runs)]
+        window = float(np.median([report["window_ms"] for report in reports]))
+        in_process = float(np.median([report["in_process_ms"] for report in reports]))
+        print(f"{'eager' if eager else 'lazy':<8}{window:>11.0f}{in_process:>15.0f}"
+              f"{str(reports[0]['face_recognition_loaded']):>15}")
+
+
+if __name__ == "__main__":
+    main()
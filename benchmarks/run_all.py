@@ -0,0 +1,271 @@
+# benchmarks/run_all.py
+"""
+Reproducible benchmark suite with a machine-readable report.
+
+Runs offline on CPU with fixed seeds and synthetic data:
+
+  gallery_load  warm EncodingStore.load_gallery + matcher build on a synthetic enrolment
+  matcher       batched matching latency and throughput vs gallery size
+  writer        attendance marks/second through AttendanceWriter
+  history       attendance history queries and a semester report on a populated, migrated database
+  clip          per-frame detect/encode/match latency on a recorded clip (only with --clip)
+
+    python -m benchmarks.run_all --output report.json
+    python -m benchmarks.run_all --quick --output new.json --compare report.json
+
+--compare prints every metric next to the baseline and exits non-zero when a latency grew or a
+throughput fell by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+import database
+import reports
+from attendance_writer import AttendanceWriter
+from face_matcher import FaceMatcher
+from face_store import ENCODING_SIZE, EncodingStore
+from benchmarks.bench_database import build_legacy, run_queries
+from benchmarks.bench_matcher import synthetic_gallery, time_call
+
+# Metric name suffixes that tell compare() which direction is better
+LOWER_IS_BETTER = ("_ms", "_us", "_s")
+HIGHER_IS_BETTER = ("_per_s",)
+
+PROFILES = {
+    "full": {"students": 2000, "images": 10, "sizes": [1000, 10000, 100000], "marks": 20000, "rows": 1000000},
+    "quick": {"students": 200, "images": 5, "sizes": [1000, 10000], "marks": 2000, "rows": 100000},
+}
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def bench_gallery_load(tmp, students, images, rng):
+    # Enrol synthetic students whose encodings are already cached, i.e. a warm start-up
+    db_path = os.path.join(tmp, "gallery.db")
+    database.migrate(db_path)
+    conn = database.connect(db_path)
+    rows = []
+    with conn:
+        for student in range(students):
+            matric = f"19/52HA{student:04d}"
+            folder = os.path.join(tmp, "student_images", str(student))
+            os.makedirs(folder, exist_ok=True)
+            conn.execute("INSERT INTO students (matric_number, name, image_path) VALUES (?, ?, ?)",
+                         (matric, f"Student {student}", folder))
+            for image in range(images):
+                path = os.path.join(folder, f"{image}.jpg")
+                with open(path, "wb") as placeholder:
+                    placeholder.write(b"\0" * 64)
+                stat = os.stat(path)
+                encoding = rng.standard_normal(ENCODING_SIZE).astype(np.float32)
+                rows.append((path, matric, stat.st_mtime_ns, stat.st_size, encoding.tobytes()))
+        EncodingStore(db_path).write_encodings(conn, rows)
+    conn.close()
+
+    def load():
+        encodings, labels, identities = EncodingStore(db_path).load_gallery()
+        matcher = FaceMatcher(capacity=len(encodings))
+        matcher.add_gallery(encodings, labels, identities)
+        return matcher
+
+    timings = []
+    for _ in range(3):
+        start = time.perf_counter()
+        matcher = load()
+        timings.append(time.perf_counter() - start)
+    return {"students": students, "encodings": len(matcher), "load_ms": float(np.median(timings)) * 1000}
+
+
+def bench_matcher(sizes, faces, rng):
+    results = {}
+    for size in sizes:
+        gallery = synthetic_gallery(size, rng)
+        matcher = FaceMatcher(capacity=size)
+        matcher.add_many(gallery, [str(i // 10) for i in range(size)], [str(i // 10) for i in range(size)])
+        picks = rng.integers(0, size, faces)
+        queries = gallery[picks] + 0.02 * rng.standard_normal((faces, ENCODING_SIZE)).astype(np.float32)
+        per_frame = time_call(lambda: matcher.match(queries), 20)
+        results[str(size)] = {"frame_ms": per_frame * 1000, "faces_per_s": faces / per_frame}
+    return results
+
+
+def bench_writer(tmp, marks):
+    db_path = os.path.join(tmp, "writer.db")
+    database.migrate(db_path)
+    base = database.to_epoch("2024-01-01 08:00:00")
+    records = [(f"19/52HA{i % 5000:04d}", None, database.from_epoch(base + i)) for i in range(marks)]
+
+    writer = AttendanceWriter(db_path)
+    writer.start()
+    start = time.perf_counter()
+    for matric, name, timestamp in records:
+        writer.mark(matric, name, timestamp)
+    queued = time.perf_counter() - start
+    writer.stop()
+    elapsed = time.perf_counter() - start
+
+    conn = sqlite3.connect(db_path)
+    written = conn.execute("SELECT COUNT(*) FROM attendance").fetchone()[0]
+    conn.close()
+    return {"marks": marks, "written": written, "mark_us": queued / marks * 1e6, "marks_per_s": marks / elapsed}
+
+
+def bench_history(tmp, rows):
+    db_path = os.path.join(tmp, "history.db")
+    build_legacy(db_path, rows, 5000)
+    start = time.perf_counter()
+    database.migrate(db_path)
+    migration = time.perf_counter() - start
+
+    conn = database.connect(db_path)
+    queries = run_queries(conn, True, 3)
+    # Per-student attendance over a semester, read from the daily aggregates
+    start = time.perf_counter()
+    for _ in reports.student_report(conn, "2024-01-01", "2024-05-31"):
+        pass
+    queries["semester report"] = time.perf_counter() - start
+    conn.close()
+    results = {"rows": rows, "migration_s": migration}
+    results.update({name.replace(" ", "_") + "_ms": seconds * 1000 for name, seconds in queries.items()})
+    return results
+
+
+def bench_clip(path, frames_limit, gallery_size, rng):
+    # Imported here so the rest of the suite runs without OpenCV/dlib installed; the other sections only
+    # read cached encodings, and face_store imports face_recognition only when it has to encode
+    from benchmarks.bench_detection import read_frames
+    from face_tracker import detect_and_encode_new
+
+    frames = read_frames(path, frames_limit)
+    if not frames:
+        return {"error": f"no frames could be read from {path}"}
+
+    matcher = FaceMatcher(capacity=gallery_size)
+    gallery = synthetic_gallery(gallery_size, rng)
+    matcher.add_many(gallery, [str(i) for i in range(gallery_size)], [str(i) for i in range(gallery_size)])
+
+    stages = {"convert": [], "detect": [], "encode": [], "match": [], "frame": []}
+    faces = 0
+    for frame in frames:
+        start = time.perf_counter()
+        locations, encodings, timings = detect_and_encode_new(frame, 0.5, 1, [], 0.3)
+        match_start = time.perf_counter()
+        matcher.match(encodings)
+        stages["match"].append(time.perf_counter() - match_start)
+        stages["frame"].append(time.perf_counter() - start)
+        for stage in ("convert", "detect", "encode"):
+            stages[stage].append(timings.get(stage, 0.0))
+        faces += len(locations)
+
+    results = {"frames": len(frames), "faces": faces, "resolution": f"{frames[0].shape[1]}x{frames[0].shape[0]}"}
+    for stage, values in stages.items():
+        results[f"{stage}_p50_ms"] = float(np.percentile(values, 50)) * 1000
+        results[f"{stage}_p95_ms"] = float(np.percentile(values, 95)) * 1000
+    return results
+
+
+def flatten(results, prefix=""):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, name + ".")
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(report, baseline, threshold):
+    """ Print each metric against the baseline and return the names that regressed. """
+    old = dict(flatten(baseline["results"]))
+    regressions = []
+    print(f"{'metric':<40}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name, value in flatten(report["results"]):
+        if name not in old:
+            continue
+        previous = old[name]
+        change = (value - previous) / previous if previous else 0.0
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = change < -threshold
+        elif name.endswith(LOWER_IS_BETTER):
+            worse = change > threshold
+        else:
+            worse = False
+        if worse:
+            regressions.append(name)
+        print(f"{name:<40}{previous:>12.3f}{value:>12.3f}{change * 100:>8.1f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run every benchmark and write a JSON report")
+    parser.add_argument("--output", default="benchmark_report.json", help="Where to write the JSON report")
+    parser.add_argument("--quick", action="store_true", help="Smaller sizes, for a fast check")
+    parser.add_argument("--only", nargs="+", default=None,
+                        choices=["gallery_load", "matcher", "writer", "history", "clip"], help="Run only these sections")
+    parser.add_argument("--clip", default=None, help="Recorded clip for the per-frame latency section")
+    parser.add_argument("--clip-frames", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--compare", default=None, help="Baseline report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Relative change counted as a regression")
+    args = parser.parse_args()
+
+    profile = PROFILES["quick" if args.quick else "full"]
+    sections = args.only or ["gallery_load", "matcher", "writer", "history", "clip"]
+    rng = np.random.default_rng(args.seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for section in sections:
+            start = time.perf_counter()
+            if section == "gallery_load":
+                results[section] = bench_gallery_load(tmp, profile["students"], profile["images"], rng)
+            elif section == "matcher":
+                results[section] = bench_matcher(profile["sizes"], 5, rng)
+            elif section == "writer":
+                results[section] = bench_writer(tmp, profile["marks"])
+            elif section == "history":
+                results[section] = bench_history(tmp, profile["rows"])
+            elif section == "clip":
+                if not args.clip:
+                    continue
+                results[section] = bench_clip(args.clip, args.clip_frames, 10000, rng)
+            print(f"{section}: {json.dumps(results[section])} ({time.perf_counter() - start:.1f} s)")
+
+    report = {"meta": dict(metadata(), profile="quick" if args.quick else "full", seed=args.seed), "results": results}
+    with open(args.output, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare(report, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
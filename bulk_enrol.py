@@ -0,0 +1,229 @@
+# bulk_enrol.py
+"""
+Offline bulk enrolment from a CSV manifest.
+
+The manifest has the columns matric_number, name, department, level and images, where images
+is a ';'-separated list of image files or folders (relative to the manifest). When images is
+empty, the folder named after the sanitized matric number next to the manifest is used. A
+directory can be given instead of a CSV file, in which case <directory>/manifest.csv is read.
+
+    python bulk_enrol.py photos/manifest.csv --workers 8
+"""
+import argparse
+import csv
+import os
+import database
+import time
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import face_recognition
+import numpy as np
+from face_store import EncodingStore
+import image_store
+import validation
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def read_manifest(source):
+    # Return (manifest rows, folder image paths are relative to)
+    manifest_path = os.path.join(source, "manifest.csv") if os.path.isdir(source) else source
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    with open(manifest_path, newline="", encoding="utf-8") as manifest:
+        return list(csv.DictReader(manifest)), base_dir
+
+
+def expand_images(entry, base_dir, matric):
+    # Resolve the images column into a sorted list of image files
+    paths = [part.strip() for part in (entry or "").split(";") if part.strip()]
+    if not paths:
+        paths = [validation.sanitize_matric(matric)]
+
+    images = []
+    for path in paths:
+        path = os.path.join(base_dir, path)
+        if os.path.isdir(path):
+            images.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if name.lower().endswith(IMAGE_EXTENSIONS))
+        elif os.path.isfile(path):
+            images.append(path)
+    return images
+
+
+def validate_row(row):
+    # Apply the same rules as the Capture Student Data form, returning an error message or None
+    matric = (row.get("matric_number") or "").strip()
+    if not validation.validate_matric(matric):
+        return "Matric number must be in the format '19/52HA054'."
+    if not validation.validate_name((row.get("name") or "").strip()):
+        return "Name must be between 3 and 40 characters and contain only alphabets."
+    if not validation.validate_department((row.get("department") or "").strip()):
+        return "Department cannot be empty and cannot contain numbers."
+    if not validation.validate_level((row.get("level") or "").strip()):
+        return "Level must be one of the following: 100, 200, 300, 400, 500, 600."
+    return None
+
+
+def encode_image_file(source_path, folder, max_side):
+    """
+    Worker: detect and encode one ID photo and, when it holds exactly one face, store the aligned
+    face crop in the student's folder. Returns (status, crop path, content hash, encoding bytes).
+    """
+    try:
+        image = face_recognition.load_image_file(source_path)
+
+        # Large scans are shrunk before detection; the crop is far smaller than either size
+        height, width = image.shape[:2]
+        scale = max_side / float(max(height, width))
+        if scale < 1.0:
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        locations = face_recognition.face_locations(image)
+        if not locations:
+            return "no face", None, None, None
+        if len(locations) > 1:
+            return "multiple faces", None, None, None
+
+        encoding = np.asarray(face_recognition.face_encodings(image, locations)[0], dtype=np.float32)
+        data = image_store.encode_crop(image_store.align_crop(image, locations[0]), rgb=True)
+        dest_path, digest = image_store.write_crop(folder, data)
+        return "ok", dest_path, digest, encoding.tobytes()
+    except Exception as e:
+        return f"error: {e}", None, None, None
+
+
+class BulkEnrolment:
+    """ Validates a manifest, encodes every photo on a process pool and writes the results in batches. """
+
+    def __init__(self, db_path, image_root=image_store.IMAGE_ROOT, workers=None, batch_size=200, max_side=1024):
+        self.db_path = db_path
+        self.image_root = image_root
+        self.workers = workers or os.cpu_count()
+        self.batch_size = batch_size
+        self.max_side = max_side
+        self.failures = []
+
+    def plan(self, rows, base_dir, existing):
+        # Validate rows and work out (student, [(source, dest folder), ...]) for each one to enrol
+        students = []
+        seen = set()
+        for line, row in enumerate(rows, start=2):
+            error = validate_row(row)
+            matric = (row.get("matric_number") or "").strip()
+            if error is None and (matric in existing or matric in seen):
+                error = "Matric number already exists."
+            if error is not None:
+                self.failures.append((f"line {line}", matric, error))
+                continue
+
+            images = expand_images(row.get("images"), base_dir, matric)
+            if not images:
+                self.failures.append((f"line {line}", matric, "No images found."))
+                continue
+
+            seen.add(matric)
+            folder = os.path.join(self.image_root, validation.sanitize_matric(matric))
+            student = (matric, row["name"].strip(), row["department"].strip(), row["level"].strip(), folder)
+            jobs = [(image, folder) for image in images]
+            students.append((student, jobs))
+        return students
+
+    def write_batch(self, conn, store, batch):
+        # One transaction for a batch of students, their images and encodings
+        with conn:
+            conn.executemany("INSERT INTO students (matric_number, name, department, level, image_path) "
+                             "VALUES (?, ?, ?, ?, ?)", [student for student, _ in batch])
+            # The same photo listed twice gives the same crop, which is recorded once
+            conn.executemany("INSERT OR IGNORE INTO student_images (matric_number, image_path, content_hash) "
+                             "VALUES (?, ?, ?)", [(row[1], row[0], digest) for _, rows in batch for row, digest in rows])
+            store.write_encodings(conn, [row for _, rows in batch for row, _ in rows])
+
+    def run(self, source):
+        rows, base_dir = read_manifest(source)
+        store = EncodingStore(self.db_path)
+        conn = database.connect(self.db_path)
+        try:
+            store.ensure_schema(conn)
+            existing = {matric for (matric,) in conn.execute("SELECT matric_number FROM students")}
+            students = self.plan(rows, base_dir, existing)
+
+            jobs = [(student_index, source_path, folder)
+                    for student_index, (_, student_jobs) in enumerate(students)
+                    for source_path, folder in student_jobs]
+            for student, _ in students:
+                os.makedirs(student[4], exist_ok=True)
+
+            start = time.perf_counter()
+            results = [[] for _ in students]
+            remaining = [len(student_jobs) for _, student_jobs in students]
+            batch = []
+            enrolled = 0
+
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                outcomes = executor.map(encode_image_file,
+                                        [source_path for _, source_path, _ in jobs],
+                                        [folder for _, _, folder in jobs],
+                                        [self.max_side] * len(jobs),
+                                        chunksize=max(1, len(jobs) // (self.workers * 16)))
+
+                for (student_index, source_path, _), outcome in zip(jobs, outcomes):
+                    status, dest_path, digest, blob = outcome
+                    student = students[student_index][0]
+                    if status == "ok":
+                        # Crops are content-addressed and never change, so mtime/size are not needed
+                        results[student_index].append(((dest_path, student[0], 0, 0, blob), digest))
+                    else:
+                        self.failures.append((source_path, student[0], status))
+
+                    # A student is written once all of their photos are processed
+                    remaining[student_index] -= 1
+                    if remaining[student_index] == 0:
+                        if results[student_index]:
+                            batch.append((student, results[student_index]))
+                        else:
+                            self.failures.append((student[4], student[0], "No usable face images."))
+                        results[student_index] = None
+
+                    if len(batch) >= self.batch_size:
+                        self.write_batch(conn, store, batch)
+                        enrolled += len(batch)
+                        batch = []
+
+            if batch:
+                self.write_batch(conn, store, batch)
+                enrolled += len(batch)
+        finally:
+            conn.close()
+
+        elapsed = time.perf_counter() - start
+        return enrolled, len(jobs), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk enrol students from a CSV manifest of ID photos.")
+    parser.add_argument("source", help="Manifest CSV, or a directory containing manifest.csv")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    parser.add_argument("--workers", type=int, default=None, help="Encoding processes (default: all cores)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Students written per transaction")
+    parser.add_argument("--max-side", type=int, default=1024, help="Longest image side used for detection")
+    parser.add_argument("--report", default=None, help="Write per-image failures to this CSV file")
+    args = parser.parse_args()
+
+    enrolment = BulkEnrolment(args.db, workers=args.workers, batch_size=args.batch_size, max_side=args.max_side)
+    enrolled, images, elapsed = enrolment.run(args.source)
+
+    rate = images / elapsed if elapsed > 0 else 0.0
+    print(f"Enrolled {enrolled} students from {images} images in {elapsed:.1f} s ({rate:.1f} images/s)")
+    print(f"{len(enrolment.failures)} failures")
+    for item, matric, reason in enrolment.failures[:20]:
+        print(f"  {matric or '-'}: {item}: {reason}")
+
+    if args.report:
+        with open(args.report, "w", newline="", encoding="utf-8") as report:
+            writer = csv.writer(report)
+            writer.writerow(["item", "matric_number", "reason"])
+            writer.writerows(enrolment.failures)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+# calibration.py
+"""
+Match tolerance calibrated on the enrolled gallery.
+
+The matcher accepts a face when its nearest gallery row is within the tolerance, so the two
+distances that matter are, for each enrolled sample:
+
+- genuine: its nearest other sample of the same student, what a new photo of an enrolled
+  student is likely to score;
+- impostor: its nearest sample of any other student, what the face of someone who is not
+  enrolled (or not in this class) scores against everybody else.
+
+calibrate() leaves each probe sample out of the gallery, computes both distances in blocks of
+probes with one matrix product per block, and picks the largest tolerance whose false-accept
+rate (share of impostor distances within it) does not exceed the target; the false-reject rate
+is the share of genuine distances above it. The result can be saved in the settings table,
+where attendance capture picks it up instead of face_recognition's default of 0.6:
+
+    python -m calibration --far 0.001
+    python -m calibration --far 0.001 --save
+"""
+import argparse
+import math
+from collections import namedtuple
+import numpy as np
+import database
+from face_matcher import DEFAULT_TOLERANCE
+from face_store import ENCODING_SIZE
+
+# Settings key the calibrated tolerance is stored under
+TOLERANCE_SETTING = "match_tolerance"
+
+# Decimal places the tolerance is kept to; always rounded down, never past the target rate
+TOLERANCE_PLACES = 4
+
+# Distances computed per block of probes (x 5 bytes with the label mask): about 160 MB whatever
+# the gallery size, so a 200k-row gallery is compared in blocks of 160 probes
+BLOCK_ELEMENTS = 32 * 1024 * 1024
+
+Calibration = namedtuple("Calibration", ["tolerance", "far", "frr", "genuine", "impostor"])
+
+
+def load_tolerance(db_path, default=DEFAULT_TOLERANCE):
+    """ The saved tolerance for this database, or default if it has not been calibrated. """
+    conn = database.connect(db_path)
+    try:
+        database.migrate_connection(conn)
+        value = database.get_setting(conn, TOLERANCE_SETTING)
+    finally:
+        conn.close()
+    return default if value is None else float(value)
+
+
+def save_tolerance(db_path, tolerance):
+    conn = database.connect(db_path)
+    try:
+        database.migrate_connection(conn)
+        with conn:
+            database.set_setting(conn, TOLERANCE_SETTING, repr(float(tolerance)))
+    finally:
+        conn.close()
+
+
+def gallery_encodings(db_path):
+    # (encodings, labels) for every cached encoding, labels numbering the students from 0
+    conn = database.connect(db_path)
+    try:
+        database.migrate_connection(conn)
+        rows = conn.execute("SELECT matric_number, encoding FROM face_encodings "
+                            "WHERE encoding IS NOT NULL ORDER BY matric_number").fetchall()
+    finally:
+        conn.close()
+    ids = {}
+    labels = np.array([ids.setdefault(matric, len(ids)) for matric, _ in rows], dtype=np.int32)
+    encodings = np.frombuffer(b"".join(blob for _, blob in rows), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    return encodings, labels
+
+
+def nearest_distances(encodings, labels, probes):
+    """
+    Return (genuine, impostor) nearest distances for the probe rows: to the closest other row
+    of the same label (inf when the label has no other row) and to the closest row of another.
+    """
+    sq_norms = np.einsum("ij,ij->i", encodings, encodings)
+    genuine = np.empty(len(probes), dtype=np.float32)
+    impostor = np.empty(len(probes), dtype=np.float32)
+    block_size = max(1, BLOCK_ELEMENTS // max(1, len(encodings)))
+    for start in range(0, len(probes), block_size):
+        rows = probes[start:start + block_size]
+        # |q|^2 + |g|^2 - 2 q.g built in place in the product's own buffer
+        sq = encodings[rows] @ encodings.T
+        sq *= -2.0
+        sq += sq_norms[None, :]
+        sq += sq_norms[rows, None]
+        np.maximum(sq, 0.0, out=sq)
+        # A probe is left out of the gallery it is matched against
+        sq[np.arange(len(rows)), rows] = np.inf
+        same = labels[rows, None] == labels[None, :]
+        np.minimum.reduce(sq, axis=1, where=same, initial=np.inf, out=genuine[start:start + len(rows)])
+        np.logical_not(same, out=same)
+        np.minimum.reduce(sq, axis=1, where=same, initial=np.inf, out=impostor[start:start + len(rows)])
+    return np.sqrt(genuine), np.sqrt(impostor)
+
+
+def pick_tolerance(genuine, impostor, far):
+    """
+    Largest tolerance, to TOLERANCE_PLACES decimals, accepting at most a far share of impostor
+    distances, with the FAR and FRR of exactly that value.
+    """
+    impostor = np.sort(impostor)
+    allowed = int(np.floor(far * len(impostor)))
+    if allowed >= len(impostor):
+        tolerance = float(impostor[-1])
+    else:
+        # Just below the first impostor distance that would push the rate over the target
+        tolerance = float(np.nextafter(impostor[allowed], np.float32(0)))
+    # Round down, so the value that is saved and used is never above the impostor distance
+    scale = 10 ** TOLERANCE_PLACES
+    tolerance = math.floor(tolerance * scale) / scale
+    achieved_far = float(np.searchsorted(impostor, tolerance, side="right")) / len(impostor)
+    frr = float(np.mean(genuine > tolerance)) if len(genuine) else 0.0
+    return tolerance, achieved_far, frr
+
+
+def calibrate(encodings, labels, far=0.001, sample=None, seed=0):
+    """
+    Calibrate the tolerance for a target false-accept rate. sample limits how many enrolled
+    samples are used as probes (each is still compared with the whole gallery).
+    """
+    if len(np.unique(labels)) < 2:
+        raise ValueError("Calibration needs encodings of at least two students")
+    probes = np.arange(len(encodings))
+    if sample is not None and sample < len(probes):
+        probes = np.sort(np.random.default_rng(seed).choice(probes, size=sample, replace=False))
+
+    genuine, impostor = nearest_distances(encodings, labels, probes)
+    # Students with a single sample have no genuine distance
+    genuine = genuine[np.isfinite(genuine)]
+    tolerance, achieved_far, frr = pick_tolerance(genuine, impostor, far)
+    return Calibration(tolerance, achieved_far, frr, genuine, impostor)
+
+
+def histogram_lines(genuine, impostor, tolerance, bins=20):
+    # Text histogram of both distributions, with the chosen tolerance marked
+    values = np.concatenate([genuine, impostor])
+    edges = np.linspace(0.0, float(values.max()) if len(values) else 1.0, bins + 1)
+    genuine_counts, _ = np.histogram(genuine, edges)
+    impostor_counts, _ = np.histogram(impostor, edges)
+    scale = 40.0 / max(1, genuine_counts.max(), impostor_counts.max())
+    lines = [f"{'distance':>13}  {'genuine':<42}{'impostor'}"]
+    for low, high, g, i in zip(edges[:-1], edges[1:], genuine_counts, impostor_counts):
+        marker = "<" if low <= tolerance < high else " "
+        lines.append(f"{low:5.2f}-{high:5.2f} {marker} {'#' * int(round(g * scale)):<40}{g:>6}  "
+                     f"{'#' * int(round(i * scale))} {i}")
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick the match tolerance for a target false-accept rate")
+    parser.add_argument("--far", type=float, default=0.001, help="Target false-accept rate (default 0.001)")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="Use at most this many enrolled samples as probes (default all)")
+    parser.add_argument("--save", action="store_true", help="Store the tolerance for attendance capture")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    args = parser.parse_args()
+
+    encodings, labels = gallery_encodings(args.db)
+    try:
+        result = calibrate(encodings, labels, args.far, args.sample)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+
+    print(f"{len(encodings)} encodings of {len(np.unique(labels))} students, "
+          f"{len(result.genuine)} genuine and {len(result.impostor)} impostor distances")
+    print("\n".join(histogram_lines(result.genuine, result.impostor, result.tolerance)))
+    if args.far * len(result.impostor) < 10:
+        print(f"Note: fewer than 10 impostor distances fall under a {args.far} rate; "
+              f"the estimate is rough until more students are enrolled")
+    print(f"Tolerance {result.tolerance:.4f}: false accepts {result.far:.4%}, false rejects {result.frr:.2%} "
+          f"(default {DEFAULT_TOLERANCE}: false accepts {np.mean(result.impostor <= DEFAULT_TOLERANCE):.4%}, "
+          f"false rejects {np.mean(result.genuine > DEFAULT_TOLERANCE):.2%})")
+
+    if args.save:
+        save_tolerance(args.db, result.tolerance)
+        print(f"Saved; attendance capture now matches within {result.tolerance:.4f}")
+
+
+if __name__ == "__main__":
+    main()
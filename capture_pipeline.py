@@ -0,0 +1,381 @@
+# capture_pipeline.py
+import logging
+import os
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import cv2
+import face_recognition
+from metrics import NULL_METRICS
+
+log = logging.getLogger(__name__)
+
+# A frame read from the camera, tagged with a running id and the time it was grabbed
+FramePacket = namedtuple("FramePacket", ["frame_id", "captured_at", "frame"])
+
+# Detection/encoding output for one frame; latency is grab-to-result in seconds
+FrameResult = namedtuple("FrameResult", ["frame_id", "captured_at", "frame", "locations", "encodings", "latency"])
+
+
+def detect_and_encode(frame):
+    """
+    Find faces in a BGR frame and compute their encodings, with the seconds spent per stage.
+    Module level so process pools can pickle it.
+    """
+    start = time.perf_counter()
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    converted = time.perf_counter()
+    locations = face_recognition.face_locations(rgb_frame)
+    detected = time.perf_counter()
+    encodings = face_recognition.face_encodings(rgb_frame, locations)
+    timings = {"convert": converted - start, "detect": detected - converted, "encode": time.perf_counter() - detected}
+    return locations, encodings, timings
+
+
+class DropOldestQueue:
+    """ Bounded queue that never blocks producers: when full, the oldest item is discarded. """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._items = deque()
+        self._condition = threading.Condition()
+        self._closed = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    def put(self, item):
+        with self._condition:
+            if self._closed:
+                return
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        # Block until the queue holds an item, returning False on timeout
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout)
+            return bool(self._items)
+
+    def get(self, timeout=None):
+        # Return the oldest item, or None if nothing arrived within timeout
+        with self._condition:
+            if not self._items:
+                self._condition.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._condition.notify_all()
+            return item
+
+    def drain(self):
+        with self._condition:
+            items = list(self._items)
+            self._items.clear()
+            self._condition.notify_all()
+            return items
+
+    def close(self):
+        # Wake anyone waiting on the queue; after this, items put into it are discarded
+        with self._condition:
+            self._closed = True
+            self._items.clear()
+            self._condition.notify_all()
+
+
+class BlockingQueue(DropOldestQueue):
+    """
+    Same interface, but producers wait for room instead of dropping, so every item is processed
+    while the consumer keeps taking them. Closing the queue releases producers still waiting.
+    """
+
+    def put(self, item):
+        with self._condition:
+            while len(self._items) >= self.maxsize and not self._closed:
+                self._condition.wait()
+            if self._closed:
+                return
+            self._items.append(item)
+            self._condition.notify_all()
+
+
+class ImageDirectorySource:
+    """ Minimal cv2.VideoCapture stand-in that yields the images of a directory in name order. """
+
+    IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, directory):
+        self.paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                            if name.lower().endswith(self.IMAGE_EXTENSIONS))
+        self._position = 0
+
+    def isOpened(self):
+        return bool(self.paths)
+
+    def read(self):
+        # Skip unreadable files rather than ending the stream early
+        while self._position < len(self.paths):
+            frame = cv2.imread(self.paths[self._position])
+            self._position += 1
+            if frame is not None:
+                return True, frame
+        return False, None
+
+    def set(self, prop, value):
+        return False
+
+    def release(self):
+        pass
+
+
+def open_source(source):
+    """ Open a camera index, an image directory, or anything cv2.VideoCapture accepts (video file, RTSP/HTTP URL). """
+    if isinstance(source, int) or str(source).isdigit():
+        return cv2.VideoCapture(int(source))
+    if os.path.isdir(source):
+        return ImageDirectorySource(source)
+    return cv2.VideoCapture(source)
+
+
+def make_executor(workers, use_processes=False):
+    """ Worker pool for detection/encoding, shareable between several pipelines. """
+    executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+    return executor_class(max_workers=workers)
+
+
+class StageStats:
+    """ Thread-safe throughput and latency counters for one pipeline stage. """
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, latency=0.0):
+        with self._lock:
+            self.count += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def throughput(self):
+        elapsed = time.perf_counter() - self.started
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        with self._lock:
+            mean = self.latency_total / self.count if self.count else 0.0
+            return (f"{self.name}: {self.count} frames, {self.throughput():.1f}/s, "
+                    f"latency mean {mean * 1000:.1f} ms, max {self.latency_max * 1000:.1f} ms")
+
+
+class FrameGrabber(threading.Thread):
+    """ Reads frames as fast as the source delivers them, keeping only the most recent ones. """
+
+    def __init__(self, capture, frame_queue, stats, metrics=NULL_METRICS):
+        super().__init__(name="FrameGrabber", daemon=True)
+        self.capture = capture
+        self.frame_queue = frame_queue
+        self.stats = stats
+        self.metrics = metrics
+        self.finished = False
+        self._latest = None
+        self._condition = threading.Condition()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        frame_id = 0
+        try:
+            while not self._stop_event.is_set():
+                start = time.perf_counter()
+                ret, frame = self.capture.read()
+                if not ret:
+                    break
+
+                frame_id += 1
+                packet = FramePacket(frame_id, time.perf_counter(), frame)
+                with self._condition:
+                    self._latest = packet
+                    self._condition.notify_all()
+                self.frame_queue.put(packet)
+                elapsed = time.perf_counter() - start
+                self.stats.record(elapsed)
+                self.metrics.observe("grab", elapsed)
+                self.metrics.increment("frames_grabbed")
+        finally:
+            with self._condition:
+                self.finished = True
+                self._condition.notify_all()
+
+    def wait_for_frame(self, last_frame_id, timeout=0.1):
+        # Block until a frame newer than last_frame_id is available (or the source ends)
+        with self._condition:
+            if (self._latest is None or self._latest.frame_id <= last_frame_id) and not self.finished:
+                self._condition.wait(timeout)
+            if self._latest is None or self._latest.frame_id <= last_frame_id:
+                return None
+            return self._latest
+
+    def stop(self):
+        self._stop_event.set()
+
+
+class RecognitionPipeline:
+    """
+    Staged capture pipeline: a grabber thread keeps only the latest frame, a dispatcher feeds
+    a pool of detection/encoding workers (threads or processes), and the caller's display loop
+    renders the newest results over the live frame.
+    """
+
+    def __init__(self, capture, workers=2, use_processes=False, frame_queue_size=1, result_queue_size=8,
+                 process_frame=detect_and_encode, make_task=None, drop_frames=True, executor=None, slots=None,
+                 name=None, metrics=NULL_METRICS):
+        self.workers = workers
+        self.use_processes = use_processes
+        self.process_frame = process_frame
+        self.name = name
+
+        # Several pipelines (one per camera) can share one worker pool and its free-worker semaphore
+        self._shared_executor = executor is not None
+
+        # Optional hook returning (function, args) for a frame, or None to skip processing it
+        self.make_task = make_task
+
+        self.grab_stats = StageStats("grab")
+        self.process_stats = StageStats("detect+encode")
+        self.display_stats = StageStats("display")
+
+        # Live sources drop stale frames; replays can keep every frame instead
+        queue_class = DropOldestQueue if drop_frames else BlockingQueue
+        self.frame_queue = queue_class(frame_queue_size)
+        self.result_queue = queue_class(result_queue_size)
+        self.grabber = FrameGrabber(capture, self.frame_queue, self.grab_stats, metrics)
+        if name:
+            self.grabber.name = f"FrameGrabber-{name}"
+
+        self.metrics = metrics
+        prefix = f"{name}." if name else ""
+        metrics.gauge(prefix + "frame_queue", lambda: len(self.frame_queue))
+        metrics.gauge(prefix + "result_queue", lambda: len(self.result_queue))
+        metrics.gauge(prefix + "in_flight", lambda: self._in_flight)
+        metrics.gauge(prefix + "dropped_frames", lambda: self.frame_queue.dropped)
+
+        self._slots = slots or threading.Semaphore(workers)
+        self._stop_event = threading.Event()
+        self._dispatcher = threading.Thread(target=self._dispatch, name=f"FrameDispatcher-{name}" if name else
+                                            "FrameDispatcher", daemon=True)
+        self._executor = executor
+        self._last_result_id = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+        # Camera drivers that honour it will keep only one buffered frame
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    @property
+    def finished(self):
+        # True once the source is exhausted and every submitted frame has been processed
+        with self._lock:
+            return self.grabber.finished and self._in_flight == 0 and not len(self.frame_queue)
+
+    def start(self):
+        if self._executor is None:
+            self._executor = make_executor(self.workers, self.use_processes)
+        self.grabber.start()
+        self._dispatcher.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.grabber.stop()
+        # Nobody takes frames or results any more; release the grabber and result callbacks
+        # blocked on a full queue (--every-frame), or the executor could never shut down
+        self.frame_queue.close()
+        self.result_queue.close()
+        self.grabber.join(timeout=2)
+        self._dispatcher.join(timeout=2)
+        if self._executor is not None and not self._shared_executor:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _dispatch(self):
+        while not self._stop_event.is_set():
+            # Wait for a free worker first so the freshest frame is the one submitted
+            if not self._slots.acquire(timeout=0.1):
+                continue
+            if not self.frame_queue.wait(timeout=0.1):
+                self._slots.release()
+                continue
+
+            # Take the frame and count it as in flight atomically, so finished never misses it
+            with self._lock:
+                packet = self.frame_queue.get(timeout=0)
+                task = self._task_for(packet) if packet is not None else None
+                if task is not None:
+                    self._in_flight += 1
+            if task is None:
+                self._slots.release()
+                continue
+
+            function, args = task
+            try:
+                future = self._executor.submit(function, *args)
+            except RuntimeError:
+                # Executor shut down while stopping
+                with self._lock:
+                    self._in_flight -= 1
+                self._slots.release()
+                break
+            future.add_done_callback(lambda done, packet=packet: self._collect(packet, done))
+
+    def _task_for(self, packet):
+        if self.make_task is None:
+            return self.process_frame, (packet.frame,)
+        return self.make_task(packet)
+
+    def _collect(self, packet, future):
+        try:
+            # Tasks return (locations, encodings) or (locations, encodings, {stage: seconds})
+            locations, encodings, *timings = future.result()
+            latency = time.perf_counter() - packet.captured_at
+            self.process_stats.record(latency)
+            if self.metrics.enabled:
+                for stage, seconds in (timings[0] if timings else {}).items():
+                    self.metrics.observe(stage, seconds)
+                self.metrics.observe("process", latency)
+                self.metrics.increment("frames_processed")
+            self.result_queue.put(FrameResult(packet.frame_id, packet.captured_at, packet.frame,
+                                              locations, encodings, latency))
+        except Exception:
+            log.exception("Error processing frame %d", packet.frame_id)
+            self.metrics.increment("frame_errors")
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self._slots.release()
+
+    def poll_results(self):
+        # New results in frame order; results that finish after a newer frame are discarded
+        results = sorted(self.result_queue.drain(), key=lambda result: result.frame_id)
+        fresh = [result for result in results if result.frame_id > self._last_result_id]
+        if fresh:
+            self._last_result_id = fresh[-1].frame_id
+        return fresh
+
+    def wait_for_frame(self, last_frame_id, timeout=0.1):
+        return self.grabber.wait_for_frame(last_frame_id, timeout)
+
+    def report(self, extra_stats=()):
+        lines = [stats.summary() for stats in (self.grab_stats, self.process_stats, self.display_stats, *extra_stats)]
+        lines.append(f"dropped: {self.frame_queue.dropped} frames before processing, "
+                     f"{self.result_queue.dropped} results before display")
+        if self.name:
+            lines = [f"[{self.name}] {line}" for line in lines]
+        return "\n".join(lines)
@@ -1,18 +1,20 @@
 # capture_student.py
-import re
 from PyQt5.QtWidgets import QDialog, QLineEdit, QFormLayout, QPushButton, QLabel, QMessageBox
 import sqlite3
 import cv2
 import os
-import sys
+import database
+from face_store import EncodingStore
+from image_store import ImageStore
+from thumbnail_cache import ThumbnailCache
+from enrolment_quality import EnrolmentSampler, ACCEPTED
+import validation
 
-def resource_path(relative_path):
-    """Get the absolute path to a resource, works for both development and PyInstaller."""
-    try:
-        base_path = sys._MEIPASS
-    except AttributeError:
-        base_path = os.path.abspath(".")
-    return os.path.join(base_path, relative_path)
+# Number of distinct good images taken per student
+TARGET_SAMPLES = 10
+
+# Frames between automatic quality checks; detection is too slow to run on every frame
+CHECK_INTERVAL = 3
 
 class CaptureStudentData(QDialog):
     def __init__(self):
@@ -50,26 +52,19 @@ class CaptureStudentData(QDialog):
         self.save_button.clicked.connect(self.save_record)
 
     def validate_matric(self, matric):
-        # Regular expression to validate the matric number format
-        pattern = r"^\d{2}/\d{2}[A-Za-z]{2}\d{3}$"
-        return bool(re.match(pattern, matric))
+        return validation.validate_matric(matric)
 
     def sanitize_matric(self, matric):
-        # Replace "/" with a safe character for file paths (e.g., "_")
-        return matric.replace("/", "_")
+        return validation.sanitize_matric(matric)
 
     def validate_name(self, name):
-        # Check if the name contains only alphabets and is between 3 and 40 characters
-        return name.replace(" ", "").isalpha() and 3 <= len(name) <= 40
+        return validation.validate_name(name)
 
     def validate_department(self, department):
-        # Check if the department contains only alphabets
-        return department.replace(" ", "").isalpha()
+        return validation.validate_department(department)
 
     def validate_level(self, level):
-        # Validate level to be one of the specified values
-        valid_levels = {'100', '200', '300', '400', '500', '600'}
-        return level in valid_levels
+        return validation.validate_level(level)
 
     def capture_images(self):
         # Retrieve the matric number to use as a folder name for saving images
@@ -81,10 +76,9 @@ class CaptureStudentData(QDialog):
             QMessageBox.warning(self, "Error", "Matric number must be in the format '19/52HA054")
             return
 
-        sanitized_matric = self.sanitize_matric(matric)
-
         # Create a directory for the student's images if it doesn't exist
-        image_directory = os.path.join("student_images", sanitized_matric)
+        images = ImageStore()
+        image_directory = images.folder(matric)
         os.makedirs(image_directory, exist_ok=True)
 
         # Initialize the webcam
@@ -96,57 +90,79 @@ class CaptureStudentData(QDialog):
         notification_timer = 0  # Timer for notification display duration
 
         # Connect to the database using resource_path
-        db_path = resource_path('student_attendance.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-
-        while True:
+        db_path = database.resource_path('student_attendance.db')
+        conn = database.connect(db_path)
+        database.migrate_connection(conn)
+        store = EncodingStore(db_path)
+        # Same location the students view reads from, whatever directory the app was started in
+        thumbnails = ThumbnailCache(database.resource_path('thumbnails'))
+
+        # Frames are only kept when they hold one sharp, frontal face that differs from earlier samples
+        sampler = EnrolmentSampler(target=TARGET_SAMPLES)
+        status = "Look at the camera"
+        frame_number = 0
+
+        # CLAHE enhances contrast in low-light conditions; one instance serves every frame
+        clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+
+        while not sampler.done:
             ret, frame = cap.read()
             if not ret:
                 break
+            frame_number += 1
 
             # Convert the frame to grayscale for better recognition compatibility
             gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-            # Apply CLAHE to enhance contrast in low-light conditions
-            clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
             enhanced_frame = clahe.apply(gray_frame)
 
+            key = cv2.waitKey(1)
+            if key % 256 == ord('q'):  # 'q' key to quit
+                break
+
+            # Check every few frames automatically, or straight away when SPACE is pressed
+            if frame_number % CHECK_INTERVAL == 0 or key % 256 == 32:
+                status, location, encoding = sampler.check(enhanced_frame)
+
+                if status == ACCEPTED:
+                    # Save an aligned crop of the face; an identical crop already stored is not saved twice
+                    img_name, added = images.add(conn, matric, enhanced_frame, location)
+                    conn.commit()
+
+                    # Store the encoding computed by the sampler so attendance capture never has to
+                    if added:
+                        store.add_image(matric, img_name, encoding)
+
+                    # The records view shows the first image, so have its thumbnail ready
+                    if img_count == 0:
+                        thumbnails.thumbnail(img_name)
+
+                    img_count += 1
+                    self.image_path_label.setText(f"{img_count} images captured.")
+                    notification_timer = 30  # Set timer to display the notification for a short duration
+
             # Display notification text for a brief period after each capture
             if notification_timer > 0:
-                cv2.putText(frame, f"Image {img_count} captured", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+                cv2.putText(frame, f"Image {img_count} of {sampler.target} captured", (10, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
                 notification_timer -= 1  # Decrement timer on each frame
+            else:
+                cv2.putText(frame, status, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
 
             # Display instruction to press 'q' to quit at the top right side
             text = "Press 'q' to quit"
             (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.7, 2)
             cv2.putText(frame, text, (frame.shape[1] - text_width - 10, text_height + 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
 
-            # Display the enhanced frame
+            # Display the frame
             cv2.imshow("Capture Images", frame)
 
-            key = cv2.waitKey(1)
-
-            if key % 256 == 32:  # SPACE key
-                # Save the captured enhanced image with a unique name
-                img_name = os.path.join(image_directory, f"{sanitized_matric}_{img_count}.jpg")  # Saving as .jpg
-                cv2.imwrite(img_name, enhanced_frame)
-
-                # Insert the image path into the database
-                cursor.execute("INSERT INTO student_images (matric_number, image_path) VALUES (?, ?)", (matric, img_name))
-                conn.commit()
-
-                img_count += 1
-                self.image_path_label.setText(f"{img_count} images captured.")
-                notification_timer = 30  # Set timer to display the notification for a short duration
-
-            elif key % 256 == ord('q'):  # 'q' key to quit
-                break
-
         cap.release()
         cv2.destroyAllWindows()
         conn.close()
 
+        if sampler.done:
+            QMessageBox.information(self, "Success", f"{img_count} images captured.")
+
     def save_record(self):
         # Get the data from input fields
         name = self.name_input.text()
@@ -179,7 +195,7 @@ class CaptureStudentData(QDialog):
         # Save the record to the database
         if name and matric and department and level and os.path.exists(image_path):
             # Connect to the database using resource_path
-            db_path = resource_path('student_attendance.db')
+            db_path = database.resource_path('student_attendance.db')
             conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
             try:
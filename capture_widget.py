@@ -0,0 +1,207 @@
+# capture_widget.py
+import threading
+import cv2
+from PyQt5.QtWidgets import (
+    QDialog, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QProgressBar, QListWidget,
+    QSizePolicy
+)
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import Qt, QObject, QThread, pyqtSignal, pyqtSlot
+
+
+class CaptureWorker(QObject):
+    """
+    Owns an AttendanceCapture on a background thread: loads the gallery, runs the capture loop and
+    reports frames, marks and progress through signals, so the GUI thread never blocks.
+    """
+
+    progress = pyqtSignal(int, int)
+    gallery_loaded = pyqtSignal(int, int)
+    frame_ready = pyqtSignal(int, QImage)
+    marked = pyqtSignal(str, str)
+    capture_stopped = pyqtSignal(int)
+    error = pyqtSignal(str)
+
+    def __init__(self, options=None):
+        super().__init__()
+        self.options = options or {}
+        self.attendance = None
+        self.stop_event = threading.Event()
+
+        # Set while a frame is waiting to be painted; newer frames are skipped until then, so a
+        # slow GUI never builds up a backlog of queued frames
+        self.frame_pending = threading.Event()
+
+        # Only this camera's frames are converted and sent to the view; the others are still recognised
+        self.displayed_camera = 0
+
+    @pyqtSlot()
+    def load(self):
+        try:
+            from attendance_capture import AttendanceCapture
+
+            self.attendance = AttendanceCapture(progress=self.progress.emit, **self.options)
+            self.attendance.on_mark = lambda matric, name, session_id: self.marked.emit(matric, name)
+            self.gallery_loaded.emit(len(self.attendance.matcher), len(self.attendance.matcher.identities))
+        except Exception as e:
+            self.error.emit(f"Error loading known faces: {e}")
+
+    @pyqtSlot(object)
+    def start(self, sources):
+        if self.attendance is None:
+            return
+        self.stop_event.clear()
+        self.frame_pending.clear()
+        try:
+            self.attendance.start_attendance_capture(sources, display=False, on_frame=self.emit_frame,
+                                                     stop_event=self.stop_event)
+        except Exception as e:
+            self.error.emit(f"Error during attendance capture: {e}")
+        self.capture_stopped.emit(self.attendance.sessions.marked)
+
+    def stop(self):
+        # Called from the GUI thread; the capture loop checks the event on every iteration
+        self.stop_event.set()
+
+    def emit_frame(self, camera, frame):
+        if camera != self.displayed_camera or self.frame_pending.is_set():
+            return
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        height, width = rgb_frame.shape[:2]
+        # Copy so the QImage owns its pixels once the numpy buffer is gone
+        image = QImage(rgb_frame.data, width, height, rgb_frame.strides[0], QImage.Format_RGB888).copy()
+        self.frame_pending.set()
+        self.frame_ready.emit(camera, image)
+
+
+class AttendanceCaptureWidget(QWidget):
+    """ Live capture view with start/stop controls, gallery loading progress and attendance counts. """
+
+    load_requested = pyqtSignal()
+    start_requested = pyqtSignal(object)
+
+    def __init__(self, options=None, parent=None):
+        super().__init__(parent)
+
+        self.video_label = QLabel("Loading known faces...")
+        self.video_label.setAlignment(Qt.AlignCenter)
+        self.video_label.setMinimumSize(640, 360)
+        self.video_label.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+
+        self.progress_bar = QProgressBar()
+        self.source_input = QLineEdit("0")
+        self.source_input.setToolTip("Camera index, video file or stream URL; separate several with commas")
+        self.start_button = QPushButton("Start")
+        self.stop_button = QPushButton("Stop")
+        self.status_label = QLabel("")
+        self.count_label = QLabel("Students marked: 0")
+        self.marks_list = QListWidget()
+        self.marks_list.setMaximumWidth(260)
+
+        self.start_button.setEnabled(False)
+        self.stop_button.setEnabled(False)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Source:"))
+        controls.addWidget(self.source_input)
+        controls.addWidget(self.start_button)
+        controls.addWidget(self.stop_button)
+
+        side = QVBoxLayout()
+        side.addWidget(self.count_label)
+        side.addWidget(self.marks_list)
+
+        body = QHBoxLayout()
+        body.addWidget(self.video_label, 1)
+        body.addLayout(side)
+
+        layout = QVBoxLayout()
+        layout.addLayout(body)
+        layout.addWidget(self.progress_bar)
+        layout.addLayout(controls)
+        layout.addWidget(self.status_label)
+        self.setLayout(layout)
+
+        self.marked_count = 0
+
+        # All capture work happens on this thread
+        self.capture_thread = QThread(self)
+        self.worker = CaptureWorker(options)
+        self.worker.moveToThread(self.capture_thread)
+
+        self.load_requested.connect(self.worker.load)
+        self.start_requested.connect(self.worker.start)
+        self.worker.progress.connect(self.show_progress)
+        self.worker.gallery_loaded.connect(self.gallery_loaded)
+        self.worker.frame_ready.connect(self.show_frame)
+        self.worker.marked.connect(self.student_marked)
+        self.worker.capture_stopped.connect(self.capture_stopped)
+        self.worker.error.connect(self.status_label.setText)
+
+        self.start_button.clicked.connect(self.start_capture)
+        self.stop_button.clicked.connect(self.stop_capture)
+
+        self.capture_thread.start()
+        self.load_requested.emit()
+
+    def show_progress(self, done, total):
+        self.progress_bar.setMaximum(max(total, 1))
+        self.progress_bar.setValue(done)
+
+    def gallery_loaded(self, encodings, students):
+        self.progress_bar.hide()
+        self.video_label.setText("Press Start to begin capturing attendance.")
+        self.status_label.setText(f"Loaded {encodings} encodings for {students} students.")
+        self.start_button.setEnabled(True)
+
+    def start_capture(self):
+        sources = [source.strip() for source in self.source_input.text().split(",") if source.strip()] or ["0"]
+        sources = [int(source) if source.isdigit() else source for source in sources]
+        self.start_button.setEnabled(False)
+        self.stop_button.setEnabled(True)
+        self.source_input.setEnabled(False)
+        self.status_label.setText("Capturing...")
+        self.start_requested.emit(sources)
+
+    def stop_capture(self):
+        self.stop_button.setEnabled(False)
+        self.status_label.setText("Stopping...")
+        self.worker.stop()
+
+    def show_frame(self, camera, image):
+        pixmap = QPixmap.fromImage(image)
+        self.video_label.setPixmap(pixmap.scaled(self.video_label.size(), Qt.KeepAspectRatio,
+                                                 Qt.FastTransformation))
+        self.worker.frame_pending.clear()
+
+    def student_marked(self, matric, name):
+        self.marked_count += 1
+        self.count_label.setText(f"Students marked: {self.marked_count}")
+        self.marks_list.insertItem(0, f"{name} ({matric})")
+
+    def capture_stopped(self, marked):
+        self.start_button.setEnabled(True)
+        self.stop_button.setEnabled(False)
+        self.source_input.setEnabled(True)
+        self.status_label.setText(f"Capture stopped. {marked} students marked.")
+
+    def shutdown(self):
+        # Stop capture and wait for the worker thread, e.g. when the window closes
+        self.worker.stop()
+        self.capture_thread.quit()
+        self.capture_thread.wait()
+
+
+class AttendanceCaptureDialog(QDialog):
+    def __init__(self, options=None):
+        super().__init__()
+
+        self.setWindowTitle("Attendance Capture")
+        self.setGeometry(150, 150, 1000, 600)
+
+        layout = QVBoxLayout()
+        self.capture_widget = AttendanceCaptureWidget(options, self)
+        layout.addWidget(self.capture_widget)
+        self.setLayout(layout)
+
+        self.finished.connect(self.capture_widget.shutdown)
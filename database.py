@@ -0,0 +1,333 @@
+# database.py
+"""
+Versioned schema for student_attendance.db.
+
+Each entry in MIGRATIONS upgrades the database by one version; the current version is kept in
+PRAGMA user_version, so migrate() is cheap to call on every start-up and only runs what is new.
+"""
+import calendar
+import os
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def resource_path(relative_path):
+    """
+    Absolute path of a file shipped beside the application: in the PyInstaller bundle, or next
+    to these modules when run from source, whatever the working directory is.
+    """
+    base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
+    return os.path.join(base_path, relative_path)
+
+
+def to_epoch(timestamp):
+    # Epoch seconds for a 'YYYY-MM-DD HH:MM:SS' wall-clock string, matching SQLite's strftime('%s', ...)
+    return calendar.timegm(datetime.strptime(timestamp, TIMESTAMP_FORMAT).timetuple())
+
+
+def now_timestamp():
+    return datetime.now().strftime(TIMESTAMP_FORMAT)
+
+
+def from_epoch(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _create_base_tables(conn):
+    # Create the students table
+    conn.execute('''CREATE TABLE IF NOT EXISTS students (
+                        matric_number TEXT PRIMARY KEY,
+                        name TEXT,
+                        department TEXT,
+                        level TEXT,
+                        image_path TEXT
+                      )''')
+
+    # Create the student_images table to store individual image paths for each student
+    conn.execute('''CREATE TABLE IF NOT EXISTS student_images (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        matric_number TEXT,
+                        image_path TEXT,
+                        FOREIGN KEY (matric_number) REFERENCES students (matric_number)
+                      )''')
+
+    # Create the attendance table to log attendance, ensuring unique records per session
+    conn.execute('''CREATE TABLE IF NOT EXISTS attendance (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        matric_number TEXT,
+                        name TEXT,
+                        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                        UNIQUE (matric_number, timestamp),
+                        FOREIGN KEY (matric_number) REFERENCES students (matric_number)
+                      )''')
+
+
+def _create_face_encodings(conn):
+    # Cached 128-d encoding per image; encoding is NULL when no face could be found
+    conn.execute('''CREATE TABLE IF NOT EXISTS face_encodings (
+                        image_path TEXT PRIMARY KEY,
+                        matric_number TEXT,
+                        mtime_ns INTEGER,
+                        size INTEGER,
+                        encoding BLOB,
+                        FOREIGN KEY (matric_number) REFERENCES students (matric_number)
+                      )''')
+
+
+def _create_enrolment_change_log(conn):
+    # Change log read by GallerySync to update a running gallery
+    conn.execute('''CREATE TABLE IF NOT EXISTS enrolment_changes (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        matric_number TEXT,
+                        change TEXT,
+                        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                      )''')
+
+    triggers = {
+        "students_insert_log": ("AFTER INSERT ON students", ["(NEW.matric_number, 'upsert')"]),
+        "students_update_log": ("AFTER UPDATE ON students", ["(OLD.matric_number, 'remove')",
+                                                             "(NEW.matric_number, 'upsert')"]),
+        "students_delete_log": ("AFTER DELETE ON students", ["(OLD.matric_number, 'remove')"]),
+        "face_encodings_insert_log": ("AFTER INSERT ON face_encodings", ["(NEW.matric_number, 'upsert')"]),
+        "face_encodings_delete_log": ("AFTER DELETE ON face_encodings", ["(OLD.matric_number, 'upsert')"]),
+    }
+    for name, (event, values) in triggers.items():
+        body = " ".join(f"INSERT INTO enrolment_changes (matric_number, change) VALUES {value};" for value in values)
+        conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {event} BEGIN {body} END")
+
+
+def _add_epoch_timestamps_and_indexes(conn):
+    # Integer epoch column for range filters and deletes, back-filled from the text timestamps
+    conn.execute("ALTER TABLE attendance ADD COLUMN ts INTEGER")
+    conn.execute("UPDATE attendance SET ts = CAST(strftime('%s', timestamp) AS INTEGER)")
+
+    # Writers that only supply the text timestamp still get ts filled in
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS attendance_fill_ts AFTER INSERT ON attendance
+                    WHEN NEW.ts IS NULL
+                    BEGIN
+                        UPDATE attendance SET ts = CAST(strftime('%s', NEW.timestamp) AS INTEGER) WHERE id = NEW.id;
+                    END''')
+
+    # (ts, rowid) order serves the history view's keyset pages and the range DELETE
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_ts ON attendance (ts)")
+    # Per-student history and counts without touching the table
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_matric_ts ON attendance (matric_number, ts)")
+    # First image per student in the records view, answered from the index alone
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_student_images_matric ON student_images (matric_number, id, image_path)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_face_encodings_matric ON face_encodings (matric_number)")
+
+
+def _create_courses_and_sessions(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS courses (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        code TEXT UNIQUE,
+                        title TEXT,
+                        department TEXT,
+                        level TEXT
+                      )''')
+
+    # A lecture/period of a course; starts_at and ends_at are epoch seconds like attendance.ts
+    conn.execute('''CREATE TABLE IF NOT EXISTS sessions (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        course_id INTEGER,
+                        starts_at INTEGER,
+                        ends_at INTEGER,
+                        location TEXT,
+                        FOREIGN KEY (course_id) REFERENCES courses (id)
+                      )''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_course ON sessions (course_id, starts_at)")
+
+    conn.execute("ALTER TABLE attendance ADD COLUMN session_id INTEGER REFERENCES sessions (id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_session ON attendance (session_id, matric_number)")
+
+
+def _add_session_unique_marks(conn):
+    # One mark per student per session; rows without a session keep the old (matric, timestamp) rule
+    conn.execute("""DELETE FROM attendance WHERE session_id IS NOT NULL AND id NOT IN (
+                        SELECT MIN(id) FROM attendance WHERE session_id IS NOT NULL
+                        GROUP BY session_id, matric_number)""")
+    conn.execute("DROP INDEX IF EXISTS idx_attendance_session")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_session_student "
+                 "ON attendance (session_id, matric_number) WHERE session_id IS NOT NULL")
+
+
+def _create_attendance_aggregates(conn):
+    # Marks per student per day and course (course_id 0 for marks without a session), kept up to
+    # date by triggers so reports never have to scan or group the attendance table
+    conn.execute('''CREATE TABLE IF NOT EXISTS attendance_daily (
+                        day TEXT,
+                        matric_number TEXT,
+                        course_id INTEGER,
+                        marks INTEGER,
+                        PRIMARY KEY (day, matric_number, course_id)
+                      ) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attendance_daily_student ON attendance_daily (matric_number, day)")
+
+    # Students present per session
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_attendance (
+                        session_id INTEGER PRIMARY KEY,
+                        present INTEGER,
+                        FOREIGN KEY (session_id) REFERENCES sessions (id)
+                      )''')
+
+    course = "COALESCE((SELECT course_id FROM sessions WHERE id = {row}.session_id), 0)"
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_insert AFTER INSERT ON attendance
+                     BEGIN
+                         INSERT INTO attendance_daily (day, matric_number, course_id, marks)
+                         VALUES (date(NEW.timestamp), NEW.matric_number, {course.format(row="NEW")}, 1)
+                         ON CONFLICT (day, matric_number, course_id) DO UPDATE SET marks = marks + 1;
+                         INSERT INTO session_attendance (session_id, present)
+                         SELECT NEW.session_id, 1 WHERE NEW.session_id IS NOT NULL
+                         ON CONFLICT (session_id) DO UPDATE SET present = present + 1;
+                     END''')
+    conn.execute(f'''CREATE TRIGGER IF NOT EXISTS attendance_daily_delete AFTER DELETE ON attendance
+                     BEGIN
+                         UPDATE attendance_daily SET marks = marks - 1
+                         WHERE day = date(OLD.timestamp) AND matric_number = OLD.matric_number
+                               AND course_id = {course.format(row="OLD")};
+                         DELETE FROM attendance_daily
+                         WHERE day = date(OLD.timestamp) AND matric_number = OLD.matric_number AND marks <= 0;
+                         UPDATE session_attendance SET present = present - 1 WHERE session_id = OLD.session_id;
+                     END''')
+
+    # Back-fill from the marks recorded so far
+    conn.execute(f"""INSERT INTO attendance_daily (day, matric_number, course_id, marks)
+                     SELECT date(a.timestamp), a.matric_number, {course.format(row="a")}, COUNT(*)
+                     FROM attendance a GROUP BY 1, 2, 3""")
+    conn.execute("""INSERT INTO session_attendance (session_id, present)
+                    SELECT session_id, COUNT(*) FROM attendance WHERE session_id IS NOT NULL GROUP BY session_id""")
+
+
+def _add_image_content_hashes(conn):
+    # Images written by image_store are named after a hash of their content; NULL for older images
+    conn.execute("ALTER TABLE student_images ADD COLUMN content_hash TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_student_images_hash "
+                 "ON student_images (matric_number, content_hash) WHERE content_hash IS NOT NULL")
+
+
+def _create_settings_and_unknown_faces(conn):
+    # Per-deployment settings such as the calibrated match tolerance, as text values
+    conn.execute('''CREATE TABLE IF NOT EXISTS settings (
+                        key TEXT PRIMARY KEY,
+                        value TEXT
+                      )''')
+
+    # Faces seen during capture that matched no student, one row per cluster, kept for enrolment
+    conn.execute('''CREATE TABLE IF NOT EXISTS unknown_faces (
+                        id INTEGER PRIMARY KEY,
+                        first_seen TEXT,
+                        last_seen TEXT,
+                        sightings INTEGER,
+                        encoding BLOB,
+                        image_path TEXT
+                      )''')
+
+
+def _create_session_students(conn):
+    # Marks per session per student (1 unless a duplicate slipped in before the unique index),
+    # so per-session reports filtered by department or level never read the attendance table,
+    # which archive.py empties of old marks
+    conn.execute('''CREATE TABLE IF NOT EXISTS session_students (
+                        session_id INTEGER,
+                        matric_number TEXT,
+                        marks INTEGER,
+                        PRIMARY KEY (session_id, matric_number)
+                      ) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS session_students_insert AFTER INSERT ON attendance
+                     WHEN NEW.session_id IS NOT NULL
+                     BEGIN
+                         INSERT INTO session_students (session_id, matric_number, marks)
+                         VALUES (NEW.session_id, NEW.matric_number, 1)
+                         ON CONFLICT (session_id, matric_number) DO UPDATE SET marks = marks + 1;
+                     END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS session_students_delete AFTER DELETE ON attendance
+                     WHEN OLD.session_id IS NOT NULL
+                     BEGIN
+                         UPDATE session_students SET marks = marks - 1
+                         WHERE session_id = OLD.session_id AND matric_number = OLD.matric_number;
+                         DELETE FROM session_students
+                         WHERE session_id = OLD.session_id AND matric_number = OLD.matric_number AND marks <= 0;
+                     END''')
+    conn.execute("""INSERT INTO session_students (session_id, matric_number, marks)
+                    SELECT session_id, matric_number, COUNT(*) FROM attendance
+                    WHERE session_id IS NOT NULL GROUP BY session_id, matric_number""")
+
+
+# Append new migrations to the end; never edit or reorder ones that have shipped
+MIGRATIONS = [
+    _create_base_tables,
+    _create_face_encodings,
+    _create_enrolment_change_log,
+    _add_epoch_timestamps_and_indexes,
+    _create_courses_and_sessions,
+    _add_session_unique_marks,
+    _create_attendance_aggregates,
+    _add_image_content_hashes,
+    _create_settings_and_unknown_faces,
+    _create_session_students,
+]
+
+
+def get_setting(conn, key, default=None):
+    row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+
+def set_setting(conn, key, value):
+    # The caller commits
+    conn.execute("INSERT INTO settings (key, value) VALUES (?, ?) "
+                 "ON CONFLICT (key) DO UPDATE SET value = excluded.value", (key, str(value)))
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_pragmas(conn):
+    # Per-connection settings; journal_mode=WAL is persistent and set by migrate()
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-20000")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def connect(db_path):
+    """ Open a connection with the project's pragmas applied. """
+    return apply_pragmas(sqlite3.connect(db_path))
+
+
+def migrate_connection(conn):
+    """ Bring the database behind conn up to the latest schema version, returning that version. """
+    if schema_version(conn) >= len(MIGRATIONS):
+        return schema_version(conn)
+
+    apply_pragmas(conn)
+    for number in range(1, len(MIGRATIONS) + 1):
+        if conn.in_transaction:
+            conn.commit()
+        # BEGIN IMMEDIATE serialises concurrent migrators; re-check the version under the lock
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if schema_version(conn) < number:
+                MIGRATIONS[number - 1](conn)
+                conn.execute(f"PRAGMA user_version = {number}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    conn.execute("PRAGMA journal_mode=WAL")
+    return schema_version(conn)
+
+
+def migrate(db_path):
+    """ Create or upgrade the database file at db_path. """
+    conn = sqlite3.connect(db_path)
+    try:
+        return migrate_connection(conn)
+    finally:
+        conn.close()
@@ -0,0 +1,97 @@
+# enrolment_quality.py
+import cv2
+import face_recognition
+import numpy as np
+from face_tracker import detect_faces
+
+# Outcomes of EnrolmentSampler.check, also shown on the capture preview
+ACCEPTED = "Captured"
+NO_FACE = "No face found"
+MULTIPLE_FACES = "Only one person should be in view"
+TOO_SMALL = "Move closer to the camera"
+TOO_BLURRY = "Hold still"
+NOT_FRONTAL = "Look straight at the camera"
+DUPLICATE = "Turn your head slightly"
+
+
+def sharpness(gray, location):
+    # Variance of the Laplacian over the face; low values mean motion blur or bad focus
+    top, right, bottom, left = location
+    face = gray[top:bottom, left:right]
+    if face.size == 0:
+        return 0.0
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+def frontal_offset(rgb, location):
+    """
+    How far the nose sits from the midpoint of the eyes, as a fraction of the distance between
+    the eyes. About 0 for a frontal face, growing as the head turns; None if landmarks fail.
+    """
+    landmarks = face_recognition.face_landmarks(rgb, [location], model="small")
+    if not landmarks:
+        return None
+    points = landmarks[0]
+    left_eye = np.mean(points["left_eye"], axis=0)
+    right_eye = np.mean(points["right_eye"], axis=0)
+    nose = np.mean(points["nose_tip"], axis=0)
+    eye_distance = np.linalg.norm(right_eye - left_eye)
+    if eye_distance == 0:
+        return None
+    return float(np.linalg.norm(nose[:1] - (left_eye[:1] + right_eye[:1]) / 2) / eye_distance)
+
+
+class EnrolmentSampler:
+    """
+    Decides which webcam frames are worth keeping as enrolment images: exactly one face, large,
+    sharp and roughly frontal, and not a near-duplicate of a sample already taken. Encodings are
+    computed here once, so they can be stored with the image.
+    """
+
+    def __init__(self, target=10, min_face_size=80, min_sharpness=60.0, max_offset=0.25,
+                 min_distance=0.12, detect_scale=0.5):
+        self.target = target
+        self.min_face_size = min_face_size
+        self.min_sharpness = min_sharpness
+        self.max_offset = max_offset
+        self.min_distance = min_distance
+        self.detect_scale = detect_scale
+        self.encodings = []
+
+    @property
+    def done(self):
+        return len(self.encodings) >= self.target
+
+    def check(self, image):
+        """
+        Check a (CLAHE-enhanced) grayscale frame. Returns (status, location, encoding); location
+        and encoding are only set when status is ACCEPTED, and the encoding is then kept.
+        """
+        bgr = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        locations = detect_faces(bgr, self.detect_scale)
+        if not locations:
+            return NO_FACE, None, None
+        if len(locations) > 1:
+            return MULTIPLE_FACES, None, None
+
+        location = locations[0]
+        top, right, bottom, left = location
+        if min(bottom - top, right - left) < self.min_face_size:
+            return TOO_SMALL, None, None
+        # Cheapest checks first; landmarks and the embedding are only computed for sharp faces
+        if sharpness(image, location) < self.min_sharpness:
+            return TOO_BLURRY, None, None
+
+        rgb = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+        offset = frontal_offset(rgb, location)
+        if offset is None or offset > self.max_offset:
+            return NOT_FRONTAL, None, None
+
+        encoding = np.asarray(face_recognition.face_encodings(rgb, [location])[0], dtype=np.float32)
+        if self.encodings:
+            distances = np.linalg.norm(np.asarray(self.encodings) - encoding, axis=1)
+            if distances.min() < self.min_distance:
+                return DUPLICATE, None, None
+
+        self.encodings.append(encoding)
+        return ACCEPTED, location, encoding
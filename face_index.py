@@ -0,0 +1,343 @@
+# face_index.py
+import hashlib
+import logging
+import os
+import numpy as np
+from face_store import ENCODING_SIZE
+
+log = logging.getLogger(__name__)
+
+# Rows per block when assigning vectors to centroids, bounds the temporary distance matrix
+ASSIGN_CHUNK = 16384
+
+
+def gallery_fingerprint(gallery, labels):
+    # Identify a gallery so a persisted index is only reused for the exact same encodings
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(gallery).tobytes())
+    digest.update(np.ascontiguousarray(labels).tobytes())
+    return digest.hexdigest()
+
+
+def nearest_centroids(data, centroids):
+    # Index of the closest centroid for every row of data, computed in chunks
+    centroid_sq = np.einsum("ij,ij->i", centroids, centroids)
+    assignments = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), ASSIGN_CHUNK):
+        block = data[start:start + ASSIGN_CHUNK]
+        distances = centroid_sq[None, :] - 2.0 * (block @ centroids.T)
+        assignments[start:start + len(block)] = distances.argmin(axis=1)
+    return assignments
+
+
+def kmeans(data, k, iterations=10, seed=0):
+    """ Plain Lloyd's k-means in NumPy, returning (centroids, assignments). """
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = nearest_centroids(data, centroids)
+
+        # Sum each cluster with one sort + reduceat instead of a Python loop
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        occupied = counts > 0
+        sums = np.add.reduceat(data[order], starts[occupied], axis=0)
+        centroids[occupied] = sums / counts[occupied, None]
+
+        # Re-seed empty clusters from random points so every list stays useful
+        empty = np.flatnonzero(~occupied)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+
+    return centroids, nearest_centroids(data, centroids)
+
+
+class BruteForceIndex:
+    """ Exact search: the matcher scans the whole gallery with one matmul. """
+
+    kind = "exact"
+    exhaustive = True
+
+    def build(self, matcher):
+        pass
+
+    def add(self, matcher, start, end):
+        pass
+
+    def candidates(self, matcher, queries, k):
+        sq_distances = matcher.squared_distances(queries)
+        sq_distances[:, matcher.labels < 0] = np.inf
+        return top_k(sq_distances, np.arange(sq_distances.shape[1]), k)
+
+    def save(self, path, fingerprint):
+        pass
+
+    def load(self, path, matcher, fingerprint):
+        return True
+
+
+def top_k(sq_distances, rows, k):
+    # Sorted k smallest entries of each row of sq_distances, padded with inf / -1
+    count = sq_distances.shape[1]
+    out_sq = np.full((len(sq_distances), k), np.inf, dtype=np.float32)
+    out_rows = np.full((len(sq_distances), k), -1, dtype=np.int64)
+    if count == 0:
+        return out_sq, out_rows
+
+    take = min(k, count)
+    if take < count:
+        part = np.argpartition(sq_distances, take - 1, axis=1)[:, :take]
+    else:
+        part = np.broadcast_to(np.arange(count), (len(sq_distances), count))
+    part_sq = np.take_along_axis(sq_distances, part, axis=1)
+    order = np.argsort(part_sq, axis=1)
+    out_sq[:, :take] = np.take_along_axis(part_sq, order, axis=1)
+    out_rows[:, :take] = rows[np.take_along_axis(part, order, axis=1)]
+    out_rows[~np.isfinite(out_sq)] = -1
+    return out_sq, out_rows
+
+
+class IVFIndex:
+    """
+    Inverted-file index: gallery rows are partitioned by k-means and only the nprobe
+    closest partitions are scanned per query. Rows added after the build are kept in a
+    small pending set that is scanned exhaustively until the next rebuild.
+    """
+
+    kind = "ivf"
+    exhaustive = False
+
+    def __init__(self, nlist=None, nprobe=8, iterations=10, train_size=100000, rebuild_ratio=0.1):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.train_size = train_size
+        self.rebuild_ratio = rebuild_ratio
+
+        self.centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._indexed = 0
+
+    def _list_count(self, size):
+        # Roughly 4 * sqrt(N) lists keeps each scanned list small at every gallery size
+        if self.nlist:
+            return self.nlist
+        return max(1, int(4 * np.sqrt(size)))
+
+    def build(self, matcher):
+        gallery = matcher.gallery
+        size = len(gallery)
+        if size == 0:
+            self.centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+            self._set_lists(matcher, np.zeros(0, dtype=np.int32))
+            return
+
+        # Train on a sample, then assign every row
+        rng = np.random.default_rng(0)
+        sample = gallery if size <= self.train_size else gallery[rng.choice(size, self.train_size, replace=False)]
+        self.centroids, _ = kmeans(sample, self._list_count(size), self.iterations)
+        self._set_lists(matcher, nearest_centroids(gallery, self.centroids))
+
+    def _set_lists(self, matcher, assignments):
+        # Store rows grouped by list so each probed list is one contiguous slice
+        self._order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self._offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self._indexed = len(assignments)
+        self._encode_lists(matcher)
+
+    def _encode_lists(self, matcher):
+        self._vectors = np.ascontiguousarray(matcher.gallery[self._order])
+        self._sq_norms = np.einsum("ij,ij->i", self._vectors, self._vectors)
+
+    def add(self, matcher, start, end):
+        # New rows stay pending until they are a noticeable fraction of the gallery
+        if len(matcher) - self._indexed > self.rebuild_ratio * max(self._indexed, 1):
+            self.build(matcher)
+
+    def _scan_lists(self, matcher, query, query_sq, lists):
+        distances = []
+        rows = []
+        for list_id in lists:
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            if start == end:
+                continue
+            block = self._vectors[start:end]
+            distances.append(query_sq + self._sq_norms[start:end] - 2.0 * (block @ query))
+            rows.append(self._order[start:end])
+        return distances, rows
+
+    def candidates(self, matcher, queries, k):
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        query_sq = np.einsum("ij,ij->i", queries, queries)
+        labels = matcher.labels
+        pending = np.arange(self._indexed, len(matcher))
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        if nprobe:
+            centroid_sq = np.einsum("ij,ij->i", self.centroids, self.centroids)
+            coarse = centroid_sq[None, :] - 2.0 * (queries @ self.centroids.T)
+            probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+
+        out_sq = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            distances, rows = self._scan_lists(matcher, query, query_sq[i], probes[i] if nprobe else [])
+            if len(pending):
+                block = matcher.gallery[pending]
+                distances.append(query_sq[i] + np.einsum("ij,ij->i", block, block) - 2.0 * (block @ query))
+                rows.append(pending)
+            if not rows:
+                continue
+
+            distances = np.maximum(np.concatenate(distances), 0.0)
+            rows = np.concatenate(rows)
+            distances[labels[rows] < 0] = np.inf
+            out_sq[i], out_rows[i] = (part[0] for part in top_k(distances[None, :], rows, k))
+
+        return out_sq, out_rows
+
+    def _arrays(self):
+        return {"centroids": self.centroids, "order": self._order, "offsets": self._offsets}
+
+    def save(self, path, fingerprint):
+        # Write to a temporary file first so a crash never leaves a half-written index
+        tmp_path = path + ".tmp.npz"
+        np.savez(tmp_path, kind=self.kind, fingerprint=fingerprint, **self._arrays())
+        os.replace(tmp_path, path)
+
+    def load(self, path, matcher, fingerprint):
+        # Restore a persisted index, returning False when it is missing or stale
+        if not os.path.exists(path):
+            return False
+        try:
+            with np.load(path) as data:
+                if str(data["kind"]) != self.kind or str(data["fingerprint"]) != fingerprint:
+                    return False
+                self._restore(data)
+        except Exception as e:
+            log.warning("Error loading face index %s: %s", path, e)
+            return False
+
+        self._indexed = len(self._order)
+        self._restore_lists(matcher)
+        return True
+
+    def _restore_lists(self, matcher):
+        self._encode_lists(matcher)
+
+    def _restore(self, data):
+        self.centroids = data["centroids"]
+        self._order = data["order"]
+        self._offsets = data["offsets"]
+
+
+class IVFPQIndex(IVFIndex):
+    """
+    IVF index whose lists hold product-quantized codes (one byte per sub-vector) instead of
+    float32 rows, cutting index memory 32x. The best candidates found with the compact codes
+    are re-ranked with exact distances from the gallery when rerank > 0.
+    """
+
+    kind = "ivfpq"
+
+    def __init__(self, nlist=None, nprobe=8, subquantizers=16, rerank=4, **kwargs):
+        super().__init__(nlist=nlist, nprobe=nprobe, **kwargs)
+        self.subquantizers = subquantizers
+        self.rerank = rerank
+        self.codebooks = np.zeros((subquantizers, 0, ENCODING_SIZE // subquantizers), dtype=np.float32)
+        self._codes = np.zeros((0, subquantizers), dtype=np.uint8)
+
+    def build(self, matcher):
+        gallery = matcher.gallery
+        if len(gallery):
+            # One 256-entry codebook per sub-vector, trained on the same sample as the lists
+            rng = np.random.default_rng(1)
+            sample = gallery if len(gallery) <= self.train_size else gallery[rng.choice(len(gallery), self.train_size, replace=False)]
+            sub_dim = ENCODING_SIZE // self.subquantizers
+            self.codebooks = np.stack([
+                kmeans(sample[:, j * sub_dim:(j + 1) * sub_dim], 256, self.iterations, seed=j)[0]
+                for j in range(self.subquantizers)
+            ])
+        super().build(matcher)
+
+    def _encode_lists(self, matcher):
+        vectors = matcher.gallery[self._order]
+        sub_dim = ENCODING_SIZE // self.subquantizers
+        self._codes = np.empty((len(vectors), self.subquantizers), dtype=np.uint8)
+        for j in range(self.subquantizers):
+            self._codes[:, j] = nearest_centroids(np.ascontiguousarray(vectors[:, j * sub_dim:(j + 1) * sub_dim]),
+                                                  self.codebooks[j])
+
+    def _scan_lists(self, matcher, query, query_sq, lists):
+        # Asymmetric distance: per-query lookup table of sub-vector distances to every code
+        sub_dim = ENCODING_SIZE // self.subquantizers
+        sub_queries = query.reshape(self.subquantizers, 1, sub_dim)
+        table = ((self.codebooks - sub_queries) ** 2).sum(axis=2)
+        columns = np.arange(self.subquantizers)
+
+        distances = []
+        rows = []
+        for list_id in lists:
+            start, end = self._offsets[list_id], self._offsets[list_id + 1]
+            if start == end:
+                continue
+            distances.append(table[columns, self._codes[start:end]].sum(axis=1))
+            rows.append(self._order[start:end])
+        return distances, rows
+
+    def candidates(self, matcher, queries, k):
+        if not self.rerank:
+            return super().candidates(matcher, queries, k)
+
+        # Shortlist with approximate distances, then re-rank exactly against the gallery
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        _, shortlist = super().candidates(matcher, queries, k * self.rerank)
+        out_sq = np.full((len(queries), k), np.inf, dtype=np.float32)
+        out_rows = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, query in enumerate(queries):
+            rows = shortlist[i][shortlist[i] >= 0]
+            if not len(rows):
+                continue
+            block = matcher.gallery[rows]
+            distances = np.maximum(((block - query) ** 2).sum(axis=1), 0.0)
+            out_sq[i], out_rows[i] = (part[0] for part in top_k(distances[None, :], rows, k))
+        return out_sq, out_rows
+
+    def _arrays(self):
+        arrays = super()._arrays()
+        arrays["codebooks"] = self.codebooks
+        arrays["codes"] = self._codes
+        return arrays
+
+    def _restore(self, data):
+        super()._restore(data)
+        self.codebooks = data["codebooks"]
+        self._codes = data["codes"]
+        self.subquantizers = len(self.codebooks)
+
+    def _restore_lists(self, matcher):
+        # Codes were persisted with the index, nothing to recompute
+        pass
+
+
+# Galleries at least this large use the IVF index when the index kind is "auto"
+AUTO_IVF_THRESHOLD = 20000
+
+
+def make_index(kind="auto", gallery_size=0):
+    """ Create an index by name: "exact", "ivf", "ivfpq" or "auto". """
+    if kind == "auto":
+        kind = "ivf" if gallery_size >= AUTO_IVF_THRESHOLD else "exact"
+    if kind == "exact":
+        return BruteForceIndex()
+    if kind == "ivf":
+        return IVFIndex()
+    if kind == "ivfpq":
+        return IVFPQIndex()
+    raise ValueError(f"Unknown face index kind: {kind}")
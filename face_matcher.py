@@ -0,0 +1,259 @@
+# face_matcher.py
+import threading
+from collections import namedtuple
+import numpy as np
+from face_store import ENCODING_SIZE
+from face_index import BruteForceIndex, gallery_fingerprint
+
+# Default tolerance used by face_recognition.compare_faces
+DEFAULT_TOLERANCE = 0.6
+
+# Result of matching one face against the gallery.
+# identity is the integer id of the best identity (-1 for an empty gallery), margin is the gap
+# between the best distance and the closest row belonging to a different identity.
+MatchResult = namedtuple("MatchResult", ["identity", "matric", "name", "distance", "margin", "is_match"])
+
+
+class FaceMatcher:
+    """ Gallery of known encodings held as one preallocated float32 matrix, matched in batches. """
+
+    def __init__(self, tolerance=DEFAULT_TOLERANCE, capacity=1024, index=None, candidates=16, compaction=None):
+        self.tolerance = tolerance
+
+        # Optional (encodings, labels) -> (prototypes, labels) reduction applied to everything added
+        self.compaction = compaction
+
+        # Nearest-neighbour index used for search and how many candidates it returns per face
+        self.index = index if index is not None else BruteForceIndex()
+        self.candidates = candidates
+
+        # Gallery rows, their squared norms and the identity id each row belongs to
+        self._gallery = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        self._sq_norms = np.zeros(capacity, dtype=np.float32)
+        self._labels = np.full(capacity, -1, dtype=np.int32)
+        self._size = 0
+
+        # Identity lookup table, indexed by identity id
+        self.identities = []
+        self._identity_ids = {}
+
+        # Rows of removed students are tombstoned (label -1) until the gallery is compacted
+        self._removed = 0
+        self.compact_ratio = 0.25
+
+        # Guards the gallery so it can be edited by a sync thread while frames are being matched
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_arrays(cls, gallery, sq_norms, labels, identities, tolerance=DEFAULT_TOLERANCE):
+        """
+        Read-only matcher over existing gallery arrays, e.g. views of shared memory, without
+        copying them. Only matching is supported; the arrays must not be added to or removed from.
+        """
+        matcher = cls(tolerance=tolerance, capacity=1)
+        matcher._gallery, matcher._sq_norms, matcher._labels = gallery, sq_norms, labels
+        matcher._size = len(gallery)
+        matcher.identities = list(identities)
+        matcher._identity_ids = {matric: identity for identity, (matric, _) in enumerate(matcher.identities)}
+        return matcher
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def gallery(self):
+        # View of the populated part of the gallery
+        return self._gallery[:self._size]
+
+    @property
+    def labels(self):
+        return self._labels[:self._size]
+
+    def fingerprint(self):
+        return gallery_fingerprint(self.gallery, self.labels)
+
+    def set_index(self, index, path=None):
+        """ Switch to another index, reusing the copy persisted at path when it matches this gallery. """
+        with self._lock:
+            fingerprint = self.fingerprint() if path else None
+            if path is None or not index.load(path, self, fingerprint):
+                index.build(self)
+                if path is not None:
+                    index.save(path, fingerprint)
+            self.index = index
+
+    def identity_id(self, matric, name):
+        # Return the integer id for a student, registering it on first use
+        identity = self._identity_ids.get(matric)
+        if identity is None:
+            identity = len(self.identities)
+            self.identities.append((matric, name))
+            self._identity_ids[matric] = identity
+        elif self.identities[identity][1] != name:
+            self.identities[identity] = (matric, name)
+        return identity
+
+    def clear(self):
+        with self._lock:
+            self._size = 0
+            self._removed = 0
+            self.identities = []
+            self._identity_ids = {}
+            self.index.build(self)
+
+    def remove_identity(self, matric):
+        # Tombstone every row of a student; returns the number of rows removed
+        with self._lock:
+            identity = self._identity_ids.get(matric)
+            if identity is None:
+                return 0
+            rows = self._labels[:self._size] == identity
+            count = int(rows.sum())
+            self._labels[:self._size][rows] = -1
+            self._removed += count
+            if self._removed > self.compact_ratio * self._size:
+                self._compact()
+            return count
+
+    def replace_identity(self, matric, name, encodings):
+        # Swap in a student's current encodings (an empty list just removes them)
+        with self._lock:
+            self.remove_identity(matric)
+            if len(encodings):
+                self.add(encodings, matric, name)
+
+    def _compact(self):
+        # Drop tombstoned rows and rebuild the index over the remaining gallery
+        keep = np.flatnonzero(self._labels[:self._size] >= 0)
+        count = len(keep)
+        self._gallery[:count] = self._gallery[keep]
+        self._sq_norms[:count] = self._sq_norms[keep]
+        self._labels[:count] = self._labels[keep]
+        self._labels[count:self._size] = -1
+        self._size = count
+        self._removed = 0
+        self.index.build(self)
+
+    def _reserve(self, count):
+        # Grow the preallocated arrays geometrically so appends stay amortised O(1)
+        required = self._size + count
+        capacity = len(self._gallery)
+        if required <= capacity:
+            return
+
+        while capacity < required:
+            capacity *= 2
+
+        gallery = np.zeros((capacity, ENCODING_SIZE), dtype=np.float32)
+        gallery[:self._size] = self._gallery[:self._size]
+        sq_norms = np.zeros(capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        labels = np.full(capacity, -1, dtype=np.int32)
+        labels[:self._size] = self._labels[:self._size]
+
+        self._gallery, self._sq_norms, self._labels = gallery, sq_norms, labels
+
+    def add(self, encodings, matric, name):
+        # Add one or more encodings belonging to a single student
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            identity = self.identity_id(matric, name)
+            self._append(encodings, np.full(len(encodings), identity, dtype=np.int32))
+
+    def add_many(self, encodings, matrics, names):
+        # Add a whole gallery at once, with one matric/name per encoding row
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            labels = np.fromiter((self.identity_id(matric, name) for matric, name in zip(matrics, names)),
+                                 dtype=np.int32, count=len(encodings))
+            self._append(encodings, labels)
+
+    def add_gallery(self, encodings, labels, identities):
+        # Add a gallery whose rows are labelled with indexes into identities, a list of (matric, name)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        with self._lock:
+            ids = np.array([self.identity_id(matric, name) for matric, name in identities], dtype=np.int32)
+            self._append(encodings, ids[np.asarray(labels, dtype=np.int64)])
+
+    def _append(self, encodings, labels):
+        if self.compaction is not None and len(encodings):
+            encodings, labels = self.compaction(encodings, labels)
+        count = len(encodings)
+        if count == 0:
+            return
+        self._reserve(count)
+        start, end = self._size, self._size + count
+        self._gallery[start:end] = encodings
+        self._sq_norms[start:end] = np.einsum("ij,ij->i", encodings, encodings)
+        self._labels[start:end] = labels
+        self._size = end
+        self.index.add(self, start, end)
+
+    def squared_distances(self, face_encodings):
+        # (M, N) squared euclidean distances using one matmul: |q|^2 + |g|^2 - 2 q.g
+        queries = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        gallery = self._gallery[:self._size]
+        query_sq = np.einsum("ij,ij->i", queries, queries)
+        sq_distances = query_sq[:, None] + self._sq_norms[None, :self._size] - 2.0 * (queries @ gallery.T)
+        np.maximum(sq_distances, 0.0, out=sq_distances)
+        return sq_distances
+
+    def match(self, face_encodings):
+        """ Match every face in a frame in one batch, returning a MatchResult per face. """
+        with self._lock:
+            return self._match(face_encodings)
+
+    def _match(self, face_encodings):
+        face_count = len(face_encodings)
+        if face_count == 0:
+            return []
+        if self._size == 0:
+            return [MatchResult(-1, None, "Unknown", np.inf, np.inf, False)] * face_count
+        if not self.index.exhaustive:
+            return self._match_candidates(face_encodings)
+
+        sq_distances = self.squared_distances(face_encodings)
+        labels = self._labels[:self._size]
+        rows = np.arange(face_count)
+        if self._removed:
+            sq_distances[:, labels < 0] = np.inf
+
+        best_rows = sq_distances.argmin(axis=1)
+        best_sq = sq_distances[rows, best_rows]
+        best_labels = labels[best_rows]
+
+        # Closest row belonging to any other identity gives the decision margin
+        other_sq = np.where(labels[None, :] == best_labels[:, None], np.inf, sq_distances).min(axis=1)
+
+        best = np.sqrt(best_sq)
+        margins = np.sqrt(other_sq) - best
+        return [self._result(identity, distance, margin)
+                for identity, distance, margin in zip(best_labels.tolist(), best.tolist(), margins.tolist())]
+
+    def _match_candidates(self, face_encodings):
+        # Approximate search: the margin is taken from the first candidate of another identity
+        sq_distances, rows = self.index.candidates(self, face_encodings, self.candidates)
+        labels = self._labels[:self._size]
+
+        results = []
+        for face_sq, face_rows in zip(sq_distances, rows):
+            if face_rows[0] < 0:
+                results.append(MatchResult(-1, None, "Unknown", np.inf, np.inf, False))
+                continue
+
+            valid = face_rows >= 0
+            face_labels = labels[face_rows[valid]]
+            identity = int(face_labels[0])
+            distance = float(np.sqrt(face_sq[0]))
+            others = np.flatnonzero(face_labels != identity)
+            margin = float(np.sqrt(face_sq[valid][others[0]])) - distance if len(others) else np.inf
+            results.append(self._result(identity, distance, margin))
+        return results
+
+    def _result(self, identity, distance, margin):
+        if identity < 0:
+            return MatchResult(-1, None, "Unknown", np.inf, np.inf, False)
+        matric, name = self.identities[identity]
+        if distance <= self.tolerance:
+            return MatchResult(identity, matric, name, distance, margin, True)
+        return MatchResult(identity, None, "Unknown", distance, margin, False)
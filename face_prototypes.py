@@ -0,0 +1,73 @@
+# face_prototypes.py
+"""
+Per-student gallery compaction.
+
+Instead of one gallery row per enrolment image, each student can be represented by the mean
+of their encodings ("centroid") or by up to k of their own encodings chosen as k-medoids
+("medoids"), which keeps distinct looks (glasses, pose, lighting) apart.
+"""
+import numpy as np
+
+GALLERY_MODES = ("full", "centroid", "medoids")
+
+
+def centroids(encodings, labels):
+    """ One mean encoding per label; returns (prototypes, prototype_labels). """
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    sums = np.add.reduceat(encodings[order].astype(np.float64), starts, axis=0)
+    counts = np.diff(np.r_[starts, len(order)])
+    return (sums / counts[:, None]).astype(np.float32), sorted_labels[starts].astype(np.int32)
+
+
+def _medoids(points, k, iterations=10):
+    # Indices of k medoids: farthest-point initialisation, then alternate assignment and medoid update
+    sq = np.einsum("ij,ij->i", points, points)
+    distances = np.sqrt(np.maximum(sq[:, None] + sq[None, :] - 2.0 * points @ points.T, 0.0))
+
+    chosen = [int(distances.sum(axis=1).argmin())]
+    while len(chosen) < k:
+        chosen.append(int(distances[:, chosen].min(axis=1).argmax()))
+    chosen = np.array(chosen)
+
+    for _ in range(iterations):
+        assignment = distances[:, chosen].argmin(axis=1)
+        updated = chosen.copy()
+        for cluster in range(k):
+            members = np.flatnonzero(assignment == cluster)
+            if len(members):
+                updated[cluster] = members[distances[np.ix_(members, members)].sum(axis=1).argmin()]
+        if np.array_equal(updated, chosen):
+            break
+        chosen = updated
+    return chosen
+
+
+def medoids(encodings, labels, k=3):
+    """ Up to k representative encodings per label; returns (prototypes, prototype_labels). """
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.flatnonzero(np.r_[True, sorted_labels[1:] != sorted_labels[:-1]])
+    ends = np.r_[starts[1:], len(order)]
+
+    keep = []
+    for start, end in zip(starts, ends):
+        rows = order[start:end]
+        if len(rows) <= k:
+            keep.extend(rows)
+        else:
+            keep.extend(rows[_medoids(encodings[rows].astype(np.float64), k)])
+    keep = np.array(sorted(keep), dtype=np.int64)
+    return encodings[keep], labels[keep].astype(np.int32)
+
+
+def make_compaction(mode, k=3):
+    """ Return a function (encodings, labels) -> (encodings, labels) for a gallery mode, or None for "full". """
+    if mode == "full":
+        return None
+    if mode == "centroid":
+        return centroids
+    if mode == "medoids":
+        return lambda encodings, labels: medoids(encodings, labels, k)
+    raise ValueError(f"Unknown gallery mode: {mode}")
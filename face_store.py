@@ -0,0 +1,204 @@
+# face_store.py
+import logging
+import os
+import numpy as np
+import database
+import image_store
+from metrics import NULL_METRICS
+
+log = logging.getLogger(__name__)
+
+# Size of the face embedding produced by the dlib ResNet model
+ENCODING_SIZE = 128
+
+
+class EncodingStore:
+    """ Persistent cache of face encodings keyed by image path, modification time and file size. """
+
+    def __init__(self, db_path, metrics=NULL_METRICS):
+        self.db_path = db_path
+        self.metrics = metrics
+
+    def ensure_schema(self, conn):
+        # The face_encodings table is part of the versioned schema
+        database.migrate_connection(conn)
+
+    def write_encodings(self, conn, rows):
+        # rows are (image_path, matric_number, mtime_ns, size, encoding blob or None); caller commits
+        conn.executemany("INSERT OR REPLACE INTO face_encodings (image_path, matric_number, mtime_ns, size, encoding) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+
+    def encode_image(self, image_path, location=None):
+        # Run the detector and embedder on a single image, returning a float32 vector or None;
+        # with a known face location (managed crops) the detector is skipped. face_recognition is
+        # imported here, so tools that only read cached encodings never load dlib.
+        import face_recognition
+
+        try:
+            image = face_recognition.load_image_file(image_store.open_image(image_path))
+            encodings = face_recognition.face_encodings(image, None if location is None else [location])
+        except Exception as e:
+            log.warning("Error encoding image %s: %s", image_path, e)
+            self.metrics.increment("encode_errors")
+            return None
+
+        if not encodings:
+            return None
+        return np.asarray(encodings[0], dtype=np.float32)
+
+    def add_image(self, matric, image_path, encoding=None):
+        # Encode (unless an encoding is supplied) and persist a freshly captured image
+        if encoding is None:
+            encoding = self.encode_image(image_path)
+        else:
+            encoding = np.asarray(encoding, dtype=np.float32)
+        stat = os.stat(image_store.split_ref(image_path)[0])
+        blob = None if encoding is None else encoding.tobytes()
+
+        conn = database.connect(self.db_path)
+        try:
+            self.ensure_schema(conn)
+            with conn:
+                self.write_encodings(conn, [(image_path, matric, stat.st_mtime_ns, stat.st_size, blob)])
+        finally:
+            conn.close()
+
+        return encoding
+
+    def clear(self):
+        # Drop every cached encoding so the next load re-encodes all images
+        conn = database.connect(self.db_path)
+        try:
+            self.ensure_schema(conn)
+            with conn:
+                conn.execute("DELETE FROM face_encodings")
+        finally:
+            conn.close()
+
+    def student_images(self, conn, matric=None):
+        # {matric: [(image_path, content_hash), ...]} from student_images (only matric's, if given),
+        # in capture order. Older captures reused file names, so a path recorded twice is only listed once.
+        where = "" if matric is None else "WHERE matric_number = ?"
+        images = {}
+        listed = set()
+        for matric, image_path, digest in conn.execute(
+                f"SELECT matric_number, image_path, content_hash FROM student_images {where} "
+                "ORDER BY matric_number, id", () if matric is None else (matric,)):
+            if (matric, image_path) not in listed:
+                listed.add((matric, image_path))
+                images.setdefault(matric, []).append((image_path, digest))
+        return images
+
+    def load_gallery(self, progress=None):
+        """
+        Return (encodings, labels, identities) for every enrolled image.
+
+        encodings is a contiguous (N, 128) float32 matrix and labels an int32 array giving, for
+        each row, the index of its student in identities, a list of (matric, name). Images are
+        the ones recorded in student_images; only students with none recorded fall back to the
+        image files in their folder. Managed crops never change, so their cached encodings are
+        used without touching the file; other images are re-encoded when new or when their
+        mtime/size changed since they were cached.
+        progress, if given, is called with (students done, total students) as the load goes.
+        """
+        conn = database.connect(self.db_path)
+        try:
+            self.ensure_schema(conn)
+            cursor = conn.cursor()
+            cursor.execute("SELECT matric_number, name, image_path FROM students")
+            students = cursor.fetchall()
+            recorded = self.student_images(conn)
+
+            cursor.execute("SELECT image_path, mtime_ns, size, encoding FROM face_encodings")
+            cached = {row[0]: row[1:] for row in cursor.fetchall()}
+
+            blobs = []
+            labels = []
+            identities = []
+            updates = []
+            seen = set()
+
+            for done, (matric, name, image_folder) in enumerate(students):
+                if progress is not None:
+                    progress(done, len(students))
+                student_blobs = self._student_blobs(matric, image_folder, recorded.get(matric), cached, seen, updates)
+                if student_blobs:
+                    blobs.extend(student_blobs)
+                    labels.extend([len(identities)] * len(student_blobs))
+                    identities.append((matric, name))
+
+            # Persist new encodings and forget images that no longer exist in a single transaction
+            if progress is not None:
+                progress(len(students), len(students))
+            stale = [(path,) for path in cached if path not in seen]
+            with conn:
+                self.write_encodings(conn, updates)
+                conn.executemany("DELETE FROM face_encodings WHERE image_path = ?", stale)
+        finally:
+            conn.close()
+
+        encodings = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        return encodings, np.array(labels, dtype=np.int32), identities
+
+    def load_student(self, conn, matric):
+        """
+        Return (name, encodings) for one student, built from the same images as load_gallery,
+        or None if the student is not registered. Images that had to be encoded are cached.
+        conn must already be at the current schema.
+        """
+        student = conn.execute("SELECT name, image_path FROM students WHERE matric_number = ?", (matric,)).fetchone()
+        if student is None:
+            return None
+        name, image_folder = student
+        cached = {row[0]: row[1:] for row in conn.execute(
+            "SELECT image_path, mtime_ns, size, encoding FROM face_encodings WHERE matric_number = ?", (matric,))}
+
+        updates = []
+        blobs = self._student_blobs(matric, image_folder, self.student_images(conn, matric).get(matric), cached,
+                                    set(), updates)
+        if updates:
+            with conn:
+                self.write_encodings(conn, updates)
+        return name, np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+
+    def _student_blobs(self, matric, image_folder, images, cached, seen, updates):
+        # Encoding blobs for one student's images: the recorded ones, or the image files in their
+        # folder when none are recorded. Paths still in use are added to seen, and encodings that
+        # had to be computed to updates.
+        if images is None:
+            if not image_folder or not os.path.isdir(image_folder):
+                return []
+            images = [(os.path.join(image_folder, img_name), None) for img_name in sorted(os.listdir(image_folder))
+                      if img_name.lower().endswith(image_store.IMAGE_EXTENSIONS)]
+
+        blobs = []
+        for img_path, digest in images:
+            entry = cached.get(img_path)
+            if digest is not None:
+                if entry is not None:
+                    seen.add(img_path)
+                    blob = entry[2]
+                else:
+                    encoding = self.encode_image(img_path, image_store.FACE_BOX)
+                    blob = None if encoding is None else encoding.tobytes()
+                    if encoding is not None or os.path.exists(image_store.split_ref(img_path)[0]):
+                        seen.add(img_path)
+                        updates.append((img_path, matric, 0, 0, blob))
+            else:
+                try:
+                    stat = os.stat(img_path)
+                except OSError:
+                    # Recorded but gone; python -m image_store check --fix tidies these up
+                    continue
+                seen.add(img_path)
+                if entry is not None and entry[0] == stat.st_mtime_ns and entry[1] == stat.st_size:
+                    blob = entry[2]
+                else:
+                    # New or modified image, encode it once and remember the result
+                    encoding = self.encode_image(img_path)
+                    blob = None if encoding is None else encoding.tobytes()
+                    updates.append((img_path, matric, stat.st_mtime_ns, stat.st_size, blob))
+
+            if blob is not None:
+                blobs.append(blob)
+        return blobs
@@ -0,0 +1,209 @@
+# face_tracker.py
+import itertools
+import threading
+import time
+import cv2
+import face_recognition
+
+
+def detect_faces(frame, scale=1.0, upsample=1, timings=None):
+    """
+    Run the HOG detector on a downscaled RGB copy of a BGR frame and map boxes back to full resolution.
+    When a timings dict is given, the seconds spent converting and detecting are added to it.
+    """
+    start = time.perf_counter()
+    if scale != 1.0:
+        small = cv2.resize(frame, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    else:
+        small = frame
+    rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    converted = time.perf_counter()
+    locations = face_recognition.face_locations(rgb_small, number_of_times_to_upsample=upsample)
+    if timings is not None:
+        timings["convert"] = timings.get("convert", 0.0) + converted - start
+        timings["detect"] = time.perf_counter() - converted
+
+    height, width = frame.shape[:2]
+    return [(max(0, int(top / scale)), min(width, int(right / scale)),
+             min(height, int(bottom / scale)), max(0, int(left / scale)))
+            for top, right, bottom, left in locations]
+
+
+def iou(a, b):
+    # Intersection over union of two (top, right, bottom, left) boxes
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    if intersection == 0:
+        return 0.0
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    return intersection / float(area_a + area_b - intersection)
+
+
+def associate(boxes, track_boxes, threshold):
+    """ Greedy IoU association, returning {box index: track index} for pairs above threshold. """
+    pairs = sorted(((iou(box, track_box), i, j)
+                    for i, box in enumerate(boxes)
+                    for j, track_box in enumerate(track_boxes)), reverse=True)
+    assigned = {}
+    used_tracks = set()
+    for score, i, j in pairs:
+        if score < threshold:
+            break
+        if i in assigned or j in used_tracks:
+            continue
+        assigned[i] = j
+        used_tracks.add(j)
+    return assigned
+
+
+def detect_and_encode_new(frame, scale, upsample, known_boxes, iou_threshold):
+    """
+    Detection task for the worker pool: detect on a downscaled copy, then encode only the faces
+    that do not overlap an already settled track. Encodings are None for those reused faces.
+    Also returns the seconds spent per stage, since a worker process cannot record them itself.
+    """
+    timings = {}
+    locations = detect_faces(frame, scale, upsample, timings)
+    reused = associate(locations, known_boxes, iou_threshold)
+    new_locations = [location for i, location in enumerate(locations) if i not in reused]
+
+    encodings = [None] * len(locations)
+    if new_locations:
+        start = time.perf_counter()
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        converted = time.perf_counter()
+        new_encodings = iter(face_recognition.face_encodings(rgb_frame, new_locations))
+        encodings = [None if i in reused else next(new_encodings) for i in range(len(locations))]
+        timings["convert"] += converted - start
+        timings["encode"] = time.perf_counter() - converted
+    return locations, encodings, timings
+
+
+def create_opencv_tracker():
+    # Cheapest single-object tracker available in this OpenCV build, or None
+    for module in (getattr(cv2, "legacy", None), cv2):
+        if module is None:
+            continue
+        for name in ("TrackerMOSSE_create", "TrackerKCF_create", "TrackerMIL_create"):
+            factory = getattr(module, name, None)
+            if factory is not None:
+                return factory()
+    return None
+
+
+class Track:
+    """ A face followed across frames, carrying the identity assigned when it was first encoded. """
+
+    def __init__(self, track_id, location):
+        self.track_id = track_id
+        self.location = location
+        self.match = None
+        self.attempts = 0
+        self.misses = 0
+        self.opencv_tracker = None
+
+    @property
+    def identified(self):
+        return self.match is not None and self.match.is_match
+
+
+class FaceTracker:
+    """
+    Runs detection only on every detect_interval-th frame (on a copy downscaled by detect_scale)
+    and keeps faces between detections as tracks. Tracks are re-associated by IoU on each detection
+    so identified students are not re-encoded; a face that stays unknown is encoded at most
+    max_attempts times while it is tracked. With mode "opencv" boxes also follow the face on
+    every displayed frame using an OpenCV tracker.
+    """
+
+    def __init__(self, detect_interval=5, detect_scale=0.5, upsample=1, iou_threshold=0.3, max_misses=1, mode="iou",
+                 max_attempts=3):
+        self.detect_interval = detect_interval
+        self.detect_scale = detect_scale
+        self.upsample = upsample
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.mode = mode
+        self.max_attempts = max_attempts
+
+        self.tracks = []
+        self._last_detect_id = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def make_task(self, packet):
+        # Pipeline hook: a detection task every detect_interval frames, None to skip the frame
+        if self._last_detect_id is not None and packet.frame_id - self._last_detect_id < self.detect_interval:
+            return None
+        self._last_detect_id = packet.frame_id
+
+        with self._lock:
+            known_boxes = [track.location for track in self.tracks if self.settled(track)]
+        return detect_and_encode_new, (packet.frame, self.detect_scale, self.upsample, known_boxes, self.iou_threshold)
+
+    def update(self, locations, encodings, frame=None):
+        """ Apply a detection result, returning [(track, encoding)] for faces that still need matching. """
+        with self._lock:
+            assigned = associate(locations, [track.location for track in self.tracks], self.iou_threshold)
+            matched_tracks = set(assigned.values())
+
+            # Age out tracks that were not detected again
+            survivors = []
+            for j, track in enumerate(self.tracks):
+                if j in matched_tracks:
+                    track.misses = 0
+                    survivors.append(track)
+                else:
+                    track.misses += 1
+                    if track.misses <= self.max_misses:
+                        survivors.append(track)
+
+            pending = []
+            for i, location in enumerate(locations):
+                if i in assigned:
+                    track = self.tracks[assigned[i]]
+                else:
+                    track = Track(next(self._ids), location)
+                    survivors.append(track)
+                track.location = location
+
+                # Faces without an identity yet are matched by the caller
+                if not self.settled(track) and encodings[i] is not None:
+                    track.attempts += 1
+                    pending.append((track, encodings[i]))
+
+                if self.mode == "opencv" and frame is not None:
+                    self._start_opencv_tracker(track, frame)
+
+            self.tracks = survivors
+            return pending
+
+    def settled(self, track):
+        # Identified, or unknown after max_attempts encodings, so the face is not encoded again
+        return track.identified or track.attempts >= self.max_attempts
+
+    def _start_opencv_tracker(self, track, frame):
+        top, right, bottom, left = track.location
+        track.opencv_tracker = create_opencv_tracker()
+        if track.opencv_tracker is not None:
+            track.opencv_tracker.init(frame, (left, top, right - left, bottom - top))
+
+    def follow(self, frame):
+        # Move boxes with the OpenCV trackers between detections ("opencv" mode only)
+        if self.mode != "opencv":
+            return
+        with self._lock:
+            for track in self.tracks:
+                if track.opencv_tracker is None:
+                    continue
+                ok, (x, y, w, h) = track.opencv_tracker.update(frame)
+                if ok:
+                    track.location = (int(y), int(x + w), int(y + h), int(x))
+
+    def overlays(self):
+        # (location, name, is_match) for every live track
+        with self._lock:
+            return [(track.location, track.match.name if track.match else "Unknown", track.identified)
+                    for track in self.tracks]
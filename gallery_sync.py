@@ -0,0 +1,71 @@
+# gallery_sync.py
+import logging
+import threading
+from face_store import EncodingStore
+import database
+from metrics import NULL_METRICS
+
+log = logging.getLogger(__name__)
+
+
+def latest_change_id(conn):
+    return conn.execute("SELECT COALESCE(MAX(id), 0) FROM enrolment_changes").fetchone()[0]
+
+
+class GallerySync(threading.Thread):
+    """
+    Keeps a running FaceMatcher in step with enrolment changes.
+
+    Polls the enrolment_changes table and, for each student touched since the last poll, swaps
+    in just that student's encodings (or removes them), loaded from the same images as the full
+    gallery load. Database reads happen on this thread; the matcher is only locked for the
+    in-memory update.
+    """
+
+    def __init__(self, db_path, matcher, since_id, interval=1.0, metrics=NULL_METRICS):
+        super().__init__(name="GallerySync", daemon=True)
+        self.db_path = db_path
+        self.matcher = matcher
+        self.store = EncodingStore(db_path, metrics)
+        self.last_id = since_id
+        self.interval = interval
+        self.metrics = metrics
+        self.applied = 0
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def poll(self, conn):
+        # Apply every change recorded after last_id, returning how many students were updated
+        rows = conn.execute("SELECT id, matric_number FROM enrolment_changes WHERE id > ? ORDER BY id",
+                            (self.last_id,)).fetchall()
+        if not rows:
+            return 0
+        self.last_id = rows[-1][0]
+
+        # Several changes to one student collapse into a single reload of their current state
+        matrics = list(dict.fromkeys(matric for _, matric in rows))
+        for matric in matrics:
+            student = self.store.load_student(conn, matric)
+            if student is None:
+                self.matcher.remove_identity(matric)
+                continue
+            name, encodings = student
+            self.matcher.replace_identity(matric, name, encodings)
+
+        self.applied += len(matrics)
+        return len(matrics)
+
+    def run(self):
+        conn = database.connect(self.db_path)
+        try:
+            while not self._stop_event.wait(self.interval):
+                try:
+                    self.poll(conn)
+                except Exception:
+                    log.exception("Error syncing gallery")
+                    self.metrics.increment("sync_errors")
+        finally:
+            conn.close()
@@ -0,0 +1,372 @@
+# image_store.py
+"""
+Managed storage for enrolment images.
+
+Instead of whole webcam frames, the store keeps one aligned, fixed-size face crop per sample:
+the face is rotated so the eyes are level and scaled so the detector's box always lands on
+FACE_BOX, which lets the crop be re-encoded without running the detector again. Crops are
+JPEG files named after a hash of their bytes inside the student's folder, so an identical
+sample is stored once, and a stored crop never changes; student_images records the hash.
+
+A student's crops can be packed into one zip file (pack()), after which their image paths
+become '<folder>/crops.zip::<hash>.jpg' references; read_bytes() and split_ref() resolve both
+forms. reconcile() compares the folders with the student_images table.
+
+    python -m image_store check [--fix]
+    python -m image_store pack
+    python -m image_store convert
+    python -m image_store usage
+"""
+import argparse
+import hashlib
+import io
+import logging
+import os
+import zipfile
+import numpy as np
+import database
+import validation
+
+log = logging.getLogger(__name__)
+
+IMAGE_ROOT = "student_images"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Crop geometry: the detected face box is scaled to half the crop and centred in it
+CROP_SIZE = 200
+FACE_BOX = (CROP_SIZE // 4, CROP_SIZE * 3 // 4, CROP_SIZE * 3 // 4, CROP_SIZE // 4)
+JPEG_QUALITY = 90
+
+PACK_NAME = "crops.zip"
+PACK_SEPARATOR = "::"
+
+
+def split_ref(image_path):
+    # (file on disk, member inside a pack or None) for a stored image path
+    if PACK_SEPARATOR in image_path:
+        pack_path, member = image_path.split(PACK_SEPARATOR, 1)
+        return pack_path, member
+    return image_path, None
+
+
+def read_bytes(image_path):
+    """ Encoded bytes of a loose or packed image. """
+    path, member = split_ref(image_path)
+    if member is None:
+        with open(path, "rb") as image_file:
+            return image_file.read()
+    with zipfile.ZipFile(path) as pack:
+        return pack.read(member)
+
+
+def open_image(image_path):
+    # File object for decoders such as face_recognition.load_image_file
+    path, member = split_ref(image_path)
+    if member is None:
+        return path
+    return io.BytesIO(read_bytes(image_path))
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def eye_angle(image, location):
+    # Degrees the face is rolled by, from the 5-point landmarks; 0 when they cannot be found
+    import face_recognition
+
+    landmarks = face_recognition.face_landmarks(image, [location], model="small")
+    if not landmarks:
+        return 0.0
+    left_eye = np.mean(landmarks[0]["left_eye"], axis=0)
+    right_eye = np.mean(landmarks[0]["right_eye"], axis=0)
+    if left_eye[0] > right_eye[0]:
+        left_eye, right_eye = right_eye, left_eye
+    dy, dx = right_eye[1] - left_eye[1], right_eye[0] - left_eye[0]
+    return float(np.degrees(np.arctan2(dy, dx)))
+
+
+def align_crop(image, location, angle=None):
+    """
+    Return the CROP_SIZE x CROP_SIZE crop of image around location (top, right, bottom, left),
+    rotated so the eyes are level. image is grayscale or RGB.
+    """
+    import cv2
+
+    if angle is None:
+        angle = eye_angle(image, location)
+    top, right, bottom, left = location
+    centre = ((left + right) / 2.0, (top + bottom) / 2.0)
+    box_side = max(right - left, bottom - top, 1)
+    scale = (FACE_BOX[1] - FACE_BOX[3]) / float(box_side)
+
+    matrix = cv2.getRotationMatrix2D(centre, angle, scale)
+    matrix[0, 2] += CROP_SIZE / 2.0 - centre[0]
+    matrix[1, 2] += CROP_SIZE / 2.0 - centre[1]
+    return cv2.warpAffine(image, matrix, (CROP_SIZE, CROP_SIZE), flags=cv2.INTER_AREA,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+
+def encode_crop(crop, rgb=False):
+    # JPEG bytes of a crop; RGB crops are converted to the BGR order OpenCV writes
+    import cv2
+
+    if rgb and crop.ndim == 3:
+        crop = cv2.cvtColor(crop, cv2.COLOR_RGB2BGR)
+    ok, buffer = cv2.imencode(".jpg", crop, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Could not encode face crop")
+    return buffer.tobytes()
+
+
+def write_crop(folder, data):
+    """ Write crop bytes into folder under their content hash; returns (path, hash). """
+    digest = content_hash(data)
+    path = os.path.join(folder, f"{digest}.jpg")
+    if not os.path.exists(path):
+        os.makedirs(folder, exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as crop_file:
+            crop_file.write(data)
+        os.replace(temp_path, path)
+    return path, digest
+
+
+def folder_usage(folder):
+    # (files, bytes) under folder
+    files = 0
+    size = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            files += 1
+            size += os.path.getsize(os.path.join(root, name))
+    return files, size
+
+
+class ImageStore:
+    """ Adds, packs and checks the enrolment images of every student under root. """
+
+    def __init__(self, root=IMAGE_ROOT):
+        self.root = root
+
+    def folder(self, matric):
+        return os.path.join(self.root, validation.sanitize_matric(matric))
+
+    def add(self, conn, matric, image, location, angle=None, rgb=False):
+        """
+        Store the aligned crop of the face at location in image for matric. Returns
+        (image path, True) for a new crop, or (path of the identical stored crop, False).
+        The caller commits.
+        """
+        data = encode_crop(align_crop(image, location, angle), rgb)
+        digest = content_hash(data)
+        existing = conn.execute("SELECT image_path FROM student_images WHERE matric_number = ? AND content_hash = ?",
+                                (matric, digest)).fetchone()
+        if existing is not None:
+            return existing[0], False
+
+        path, _ = write_crop(self.folder(matric), data)
+        conn.execute("INSERT INTO student_images (matric_number, image_path, content_hash) VALUES (?, ?, ?)",
+                     (matric, path, digest))
+        return path, True
+
+    def pack(self, conn, matric):
+        """ Move matric's loose crops into the student's pack file; returns how many were packed. """
+        loose = conn.execute(f"""
+            SELECT id, image_path, content_hash FROM student_images
+            WHERE matric_number = ? AND content_hash IS NOT NULL AND image_path NOT LIKE '%{PACK_SEPARATOR}%'
+        """, (matric,)).fetchall()
+        if not loose:
+            return 0
+
+        folder = self.folder(matric)
+        pack_path = os.path.join(folder, PACK_NAME)
+        temp_path = pack_path + ".tmp"
+        packed = []
+        # Rewrite the pack next to the old one and swap it in, so readers never see a partial file
+        with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_STORED) as new_pack:
+            if os.path.exists(pack_path):
+                with zipfile.ZipFile(pack_path) as old_pack:
+                    for member in old_pack.namelist():
+                        new_pack.writestr(member, old_pack.read(member))
+                existing = set(new_pack.namelist())
+            else:
+                existing = set()
+            for row_id, image_path, digest in loose:
+                member = f"{digest}.jpg"
+                try:
+                    if member not in existing:
+                        new_pack.write(image_path, member)
+                        existing.add(member)
+                except OSError as e:
+                    log.warning("Error packing image %s: %s", image_path, e)
+                    continue
+                packed.append((row_id, image_path, f"{pack_path}{PACK_SEPARATOR}{member}"))
+        os.replace(temp_path, pack_path)
+
+        with conn:
+            conn.executemany("UPDATE student_images SET image_path = ? WHERE id = ?",
+                             [(ref, row_id) for row_id, _, ref in packed])
+            conn.executemany("UPDATE face_encodings SET image_path = ? WHERE image_path = ?",
+                             [(ref, image_path) for _, image_path, ref in packed])
+        for _, image_path, _ in packed:
+            try:
+                os.remove(image_path)
+            except OSError:
+                pass
+        return len(packed)
+
+    def pack_all(self, conn):
+        matrics = [matric for (matric,) in conn.execute(
+            "SELECT DISTINCT matric_number FROM student_images WHERE content_hash IS NOT NULL")]
+        return sum(self.pack(conn, matric) for matric in matrics)
+
+    def convert(self, conn, matric, delete_originals=False):
+        """
+        Replace matric's older whole-frame images with aligned crops. Images without exactly one
+        face are left as they are. Returns (converted, skipped).
+        """
+        import face_recognition
+
+        legacy = conn.execute("SELECT id, image_path FROM student_images "
+                              "WHERE matric_number = ? AND content_hash IS NULL", (matric,)).fetchall()
+        converted = 0
+        skipped = 0
+        for row_id, image_path in legacy:
+            try:
+                image = face_recognition.load_image_file(open_image(image_path))
+                locations = face_recognition.face_locations(image)
+            except Exception as e:
+                log.warning("Error reading image %s: %s", image_path, e)
+                skipped += 1
+                continue
+            if len(locations) != 1:
+                skipped += 1
+                continue
+
+            with conn:
+                self.add(conn, matric, image, locations[0], rgb=True)
+                conn.execute("DELETE FROM student_images WHERE id = ?", (row_id,))
+                conn.execute("DELETE FROM face_encodings WHERE image_path = ?", (image_path,))
+            if delete_originals:
+                try:
+                    os.remove(image_path)
+                except OSError:
+                    pass
+            converted += 1
+        return converted, skipped
+
+    def reconcile(self, conn, fix=False):
+        """
+        Compare student folders with student_images. Returns a dict of lists:
+
+          missing    rows whose file or pack member does not exist (fix: rows removed)
+          untracked  image files no row points to (fix: registered as images of that student)
+          redundant  loose crops already held in the student's pack (fix: deleted)
+          stray      other files, and folders of unknown students (reported only)
+        """
+        report = {"missing": [], "untracked": [], "redundant": [], "stray": []}
+        students = dict(conn.execute("SELECT matric_number, image_path FROM students"))
+        rows = conn.execute("SELECT id, matric_number, image_path, content_hash FROM student_images").fetchall()
+
+        tracked = set()
+        packed_hashes = set()
+        packs = {}
+        for row_id, matric, image_path, digest in rows:
+            path, member = split_ref(image_path)
+            tracked.add(os.path.normpath(path))
+            if member is None:
+                exists = os.path.isfile(path)
+            else:
+                if path not in packs:
+                    try:
+                        with zipfile.ZipFile(path) as pack:
+                            packs[path] = set(pack.namelist())
+                    except (OSError, zipfile.BadZipFile):
+                        packs[path] = set()
+                exists = member in packs[path]
+                if exists and digest:
+                    packed_hashes.add((matric, digest))
+            if not exists:
+                report["missing"].append((matric, image_path))
+
+        folders = {os.path.normpath(folder): matric for matric, folder in students.items() if folder}
+        if os.path.isdir(self.root):
+            for name in sorted(os.listdir(self.root)):
+                folder = os.path.normpath(os.path.join(self.root, name))
+                matric = folders.get(folder)
+                if matric is None:
+                    report["stray"].append((None, folder))
+                    continue
+                if not os.path.isdir(folder):
+                    continue
+                for file_name in sorted(os.listdir(folder)):
+                    path = os.path.normpath(os.path.join(folder, file_name))
+                    if path in tracked or not os.path.isfile(path):
+                        continue
+                    stem, extension = os.path.splitext(file_name)
+                    if (matric, stem) in packed_hashes:
+                        report["redundant"].append((matric, path))
+                    elif extension.lower() in IMAGE_EXTENSIONS:
+                        report["untracked"].append((matric, path))
+                    else:
+                        report["stray"].append((matric, path))
+
+        if fix:
+            with conn:
+                missing = [image_path for _, image_path in report["missing"]]
+                conn.executemany("DELETE FROM student_images WHERE image_path = ?", [(path,) for path in missing])
+                conn.executemany("DELETE FROM face_encodings WHERE image_path = ?", [(path,) for path in missing])
+                conn.executemany("INSERT INTO student_images (matric_number, image_path) VALUES (?, ?)",
+                                 report["untracked"])
+            for _, path in report["redundant"]:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check, pack and convert the enrolment image store")
+    parser.add_argument("command", choices=["check", "pack", "convert", "usage"])
+    parser.add_argument("--fix", action="store_true", help="With check: repair what was found")
+    parser.add_argument("--matric", default=None, help="Only this student (pack and convert)")
+    parser.add_argument("--delete-originals", action="store_true", help="With convert: remove the whole frames")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    parser.add_argument("--root", default=IMAGE_ROOT, help="Folder holding the student image folders")
+    args = parser.parse_args()
+
+    database.migrate(args.db)
+    conn = database.connect(args.db)
+    store = ImageStore(args.root)
+    try:
+        if args.command == "check":
+            report = store.reconcile(conn, fix=args.fix)
+            for kind, items in report.items():
+                print(f"{kind}: {len(items)}")
+                for matric, path in items[:20]:
+                    print(f"  {matric or '-'}: {path}")
+            if args.fix:
+                print("Fixed missing, untracked and redundant images.")
+        elif args.command == "pack":
+            packed = store.pack(conn, args.matric) if args.matric else store.pack_all(conn)
+            print(f"Packed {packed} images")
+        elif args.command == "convert":
+            matrics = [args.matric] if args.matric else [matric for (matric,) in conn.execute(
+                "SELECT DISTINCT matric_number FROM student_images WHERE content_hash IS NULL")]
+            converted = skipped = 0
+            for matric in matrics:
+                done, failed = store.convert(conn, matric, args.delete_originals)
+                converted += done
+                skipped += failed
+            print(f"Converted {converted} images, {skipped} left as they were")
+        else:
+            files, size = folder_usage(args.root)
+            print(f"{files} files, {size / 1024 / 1024:.1f} MB under {args.root}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
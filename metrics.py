@@ -0,0 +1,246 @@
+# metrics.py
+"""
+Lightweight instrumentation for the recognition loop.
+
+Metrics collects per-stage timings in fixed-bucket histograms (so p50/p95/p99 cost nothing to
+keep), event counters reported as rates, and gauges sampled on demand. Snapshots can be drawn
+on the preview, logged as JSON lines, written to a file or served over HTTP on localhost.
+NULL_METRICS has the same interface and does nothing, so instrumented code pays only a method
+call when metrics are off.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("attendance.metrics")
+
+# Histogram bucket upper bounds in seconds: 50 µs to ~100 s, about 12% apart
+BUCKETS = [50e-6 * 1.12 ** i for i in range(128)]
+
+
+class Histogram:
+    """ Fixed-bucket latency histogram; percentiles are read from the bucket bounds. """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(BUCKETS[bucket], self.max) if bucket < len(BUCKETS) else self.max
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1000 if self.count else 0.0,
+            "p50_ms": self.percentile(0.50) * 1000,
+            "p95_ms": self.percentile(0.95) * 1000,
+            "p99_ms": self.percentile(0.99) * 1000,
+            "max_ms": self.max * 1000,
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    """ Thread-safe registry of stage timers, counters and gauges. """
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._timers = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        # with metrics.timer("match"): ...
+        return _Timer(self, name)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._timers.get(name)
+            if histogram is None:
+                histogram = self._timers[name] = Histogram()
+            histogram.record(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def gauge(self, name, value):
+        # value may be a number or a callable sampled when a snapshot is taken
+        with self._lock:
+            self._gauges[name] = value
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.perf_counter() - self.started
+            timers = {name: histogram.summary() for name, histogram in self._timers.items()}
+            counters = {name: {"total": total, "per_second": total / elapsed if elapsed > 0 else 0.0}
+                        for name, total in self._counters.items()}
+            gauges = dict(self._gauges)
+
+        sampled = {}
+        for name, value in gauges.items():
+            try:
+                sampled[name] = value() if callable(value) else value
+            except Exception as e:
+                sampled[name] = f"error: {e}"
+        return {"time": time.time(), "uptime_s": elapsed, "timers": timers, "counters": counters, "gauges": sampled}
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics:
+    """ Drop-in Metrics that records nothing. """
+
+    enabled = False
+    _timer = _NullTimer()
+
+    def timer(self, name):
+        return self._timer
+
+    def observe(self, name, seconds):
+        pass
+
+    def increment(self, name, amount=1):
+        pass
+
+    def gauge(self, name, value):
+        pass
+
+    def snapshot(self):
+        return {}
+
+
+NULL_METRICS = NullMetrics()
+
+
+def overlay_lines(snapshot, timers=("detect", "encode", "match", "render", "recognise"),
+                  counters=("frames_grabbed", "frames_processed")):
+    # Short text lines for the preview window
+    lines = [f"{name} {snapshot['counters'][name]['per_second']:.1f}/s"
+             for name in counters if name in snapshot.get("counters", {})]
+    for name in timers:
+        stats = snapshot.get("timers", {}).get(name)
+        if stats:
+            lines.append(f"{name} p50 {stats['p50_ms']:.0f} p95 {stats['p95_ms']:.0f} p99 {stats['p99_ms']:.0f} ms")
+    for name, value in sorted(snapshot.get("gauges", {}).items()):
+        lines.append(f"{name} {value}")
+    return lines
+
+
+class MetricsReporter(threading.Thread):
+    """
+    Publishes snapshots every interval seconds: as a JSON log line, to a JSON file (replaced
+    atomically) and/or on http://127.0.0.1:<port>/metrics.
+    """
+
+    def __init__(self, metrics, interval=5.0, log_records=True, path=None, port=None):
+        super().__init__(name="MetricsReporter", daemon=True)
+        self.metrics = metrics
+        self.interval = interval
+        self.log_records = log_records
+        self.path = path
+        self.port = port
+        self.server = None
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self.port is not None:
+            self.server = ThreadingHTTPServer(("127.0.0.1", self.port), self._handler())
+            threading.Thread(target=self.server.serve_forever, name="MetricsServer", daemon=True).start()
+        super().start()
+
+    def _handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") not in ("", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def publish(self):
+        snapshot = self.metrics.snapshot()
+        if self.log_records:
+            log.info(json.dumps(snapshot))
+        if self.path:
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as dump:
+                json.dump(snapshot, dump, indent=2)
+            os.replace(temp_path, self.path)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.publish()
+            except Exception:
+                log.exception("Error publishing metrics")
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        # Leave a final snapshot behind
+        try:
+            self.publish()
+        except Exception:
+            log.exception("Error publishing metrics")
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
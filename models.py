@@ -0,0 +1,42 @@
+# models.py
+"""
+Lazy loading of the face recognition stack.
+
+Importing face_recognition loads dlib and its four .dat models, which takes seconds, so the GUI
+only does it the first time capture or enrolment is used. load_models() is safe to call from
+any thread and does the work once per process.
+"""
+import threading
+import time
+import database
+
+# Model files bundled next to the executable by Face_Recognition_App.spec
+MODEL_FILES = [
+    'face_recognition_models/models/shape_predictor_68_face_landmarks.dat',
+    'face_recognition_models/models/shape_predictor_5_face_landmarks.dat',
+    'face_recognition_models/models/mmod_human_face_detector.dat',
+    'face_recognition_models/models/dlib_face_recognition_resnet_model_v1.dat',
+]
+
+_lock = threading.Lock()
+_load_seconds = None
+
+
+def model_paths():
+    return [database.resource_path(path) for path in MODEL_FILES]
+
+
+def models_loaded():
+    return _load_seconds is not None
+
+
+def load_models():
+    """ Import OpenCV, dlib and face_recognition (loading every model) once; returns the seconds it took. """
+    global _load_seconds
+    with _lock:
+        if _load_seconds is None:
+            start = time.perf_counter()
+            import cv2  # noqa: F401
+            import face_recognition  # noqa: F401
+            _load_seconds = time.perf_counter() - start
+        return _load_seconds
@@ -0,0 +1,306 @@
+# reports.py
+"""
+Attendance reports over a date range, built from the aggregate tables.
+
+attendance_daily (marks per student, day and course), session_attendance (students present
+per session) and session_students (who was present at each session) are maintained by triggers
+as marks are written, and kept when archive.py moves old marks out, so a semester report reads
+a few thousand aggregate rows and never the attendance table itself. Every report is a generator
+of rows, and export() streams them to CSV or Parquet in batches, so multi-semester reports
+never sit in memory.
+
+    python -m reports students --from 2024-09-01 --to 2025-01-31 --course CSC101 --output rates.csv
+    python -m reports departments --from 2024-09-01 --to 2025-01-31 --output departments.parquet
+"""
+import argparse
+import csv
+import sys
+import database
+
+# Rows fetched from SQLite, and written per Parquet row group, at a time
+BATCH_SIZE = 5000
+
+REPORTS = {
+    "students": ["matric_number", "name", "department", "level", "days_present", "sessions_attended",
+                 "sessions_held", "attendance_rate"],
+    "departments": ["department", "level", "students", "students_present", "sessions_attended",
+                    "sessions_held", "attendance_rate"],
+    "days": ["day", "students_present", "marks"],
+    "sessions": ["session_id", "course", "starts_at", "ends_at", "present", "enrolled", "attendance_rate"],
+}
+
+
+def _rows(cursor):
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def _rate(attended, held):
+    return round(attended / held, 4) if held else None
+
+
+def _student_filter(department, level, alias="s"):
+    conditions = []
+    params = []
+    if department:
+        conditions.append(f"{alias}.department = ?")
+        params.append(department)
+    if level:
+        conditions.append(f"{alias}.level = ?")
+        params.append(level)
+    return conditions, params
+
+
+def _course_id(conn, course):
+    # None for all courses, -1 (matching nothing) for an unknown code
+    if not course:
+        return None
+    row = conn.execute("SELECT id FROM courses WHERE code = ?", (course,)).fetchone()
+    return row[0] if row else -1
+
+
+def sessions_held(conn, start_date, end_date, course=None):
+    """ Number of sessions (of course, or of every course) that started between the two dates. """
+    params = [database.to_epoch(f"{start_date} 00:00:00"), database.to_epoch(f"{end_date} 23:59:59")]
+    course_condition = ""
+    course_id = _course_id(conn, course)
+    if course_id is not None:
+        course_condition = "AND course_id = ?"
+        params.append(course_id)
+    return conn.execute(f"SELECT COUNT(*) FROM sessions WHERE starts_at BETWEEN ? AND ? {course_condition}",
+                        params).fetchone()[0]
+
+
+def _course_sessions_held(conn, start_date, end_date, course):
+    # Sessions held and rates are only reported for one course: there is no record of which
+    # courses a student takes, so over every course they would assume everyone takes them all
+    return sessions_held(conn, start_date, end_date, course) if course else None
+
+
+def student_report(conn, start_date, end_date, course=None, department=None, level=None):
+    """
+    Per student: days present, sessions attended and, for a course, sessions held and the
+    attendance rate.
+    """
+    held = _course_sessions_held(conn, start_date, end_date, course)
+    conditions, params = _student_filter(department, level)
+    course_id = _course_id(conn, course)
+    course_condition = ""
+    if course_id is not None:
+        course_condition = "AND d.course_id = ?"
+        params = [course_id] + params
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    # Marks under a session are unique per student, so their count is the sessions attended
+    cursor = conn.execute(f"""
+        SELECT s.matric_number, s.name, s.department, s.level,
+               COUNT(DISTINCT d.day), COALESCE(SUM(CASE WHEN d.course_id != 0 THEN d.marks END), 0)
+        FROM students s
+        LEFT JOIN attendance_daily d ON d.matric_number = s.matric_number
+             AND d.day BETWEEN ? AND ? {course_condition}
+        {where}
+        GROUP BY s.matric_number
+        ORDER BY s.matric_number
+    """, [start_date, end_date] + params)
+    for matric, name, student_department, student_level, days, attended in _rows(cursor):
+        yield matric, name, student_department, student_level, days, attended, held, _rate(attended, held)
+
+
+def department_report(conn, start_date, end_date, course=None, department=None, level=None):
+    """
+    Per department and level (optionally only one department and/or level): enrolled students,
+    students present at least once and, for a course, sessions held and the attendance rate.
+    """
+    held = _course_sessions_held(conn, start_date, end_date, course)
+    params = [start_date, end_date]
+    course_condition = ""
+    course_id = _course_id(conn, course)
+    if course_id is not None:
+        course_condition = "AND d.course_id = ?"
+        params.append(course_id)
+    conditions, student_params = _student_filter(department, level)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    cursor = conn.execute(f"""
+        SELECT s.department, s.level, COUNT(*), COUNT(p.matric_number), COALESCE(SUM(p.attended), 0)
+        FROM students s
+        LEFT JOIN (
+            SELECT d.matric_number, SUM(CASE WHEN d.course_id != 0 THEN d.marks ELSE 0 END) AS attended
+            FROM attendance_daily d
+            WHERE d.day BETWEEN ? AND ? {course_condition}
+            GROUP BY d.matric_number
+        ) p ON p.matric_number = s.matric_number
+        {where}
+        GROUP BY s.department, s.level
+        ORDER BY s.department, s.level
+    """, params + student_params)
+    for department, level, students, present, attended in _rows(cursor):
+        yield department, level, students, present, attended, held, _rate(attended, students * (held or 0))
+
+
+def day_report(conn, start_date, end_date, course=None, department=None, level=None):
+    """ Per day: distinct students present and marks recorded. """
+    conditions, params = _student_filter(department, level)
+    join = "JOIN students s ON s.matric_number = d.matric_number" if conditions else ""
+    course_id = _course_id(conn, course)
+    if course_id is not None:
+        conditions.append("d.course_id = ?")
+        params.append(course_id)
+
+    extra = "".join(f" AND {condition}" for condition in conditions)
+    cursor = conn.execute(f"""
+        SELECT d.day, COUNT(DISTINCT d.matric_number), SUM(d.marks)
+        FROM attendance_daily d {join}
+        WHERE d.day BETWEEN ? AND ?{extra}
+        GROUP BY d.day
+        ORDER BY d.day
+    """, [start_date, end_date] + params)
+    yield from _rows(cursor)
+
+
+def session_report(conn, start_date, end_date, course=None, department=None, level=None):
+    """ Per session: course, times, students present and, with a department/level, the rate among them. """
+    params = [database.to_epoch(f"{start_date} 00:00:00"), database.to_epoch(f"{end_date} 23:59:59")]
+    course_condition = ""
+    course_id = _course_id(conn, course)
+    if course_id is not None:
+        course_condition = "AND se.course_id = ?"
+        params.append(course_id)
+
+    conditions, student_params = _student_filter(department, level)
+    enrolled = None
+    if conditions:
+        # The present count is then taken over those students only
+        enrolled = conn.execute(f"SELECT COUNT(*) FROM students s WHERE {' AND '.join(conditions)}",
+                                student_params).fetchone()[0]
+        present = f"""(SELECT COUNT(*) FROM session_students ss
+                       JOIN students s ON s.matric_number = ss.matric_number
+                       WHERE ss.session_id = se.id AND {' AND '.join(conditions)})"""
+        params = student_params + params
+    else:
+        present = "COALESCE(sa.present, 0)"
+
+    cursor = conn.execute(f"""
+        SELECT se.id, c.code, se.starts_at, se.ends_at, {present}
+        FROM sessions se
+        JOIN courses c ON c.id = se.course_id
+        LEFT JOIN session_attendance sa ON sa.session_id = se.id
+        WHERE se.starts_at BETWEEN ? AND ? {course_condition}
+        ORDER BY se.starts_at, se.id
+    """, params)
+    for session_id, code, starts_at, ends_at, count in _rows(cursor):
+        yield (session_id, code, database.from_epoch(starts_at), database.from_epoch(ends_at), count, enrolled,
+               _rate(count, enrolled))
+
+
+def run_report(conn, report, start_date, end_date, course=None, department=None, level=None):
+    """ Rows of the named report, see REPORTS for its columns. """
+    if report == "students":
+        return student_report(conn, start_date, end_date, course, department, level)
+    if report == "departments":
+        return department_report(conn, start_date, end_date, course, department, level)
+    if report == "days":
+        return day_report(conn, start_date, end_date, course, department, level)
+    if report == "sessions":
+        return session_report(conn, start_date, end_date, course, department, level)
+    raise ValueError(f"Unknown report: {report}")
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_csv(rows, columns, path):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as output:
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def export_parquet(rows, columns, path):
+    # pyarrow is only needed for Parquet output
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet export needs pyarrow (pip install pyarrow); use a .csv output instead")
+
+    count = 0
+    writer = None
+    try:
+        for batch in _batches(rows, BATCH_SIZE):
+            # One row group per batch, transposed into columns
+            table = pa.Table.from_arrays([pa.array(values) for values in zip(*batch)], names=columns)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            count += len(batch)
+        if writer is None:
+            pq.write_table(pa.table({column: [] for column in columns}), path)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def export(rows, columns, path):
+    """ Stream rows to path, as Parquet for a .parquet extension and CSV otherwise; returns the row count. """
+    if path.lower().endswith(".parquet"):
+        return export_parquet(rows, columns, path)
+    return export_csv(rows, columns, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance reports over a date range")
+    parser.add_argument("report", choices=sorted(REPORTS), help="Report to produce")
+    parser.add_argument("--from", dest="start_date", required=True, help="First day, YYYY-MM-DD")
+    parser.add_argument("--to", dest="end_date", required=True, help="Last day, YYYY-MM-DD")
+    parser.add_argument("--course", default=None,
+                        help="Only sessions of this course code; students and departments only report sessions "
+                             "held and attendance rates with a course, since which courses a student takes is "
+                             "not recorded")
+    parser.add_argument("--department", default=None,
+                        help="Only students of this department; sessions only report enrolled students and "
+                             "attendance rates with a department and/or level")
+    parser.add_argument("--level", default=None, help="Only students of this level")
+    parser.add_argument("--output", default=None, help="Write to this .csv or .parquet file instead of printing")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    args = parser.parse_args()
+
+    database.migrate(args.db)
+    conn = database.connect(args.db)
+    try:
+        rows = run_report(conn, args.report, args.start_date, args.end_date, args.course, args.department,
+                          args.level)
+        columns = REPORTS[args.report]
+        if args.output:
+            count = export(rows, columns, args.output)
+            print(f"Wrote {count} rows to {args.output}")
+        else:
+            writer = csv.writer(sys.stdout)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    except ImportError as e:
+        print(f"Error: {e}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
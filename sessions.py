@@ -0,0 +1,201 @@
+# sessions.py
+"""
+Attendance sessions: one lecture/period of a course, with a start and end time.
+
+A student is marked at most once per session. The capture loop checks a Roster bitmap indexed
+by the student's rowid, seeded from the database when the session is opened (on the tracker's
+own thread, never the capture loop), and the partial unique index on attendance (session_id,
+matric_number) enforces the same rule for restarts and for several capture processes writing
+to one database.
+"""
+import logging
+import threading
+import database
+
+log = logging.getLogger(__name__)
+
+DEFAULT_COURSE = "GENERAL"
+DEFAULT_SESSION_LENGTH = 60 * 60
+
+
+class Roster:
+    """ Set of student ids marked in one session, stored as a bitmap. """
+
+    def __init__(self, session_id, starts_at, ends_at, student_ids=()):
+        self.session_id = session_id
+        self.starts_at = starts_at
+        self.ends_at = ends_at
+        self.bits = bytearray()
+        self.count = 0
+        for student_id in student_ids:
+            self.add(student_id)
+
+    def covers(self, now):
+        return self.starts_at <= now < self.ends_at
+
+    def __contains__(self, student_id):
+        byte = student_id >> 3
+        return byte < len(self.bits) and bool(self.bits[byte] & (1 << (student_id & 7)))
+
+    def add(self, student_id):
+        # Set the student's bit, returning False if it was already set
+        byte = student_id >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1 - len(self.bits), len(self.bits))))
+        mask = 1 << (student_id & 7)
+        if self.bits[byte] & mask:
+            return False
+        self.bits[byte] |= mask
+        self.count += 1
+        return True
+
+
+def course_id(conn, code):
+    conn.execute("INSERT OR IGNORE INTO courses (code, title) VALUES (?, ?)", (code, code))
+    return conn.execute("SELECT id FROM courses WHERE code = ?", (code,)).fetchone()[0]
+
+
+def open_session(conn, code, now, session_length=DEFAULT_SESSION_LENGTH):
+    """
+    Return (session_id, starts_at, ends_at) for the session of course code running at now,
+    creating an ad-hoc session of session_length seconds when none is scheduled.
+    """
+    # BEGIN IMMEDIATE so two capture processes starting together agree on one session
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        course = course_id(conn, code)
+        session = conn.execute("""
+            SELECT id, starts_at, ends_at FROM sessions
+            WHERE course_id = ? AND starts_at <= ? AND ends_at > ?
+            ORDER BY starts_at DESC LIMIT 1
+        """, (course, now, now)).fetchone()
+        if session is None:
+            cursor = conn.execute("INSERT INTO sessions (course_id, starts_at, ends_at) VALUES (?, ?, ?)",
+                                  (course, now, now + session_length))
+            session = (cursor.lastrowid, now, now + session_length)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return session
+
+
+class SessionTracker:
+    """
+    Tracks the current session of one course during capture and decides, in O(1) and without
+    touching the database, whether a recognised student still needs marking. A new session is
+    opened once the current one ends, so back-to-back lectures each get their own register.
+
+    Opening a session and looking up students enrolled after it was opened need SQLite, so
+    they run on the tracker's thread: a mark that needs either is deferred, and once the thread
+    has what it needs it passes the accepted mark to on_ready(matric, name, timestamp, session_id).
+    start() and stop() bracket each capture run; the roster carries over between runs.
+    """
+
+    def __init__(self, db_path, course=DEFAULT_COURSE, session_length=DEFAULT_SESSION_LENGTH, on_ready=None):
+        self.db_path = db_path
+        self.course = course
+        self.session_length = session_length
+        self.on_ready = on_ready
+        self.roster = None
+        self.student_ids = {}
+        self.marked = 0
+
+        # Marks waiting for a session or a student id, and whether stop() was called
+        self._deferred = []
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def open(self, conn, now):
+        # Runs on the tracker thread only; the roster is built first and swapped in under the lock
+        session_id, starts_at, ends_at = open_session(conn, self.course, now, self.session_length)
+        student_ids = dict(conn.execute("SELECT matric_number, rowid FROM students"))
+
+        # Students already marked in this session, by an earlier run or another capture process
+        marked = conn.execute("""
+            SELECT s.rowid FROM attendance a JOIN students s ON s.matric_number = a.matric_number
+            WHERE a.session_id = ?
+        """, (session_id,))
+        roster = Roster(session_id, starts_at, ends_at, (student_id for (student_id,) in marked))
+        with self._condition:
+            self.student_ids.update(student_ids)
+            self.roster = roster
+        return roster
+
+    def mark(self, matric, name, timestamp):
+        """
+        Return the session id to record the mark under, or None if matric is already marked or
+        the mark was deferred to the tracker thread. Never blocks on the database.
+        """
+        now = database.to_epoch(timestamp)
+        with self._condition:
+            student_id = self.student_ids.get(matric)
+            if self.roster is None or not self.roster.covers(now) or student_id is None:
+                self._deferred.append((matric, name, timestamp, now))
+                self._condition.notify_all()
+                return None
+            return self._accept(student_id)
+
+    def _accept(self, student_id):
+        # Called with the lock held
+        if not self.roster.add(student_id):
+            return None
+        self.marked += 1
+        return self.roster.session_id
+
+    def start(self):
+        self._stopping = False
+        self._thread = threading.Thread(target=self.run, name="SessionTracker", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        # Settle deferred marks and wait for the thread to finish
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _settle(self, conn, matric, name, timestamp, now):
+        if self.roster is None or not self.roster.covers(now):
+            self.open(conn, now)
+        with self._condition:
+            student_id = self.student_ids.get(matric)
+        if student_id is None:
+            # Enrolled after the session was opened
+            row = conn.execute("SELECT rowid FROM students WHERE matric_number = ?", (matric,)).fetchone()
+            if row is None:
+                return
+            student_id = row[0]
+
+        with self._condition:
+            self.student_ids[matric] = student_id
+            # A later session may have been opened for a newer mark meanwhile
+            if not self.roster.covers(now):
+                return
+            session_id = self._accept(student_id)
+        if session_id is not None and self.on_ready is not None:
+            self.on_ready(matric, name, timestamp, session_id)
+
+    def run(self):
+        conn = database.connect(self.db_path)
+        try:
+            while True:
+                with self._condition:
+                    while not self._deferred and not self._stopping:
+                        self._condition.wait()
+                    deferred, self._deferred = self._deferred, []
+                    stopping = self._stopping
+                for matric, name, timestamp, now in deferred:
+                    try:
+                        self._settle(conn, matric, name, timestamp, now)
+                    except Exception:
+                        log.exception("Error opening the attendance session for %s", matric)
+                if stopping and not deferred:
+                    return
+        finally:
+            conn.close()
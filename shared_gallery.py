@@ -0,0 +1,186 @@
+# shared_gallery.py
+"""
+Face gallery in shared memory for recognition worker processes.
+
+The capture process publishes the gallery once as a read-only block: the (N, 128) float32
+encodings, their squared norms, an int32 identity id per row and the (matric, name) table.
+Workers attach by name and match against numpy views of that block, so N x 128 floats exist
+once however many workers there are, and attaching costs no load or copy.
+
+Each publish() writes a complete new block, named after its version, and only then stores the
+version number in a small control block. Workers read the control block before matching and
+move to the new block when the number changes, so a new gallery reaches running workers without
+a restart and a worker never sees a half-written one. Superseded blocks are unlinked straight
+away; workers still mapping one keep it alive until they move on.
+"""
+import json
+import os
+from multiprocessing import shared_memory
+import numpy as np
+from face_matcher import DEFAULT_TOLERANCE, FaceMatcher
+from face_store import ENCODING_SIZE
+
+# Header of a gallery block: rows, identity table bytes, version; arrays start 64-byte aligned
+HEADER_FIELDS = 3
+DATA_OFFSET = 64
+
+
+def _layout(rows):
+    # Byte offsets of the encodings, squared norms, labels and identity table in a block
+    encodings = DATA_OFFSET
+    sq_norms = encodings + rows * ENCODING_SIZE * 4
+    labels = sq_norms + rows * 4
+    identities = labels + rows * 4
+    return encodings, sq_norms, labels, identities
+
+
+def block_name(name, version):
+    return f"{name}_v{version}"
+
+
+class GalleryPublisher:
+    """ Owns the shared gallery: publishes new versions and unlinks everything on close(). """
+
+    def __init__(self, name=None):
+        # POSIX shared memory names are short on some systems, so keep the default compact
+        self.name = name or f"fg{os.getpid()}"
+        self.control = shared_memory.SharedMemory(name=self.name, create=True, size=8)
+        self.version = np.ndarray(1, dtype=np.int64, buffer=self.control.buf)
+        self.version[0] = 0
+        self.block = None
+
+    def publish(self, encodings, labels, identities):
+        """
+        Publish a gallery: encodings (N, 128), labels giving each row's index into identities, a
+        list of (matric, name). Returns the new version number.
+        """
+        encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        labels = np.asarray(labels, dtype=np.int32)
+        table = json.dumps([list(identity) for identity in identities]).encode("utf-8")
+        rows = len(encodings)
+        version = int(self.version[0]) + 1
+
+        offsets = _layout(rows)
+        block = shared_memory.SharedMemory(name=block_name(self.name, version), create=True,
+                                           size=offsets[3] + max(len(table), 1))
+        header = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=block.buf)
+        header[:] = (rows, len(table), version)
+        np.ndarray((rows, ENCODING_SIZE), dtype=np.float32, buffer=block.buf, offset=offsets[0])[:] = encodings
+        np.einsum("ij,ij->i", encodings, encodings,
+                  out=np.ndarray(rows, dtype=np.float32, buffer=block.buf, offset=offsets[1]))
+        np.ndarray(rows, dtype=np.int32, buffer=block.buf, offset=offsets[2])[:] = labels
+        block.buf[offsets[3]:offsets[3] + len(table)] = table
+        del header
+
+        # The block is complete before workers can learn its version
+        self.version[0] = version
+        self._retire()
+        self.block = block
+        return version
+
+    def publish_matcher(self, matcher):
+        # Publish a FaceMatcher's current gallery, leaving out rows of removed students
+        with matcher._lock:
+            keep = matcher.labels >= 0
+            return self.publish(matcher.gallery[keep], matcher.labels[keep], matcher.identities)
+
+    def _retire(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def close(self):
+        self._retire()
+        del self.version
+        self.control.close()
+        self.control.unlink()
+
+
+class SharedGallery:
+    """
+    A worker's view of a published gallery. matcher() returns a FaceMatcher over the current
+    version, attaching to a newer one first if it has been published. Workers are children of
+    the publishing process and share its resource tracker, so attaching does not take ownership.
+    """
+
+    def __init__(self, name, tolerance=DEFAULT_TOLERANCE):
+        self.name = name
+        self.tolerance = tolerance
+        self.control = shared_memory.SharedMemory(name=name)
+        self.published = np.ndarray(1, dtype=np.int64, buffer=self.control.buf)
+        self.version = None
+        self.block = None
+        self._matcher = None
+        self._retired = []
+
+    def matcher(self):
+        version = int(self.published[0])
+        if version != self.version:
+            self._attach(version)
+        return self._matcher
+
+    def _attach(self, version):
+        while True:
+            if version == 0:
+                raise RuntimeError(f"No gallery has been published to {self.name} yet")
+            try:
+                block = shared_memory.SharedMemory(name=block_name(self.name, version))
+                break
+            except FileNotFoundError:
+                # Superseded between reading the version and attaching; take the newer one
+                latest = int(self.published[0])
+                if latest == version:
+                    raise
+                version = latest
+
+        rows, table_size, _ = np.ndarray(HEADER_FIELDS, dtype=np.int64, buffer=block.buf).tolist()
+        offsets = _layout(rows)
+        encodings = np.ndarray((rows, ENCODING_SIZE), dtype=np.float32, buffer=block.buf, offset=offsets[0])
+        sq_norms = np.ndarray(rows, dtype=np.float32, buffer=block.buf, offset=offsets[1])
+        labels = np.ndarray(rows, dtype=np.int32, buffer=block.buf, offset=offsets[2])
+        for array in (encodings, sq_norms, labels):
+            array.flags.writeable = False
+        identities = [tuple(identity) for identity in
+                      json.loads(bytes(block.buf[offsets[3]:offsets[3] + table_size]).decode("utf-8"))]
+
+        if self.block is not None:
+            self._retired.append(self.block)
+        self.block = block
+        self.version = version
+        self._matcher = FaceMatcher.from_arrays(encodings, sq_norms, labels, identities, self.tolerance)
+        self._close_retired()
+
+    def _close_retired(self):
+        # A block can only be closed once no array views of it are left
+        still_used = []
+        for block in self._retired:
+            try:
+                block.close()
+            except BufferError:
+                still_used.append(block)
+        self._retired = still_used
+
+    def close(self):
+        self._matcher = None
+        if self.block is not None:
+            self._retired.append(self.block)
+            self.block = None
+        self._close_retired()
+        del self.published
+        self.control.close()
+
+
+# Per-process gallery of a worker started with attach_worker as its pool initializer
+_worker_gallery = None
+
+
+def attach_worker(name, tolerance=DEFAULT_TOLERANCE):
+    """ Process pool initializer: attach this worker to the gallery published under name. """
+    global _worker_gallery
+    _worker_gallery = SharedGallery(name, tolerance)
+
+
+def match_in_worker(face_encodings):
+    # Task for a worker started with attach_worker; always matches the latest published gallery
+    return _worker_gallery.matcher().match(face_encodings)
@@ -0,0 +1,142 @@
+# thumbnail_cache.py
+import hashlib
+import logging
+import os
+import threading
+import zipfile
+from PyQt5.QtCore import QBuffer, QByteArray, QSize, Qt
+from PyQt5.QtGui import QImage, QImageReader
+import image_store
+
+log = logging.getLogger(__name__)
+
+THUMBNAIL_SIZE = 100
+
+
+class ThumbnailCache:
+    """
+    On-disk cache of small PNG thumbnails for student photos.
+
+    A thumbnail is keyed by the source path, modification time and size, so editing or replacing
+    a photo produces a new entry. Hits refresh the file's modification time; once the cache grows
+    past max_bytes the least recently used thumbnails are deleted. Only QImage is used, so the
+    cache is safe to call from worker threads.
+    """
+
+    def __init__(self, cache_dir, size=THUMBNAIL_SIZE, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.size = size
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._total_bytes = None
+
+    def key(self, image_path, stat):
+        source = f"{os.path.abspath(image_path)}|{stat.st_mtime_ns}|{stat.st_size}|{self.size}"
+        return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+    def cache_path(self, image_path):
+        # Location of the thumbnail for the current version of image_path, or None if it is missing.
+        # Packed crops are keyed by their pack file, which is rewritten whenever crops are added.
+        try:
+            stat = os.stat(image_store.split_ref(image_path)[0])
+        except OSError:
+            return None
+        key = self.key(image_path, stat)
+        return os.path.join(self.cache_dir, key[:2], key + ".png")
+
+    def thumbnail(self, image_path):
+        """ Return a QImage thumbnail for image_path, generating and storing it on a miss. """
+        path = self.cache_path(image_path)
+        if path is None:
+            return QImage()
+
+        if os.path.exists(path):
+            image = QImage(path)
+            if not image.isNull():
+                try:
+                    os.utime(path)
+                except OSError:
+                    pass
+                return image
+
+        image = self.generate(image_path)
+        if not image.isNull():
+            self.store(path, image)
+        return image
+
+    def generate(self, image_path):
+        # Let the decoder scale while reading (JPEG decodes at a fraction of full size) instead of
+        # loading the full-resolution photo and shrinking it afterwards
+        path, member = image_store.split_ref(image_path)
+        if member is None:
+            reader = QImageReader(path)
+        else:
+            try:
+                buffer = QBuffer()
+                buffer.setData(QByteArray(image_store.read_bytes(image_path)))
+            except (OSError, KeyError, zipfile.BadZipFile) as e:
+                log.warning("Error reading image %s: %s", image_path, e)
+                return QImage()
+            reader = QImageReader(buffer)
+        reader.setAutoTransform(True)
+        original = reader.size()
+        if original.isValid():
+            reader.setScaledSize(original.scaled(QSize(self.size, self.size), Qt.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            log.warning("Error reading image %s: %s", image_path, reader.errorString())
+        return image
+
+    def store(self, path, image):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write beside the final name and rename, so readers never see a half-written file
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        if not image.save(temp_path, "PNG"):
+            return
+        os.replace(temp_path, path)
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self.disk_usage()
+            else:
+                self._total_bytes += os.path.getsize(path)
+            over_budget = self._total_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _entries(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for folder in os.listdir(self.cache_dir):
+            folder_path = os.path.join(self.cache_dir, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in os.listdir(folder_path):
+                if name.endswith(".png"):
+                    path = os.path.join(folder_path, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        # Delete least recently used thumbnails until the cache is back to 90% of max_bytes
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * 0.9
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+            self._total_bytes = total
@@ -0,0 +1,219 @@
+# unknown_faces.py
+"""
+Faces seen during attendance capture that match no enrolled student.
+
+UnknownFaceCache groups the encodings of unknown faces into clusters: an encoding within radius
+of a cluster's centroid (normally the match tolerance) belongs to the same person and moves the
+centroid, anything further away starts a new cluster. With the tracker encoding an unknown face
+only a few times while it stays in view, each unknown person costs a handful of encodings per
+appearance instead of one per detection, and gets a stable "Unknown N" label on the preview.
+
+Each cluster keeps an aligned crop of the largest face it has seen. save() writes clusters seen
+at least min_samples times to the unknown_faces table, with their crop under UNKNOWN_ROOT, and
+load() seeds the cache from that table, so a visitor who returns in a later session joins their
+earlier cluster. The command line lists them and enrols one as an existing student:
+
+    python -m unknown_faces list
+    python -m unknown_faces enrol 12 --matric 19/52HA001
+    python -m unknown_faces discard 12
+"""
+import argparse
+import os
+import numpy as np
+import database
+import image_store
+from face_matcher import DEFAULT_TOLERANCE
+from face_store import ENCODING_SIZE, EncodingStore
+from image_store import ImageStore
+
+UNKNOWN_ROOT = "unknown_faces"
+
+
+class UnknownFace:
+    """ One cluster: a running mean of its encodings, when it was seen and its best crop. """
+
+    def __init__(self, number, encoding, samples=1, face_id=None, first_seen=None, last_seen=None,
+                 sightings=0, image_path=None):
+        self.number = number
+        self.id = face_id
+        self.encoding = np.asarray(encoding, dtype=np.float32)
+        self.samples = samples
+        self.first_seen = first_seen
+        self.last_seen = last_seen
+        self.sightings = sightings
+        self.image_path = image_path
+
+        # JPEG bytes of the largest crop seen in this session, not yet written
+        self.crop = None
+        self.crop_area = 0
+        self.dirty = False
+
+    @property
+    def label(self):
+        return f"Unknown {self.number}"
+
+
+class UnknownFaceCache:
+    def __init__(self, radius=DEFAULT_TOLERANCE, min_samples=3, root=UNKNOWN_ROOT):
+        self.radius = radius
+        self.min_samples = min_samples
+        self.root = root
+        self.faces = []
+
+        # Cluster centroids as one matrix, so an encoding is compared with all of them at once
+        self._centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.faces)
+
+    def _append(self, face):
+        self.faces.append(face)
+        self._centroids = np.vstack([self._centroids, face.encoding[None, :]])
+        return face
+
+    def load(self, conn):
+        # Seed the cache with the clusters saved by earlier sessions
+        self.faces = []
+        self._centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        for face_id, first_seen, last_seen, sightings, blob, image_path in conn.execute(
+                "SELECT id, first_seen, last_seen, sightings, encoding, image_path FROM unknown_faces ORDER BY id"):
+            encoding = np.frombuffer(blob, dtype=np.float32)
+            self._append(UnknownFace(len(self.faces) + 1, encoding, sightings, face_id, first_seen, last_seen,
+                                     sightings, image_path))
+
+    def nearest(self, encoding):
+        # (cluster, distance) closest to encoding, or (None, inf) for an empty cache
+        if not self.faces:
+            return None, np.inf
+        distances = np.linalg.norm(self._centroids - np.asarray(encoding, dtype=np.float32), axis=1)
+        best = int(distances.argmin())
+        return self.faces[best], float(distances[best])
+
+    def add(self, encoding, timestamp, new_sighting=True, frame=None, location=None):
+        """
+        Add an unknown face's encoding, returning its cluster. new_sighting is False for further
+        encodings of a face that is still being tracked. With frame and location, the face's crop
+        is kept when it is the largest seen for the cluster.
+        """
+        face, distance = self.nearest(encoding)
+        if face is None or distance > self.radius:
+            face = self._append(UnknownFace(len(self.faces) + 1, encoding, first_seen=timestamp))
+        else:
+            face.samples += 1
+            face.encoding = face.encoding + (np.asarray(encoding, dtype=np.float32) - face.encoding) / face.samples
+            self._centroids[face.number - 1] = face.encoding
+        face.last_seen = timestamp
+        face.sightings += new_sighting
+        face.dirty = True
+
+        if frame is not None and location is not None:
+            top, right, bottom, left = location
+            area = (bottom - top) * (right - left)
+            if area > face.crop_area:
+                face.crop = image_store.encode_crop(image_store.align_crop(frame, location))
+                face.crop_area = area
+        return face
+
+    def save(self, conn):
+        """ Write clusters changed since the last save and seen at least min_samples times; the caller commits. """
+        saved = 0
+        for face in self.faces:
+            if not face.dirty or face.samples < self.min_samples:
+                continue
+            if face.crop is not None:
+                old_path = face.image_path
+                face.image_path, _ = image_store.write_crop(self.root, face.crop)
+                if old_path and old_path != face.image_path and os.path.exists(old_path):
+                    os.remove(old_path)
+                face.crop = None
+
+            values = (face.first_seen, face.last_seen, face.sightings, face.encoding.tobytes(), face.image_path)
+            if face.id is None:
+                face.id = conn.execute("INSERT INTO unknown_faces (first_seen, last_seen, sightings, encoding, "
+                                       "image_path) VALUES (?, ?, ?, ?, ?)", values).lastrowid
+            else:
+                conn.execute("UPDATE unknown_faces SET first_seen = ?, last_seen = ?, sightings = ?, encoding = ?, "
+                             "image_path = ? WHERE id = ?", values + (face.id,))
+            face.dirty = False
+            saved += 1
+        return saved
+
+
+def discard(conn, face_id):
+    # Forget a saved unknown face and its crop; the caller commits
+    row = conn.execute("SELECT image_path FROM unknown_faces WHERE id = ?", (face_id,)).fetchone()
+    if row is None:
+        return False
+    conn.execute("DELETE FROM unknown_faces WHERE id = ?", (face_id,))
+    if row[0] and os.path.exists(row[0]):
+        os.remove(row[0])
+    return True
+
+
+def enrol(conn, db_path, face_id, matric, image_root=image_store.IMAGE_ROOT):
+    """
+    Add a saved unknown face's crop to a registered student's enrolment images and forget the
+    unknown face. conn is a connection to db_path. Returns an error message, or None on success.
+    The caller commits.
+    """
+    row = conn.execute("SELECT image_path FROM unknown_faces WHERE id = ?", (face_id,)).fetchone()
+    if row is None:
+        return f"No unknown face {face_id}"
+    if not row[0] or not os.path.exists(row[0]):
+        return f"The crop of unknown face {face_id} is missing"
+    if conn.execute("SELECT 1 FROM students WHERE matric_number = ?", (matric,)).fetchone() is None:
+        return f"Student {matric} is not registered; register them first"
+
+    with open(row[0], "rb") as crop_file:
+        data = crop_file.read()
+    path, digest = image_store.write_crop(ImageStore(image_root).folder(matric), data)
+    conn.execute("INSERT OR IGNORE INTO student_images (matric_number, image_path, content_hash) VALUES (?, ?, ?)",
+                 (matric, path, digest))
+
+    # Crops are aligned like enrolment crops, so the face is encoded without running the detector;
+    # recording the encoding also lets a running capture pick the student up
+    store = EncodingStore(db_path)
+    encoding = store.encode_image(path, image_store.FACE_BOX)
+    store.write_encodings(conn, [(path, matric, 0, 0, None if encoding is None else encoding.tobytes())])
+    discard(conn, face_id)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List, enrol and discard faces that matched no student")
+    parser.add_argument("command", choices=["list", "enrol", "discard"])
+    parser.add_argument("id", nargs="?", type=int, help="Unknown face id (enrol and discard)")
+    parser.add_argument("--matric", default=None, help="With enrol: the registered student the face belongs to")
+    parser.add_argument("--db", default=database.resource_path('student_attendance.db'), help="Path to student_attendance.db")
+    parser.add_argument("--root", default=image_store.IMAGE_ROOT, help="Folder holding the student image folders")
+    args = parser.parse_args()
+
+    if args.command != "list" and args.id is None:
+        parser.error(f"{args.command} needs an unknown face id")
+    if args.command == "enrol" and not args.matric:
+        parser.error("enrol needs --matric")
+
+    database.migrate(args.db)
+    conn = database.connect(args.db)
+    try:
+        if args.command == "list":
+            rows = conn.execute("SELECT id, sightings, first_seen, last_seen, image_path FROM unknown_faces "
+                                "ORDER BY sightings DESC, last_seen DESC").fetchall()
+            print(f"{'id':>6}{'seen':>6}  {'first seen':<20}{'last seen':<20}crop")
+            for face_id, sightings, first_seen, last_seen, image_path in rows:
+                print(f"{face_id:>6}{sightings:>6}  {first_seen:<20}{last_seen:<20}{image_path or '-'}")
+            print(f"{len(rows)} unknown faces")
+        elif args.command == "enrol":
+            with conn:
+                error = enrol(conn, args.db, args.id, args.matric, args.root)
+            print(f"Error: {error}" if error else f"Added unknown face {args.id} to {args.matric}")
+        else:
+            with conn:
+                found = discard(conn, args.id)
+            print(f"Discarded unknown face {args.id}" if found else f"Error: No unknown face {args.id}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
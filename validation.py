@@ -0,0 +1,31 @@
+# validation.py
+import re
+
+# Levels a student can be enrolled at
+VALID_LEVELS = {'100', '200', '300', '400', '500', '600'}
+
+
+def validate_matric(matric):
+    # Regular expression to validate the matric number format
+    pattern = r"^\d{2}/\d{2}[A-Za-z]{2}\d{3}$"
+    return bool(re.match(pattern, matric))
+
+
+def sanitize_matric(matric):
+    # Replace "/" with a safe character for file paths (e.g., "_")
+    return matric.replace("/", "_")
+
+
+def validate_name(name):
+    # Check if the name contains only alphabets and is between 3 and 40 characters
+    return name.replace(" ", "").isalpha() and 3 <= len(name) <= 40
+
+
+def validate_department(department):
+    # Check if the department contains only alphabets
+    return department.replace(" ", "").isalpha()
+
+
+def validate_level(level):
+    # Validate level to be one of the specified values
+    return level in VALID_LEVELS
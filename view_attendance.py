@@ -1,25 +1,178 @@
 # view_attendance.py
-import sys
 import sqlite3
-import os
+import logging
+import threading
+import database
+from archive import AttendancePruner
 from PyQt5.QtWidgets import (
-    QDialog, QVBoxLayout, QFormLayout, QPushButton, QTableWidget,
-    QTableWidgetItem, QLabel, QDateEdit, QMessageBox, QComboBox
+    QDialog, QVBoxLayout, QFormLayout, QPushButton, QTableView,
+    QLabel, QDateEdit, QMessageBox, QComboBox, QHeaderView, QProgressBar
 )
-from PyQt5.QtCore import QDate, QDateTime
-from PyQt5.QtGui import QIcon
+from PyQt5.QtCore import (
+    QDate, QDateTime, Qt, QAbstractTableModel, QModelIndex, QObject, QThread, QMetaObject,
+    pyqtSignal, pyqtSlot
+)
+
+log = logging.getLogger(__name__)
+
+# Rows fetched from SQLite per page
+PAGE_SIZE = 200
+
+
+class AttendanceQueryWorker(QObject):
+    """ Runs attendance queries on a background thread, one keyset-paginated page at a time. """
+
+    page_ready = pyqtSignal(int, list, bool)
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.db_path = db_path
+        self.conn = None
+
+    @pyqtSlot(int, object, object, int)
+    def fetch_page(self, request_id, date_range, after_key, limit):
+        # Connection is opened lazily so it belongs to the worker thread
+        if self.conn is None:
+            self.conn = database.connect(self.db_path)
+
+        conditions = []
+        params = []
+        if date_range:
+            start_date, end_date = date_range
+            conditions.append("a.ts BETWEEN ? AND ?")
+            params += [database.to_epoch(f"{start_date} 00:00:00"), database.to_epoch(f"{end_date} 23:59:59")]
+        if after_key:
+            # Continue strictly after the last row of the previous page in (ts, id) order
+            last_ts, last_id = after_key
+            conditions.append("(a.ts < ? OR (a.ts = ? AND a.id < ?))")
+            params += [last_ts, last_ts, last_id]
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        try:
+            rows = self.conn.execute(f"""
+                SELECT a.matric_number, COALESCE(a.name, s.name, ''), date(a.timestamp) as date,
+                       time(a.timestamp) as time, a.ts, a.id
+                FROM attendance a
+                LEFT JOIN students s ON s.matric_number = a.matric_number
+                {where}
+                ORDER BY a.ts DESC, a.id DESC
+                LIMIT ?
+            """, params + [limit + 1]).fetchall()
+        except sqlite3.Error as e:
+            log.warning("Error loading attendance history: %s", e)
+            rows = []
+
+        has_more = len(rows) > limit
+        self.page_ready.emit(request_id, rows[:limit], has_more)
+
+    @pyqtSlot()
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+class PruneWorker(QObject):
+    """ Archives or deletes attendance in batches on a background thread, reporting progress. """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(int, bool, str)
+
+    def __init__(self, db_path):
+        super().__init__()
+        self.pruner = AttendancePruner(db_path)
+        self.cancel_event = threading.Event()
+
+    @pyqtSlot(object, object, bool)
+    def run(self, before, after, archive):
+        self.cancel_event.clear()
+        try:
+            done, cancelled = self.pruner.run(before, after, archive, self.progress.emit, self.cancel_event)
+        except Exception as e:
+            # Anything escaping here would leave the dialog waiting on finished with its buttons disabled
+            self.finished.emit(0, False, str(e) or type(e).__name__)
+            return
+        self.finished.emit(done, cancelled, "")
+
+    def cancel(self):
+        # Called from the GUI thread; the current batch still completes
+        self.cancel_event.set()
+
+
+class AttendanceTableModel(QAbstractTableModel):
+    """ Table model that pulls attendance rows lazily from the query worker as the view scrolls. """
+
+    request_page = pyqtSignal(int, object, object, int)
+
+    HEADERS = ["Matric Number", "Name", "Date", "Time"]
+
+    def __init__(self, worker):
+        super().__init__()
+        self.rows = []
+        self.date_range = None
+        self._has_more = False
+        self._loading = False
+        self._request_id = 0
+
+        self.request_page.connect(worker.fetch_page)
+        worker.page_ready.connect(self.append_page)
 
-def resource_path(relative_path):
-    """ Get absolute path to resource, works for dev and for PyInstaller """
-    try:
-        # PyInstaller creates a temp folder and stores the path in _MEIPASS
-        base_path = sys._MEIPASS
-    except Exception:
-        base_path = os.path.abspath(".")
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return str(self.rows[index.row()][index.column()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def reset(self, date_range=None):
+        # Start over with new filters; pages still in flight for old filters are ignored
+        self.beginResetModel()
+        self.rows = []
+        self.date_range = date_range
+        self._has_more = True
+        self._loading = False
+        self._request_id += 1
+        self.endResetModel()
+        self.fetchMore(QModelIndex())
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._has_more and not self._loading
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._loading or not self._has_more:
+            return
+        self._loading = True
+        after_key = (self.rows[-1][4], self.rows[-1][5]) if self.rows else None
+        self.request_page.emit(self._request_id, self.date_range, after_key, PAGE_SIZE)
+
+    @pyqtSlot(int, list, bool)
+    def append_page(self, request_id, rows, has_more):
+        if request_id != self._request_id:
+            return
+        self._loading = False
+        self._has_more = has_more
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(rows) - 1)
+            self.rows.extend(rows)
+            self.endInsertRows()
+
+
+# Age of the newest record moved by "Archive Records", in days
+ARCHIVE_AGES = {"Select age": None, "4 weeks": 28, "3 months": 91, "6 months": 182, "1 year": 365}
 
-    return os.path.join(base_path, relative_path)
 
 class ViewAttendanceHistory(QDialog):
+    prune_requested = pyqtSignal(object, object, bool)
+
     def __init__(self):
         super().__init__()
 
@@ -48,20 +201,50 @@ class ViewAttendanceHistory(QDialog):
 
         filter_layout.addRow(QLabel("Delete Attendance History:"), self.delete_range_combo)
 
+        # Dropdown for moving old records to the archive database
+        self.archive_age_combo = QComboBox()
+        self.archive_age_combo.addItems(list(ARCHIVE_AGES))
+
+        filter_layout.addRow(QLabel("Archive Records Older Than:"), self.archive_age_combo)
+
         # Buttons
         self.filter_button = QPushButton("Filter Records")
         self.delete_button = QPushButton("Delete Records")
+        self.archive_button = QPushButton("Archive Records")
+        self.cancel_button = QPushButton("Cancel")
         self.close_button = QPushButton("Close")
 
-        # Table to display attendance records
-        self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(["Matric Number", "Name", "Date", "Time"])
+        # Deletes and archiving run in batches on their own thread so capture can keep writing
+        self.prune_progress = QProgressBar()
+        self.prune_progress.hide()
+        self.cancel_button.hide()
+        self.prune_thread = QThread(self)
+        self.prune_worker = PruneWorker(database.resource_path('student_attendance.db'))
+        self.prune_worker.moveToThread(self.prune_thread)
+        self.prune_thread.start()
+        self.prune_requested.connect(self.prune_worker.run)
+        self.prune_worker.progress.connect(self.show_prune_progress)
+        self.prune_worker.finished.connect(self.prune_finished)
+        self.prune_action = None
+
+        # Queries run on a worker thread; the table only asks for rows as they scroll into view
+        self.query_thread = QThread(self)
+        self.query_worker = AttendanceQueryWorker(database.resource_path('student_attendance.db'))
+        self.query_worker.moveToThread(self.query_thread)
+        self.query_thread.start()
+
+        self.model = AttendanceTableModel(self.query_worker)
+        self.table = QTableView()
+        self.table.setModel(self.model)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
 
         # Add widgets to layout
         layout.addLayout(filter_layout)
         layout.addWidget(self.filter_button)
         layout.addWidget(self.delete_button)
+        layout.addWidget(self.archive_button)
+        layout.addWidget(self.prune_progress)
+        layout.addWidget(self.cancel_button)
         layout.addWidget(self.table)
         layout.addWidget(self.close_button)
 
@@ -70,7 +253,10 @@ class ViewAttendanceHistory(QDialog):
         # Connect buttons to functions
         self.filter_button.clicked.connect(self.filter_records)
         self.delete_button.clicked.connect(self.delete_records)
+        self.archive_button.clicked.connect(self.archive_records)
+        self.cancel_button.clicked.connect(self.prune_worker.cancel)
         self.close_button.clicked.connect(self.close)
+        self.finished.connect(self.stop_query_thread)
 
         self.update_table()
 
@@ -80,35 +266,22 @@ class ViewAttendanceHistory(QDialog):
         self.update_table(start_date, end_date)
 
     def update_table(self, start_date=None, end_date=None):
-        conn = sqlite3.connect(resource_path('student_attendance.db'))
-        cursor = conn.cursor()
-
-        if start_date and end_date:
-            cursor.execute("""
-                SELECT matric_number, name, date(timestamp) as date, time(timestamp) as time
-                FROM attendance
-                WHERE timestamp BETWEEN ? AND ?
-                ORDER BY timestamp DESC
-            """, (f"{start_date} 00:00:00", f"{end_date} 23:59:59"))
-        else:
-            cursor.execute("""
-                SELECT matric_number, name, date(timestamp) as date, time(timestamp) as time
-                FROM attendance
-                ORDER BY timestamp DESC
-            """)
+        # Reload from the first page; further pages are fetched as the user scrolls
+        date_range = (start_date, end_date) if start_date and end_date else None
+        self.model.reset(date_range)
 
-        records = cursor.fetchall()
-        conn.close()
+    def stop_query_thread(self):
+        QMetaObject.invokeMethod(self.query_worker, "close", Qt.BlockingQueuedConnection)
+        self.query_thread.quit()
+        self.query_thread.wait()
 
-        self.table.setRowCount(len(records))
-        for row_num, row_data in enumerate(records):
-            for col_num, data in enumerate(row_data):
-                self.table.setItem(row_num, col_num, QTableWidgetItem(str(data)))
+        # Stop after the batch in progress; everything moved so far stays moved
+        self.prune_worker.cancel()
+        self.prune_thread.quit()
+        self.prune_thread.wait()
 
     def delete_records(self):
         selected_range = self.delete_range_combo.currentText()
-        conn = sqlite3.connect(resource_path('student_attendance.db'))
-        cursor = conn.cursor()
 
         # Determine time range for deletion
         if selected_range == "Last 15 minutes":
@@ -122,23 +295,55 @@ class ViewAttendanceHistory(QDialog):
         elif selected_range == "Last 4 weeks":
             time_range = QDateTime.currentDateTime().addDays(-28)
         elif selected_range == "All time":
-            cursor.execute("DELETE FROM attendance")
-            conn.commit()
-            QMessageBox.information(self, "Success", "All attendance records have been deleted.")
-            conn.close()
-            self.update_table()
-            return
+            time_range = None
         else:
             QMessageBox.warning(self, "Error", "Please select a valid date range.")
             return
 
-        if selected_range != "All time":
-            cursor.execute("""
-                DELETE FROM attendance 
-                WHERE timestamp >= ?
-            """, (time_range.toString("yyyy-MM-dd HH:mm:ss"),))
-            conn.commit()
-            QMessageBox.information(self, "Success", f"Attendance records from {selected_range} have been deleted.")
+        after = None
+        if time_range is not None:
+            after = database.to_epoch(time_range.toString("yyyy-MM-dd HH:mm:ss"))
+        self.start_prune(None, after, False, selected_range)
+
+    def archive_records(self):
+        selected_age = self.archive_age_combo.currentText()
+        days = ARCHIVE_AGES.get(selected_age)
+        if days is None:
+            QMessageBox.warning(self, "Error", "Please select how old the archived records should be.")
+            return
 
-        conn.close()
+        cutoff = QDateTime.currentDateTime().addDays(-days)
+        before = database.to_epoch(cutoff.toString("yyyy-MM-dd HH:mm:ss"))
+        self.start_prune(before, None, True, selected_age)
+
+    def start_prune(self, before, after, archive, label):
+        self.prune_action = (archive, label)
+        self.delete_button.setEnabled(False)
+        self.archive_button.setEnabled(False)
+        self.prune_progress.setValue(0)
+        self.prune_progress.show()
+        self.cancel_button.show()
+        self.prune_requested.emit(before, after, archive)
+
+    def show_prune_progress(self, done, total):
+        self.prune_progress.setMaximum(max(total, 1))
+        self.prune_progress.setValue(done)
+
+    def prune_finished(self, done, cancelled, error):
+        archive, label = self.prune_action
+        self.delete_button.setEnabled(True)
+        self.archive_button.setEnabled(True)
+        self.prune_progress.hide()
+        self.cancel_button.hide()
+
+        if error:
+            QMessageBox.warning(self, "Error", f"Error {'archiving' if archive else 'deleting'} records: {error}")
+        elif cancelled:
+            QMessageBox.information(self, "Cancelled", f"Stopped after {done} records.")
+        elif archive:
+            QMessageBox.information(self, "Success", f"{done} records older than {label} have been archived.")
+        elif label == "All time":
+            QMessageBox.information(self, "Success", "All attendance records have been deleted.")
+        else:
+            QMessageBox.information(self, "Success", f"Attendance records from {label} have been deleted.")
         self.update_table()
@@ -1,9 +1,152 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QPushButton, QMessageBox
-from PyQt5.QtGui import QPixmap
-from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QTableView, QHeaderView, QAbstractItemView, QMessageBox,
+    QStyledItemDelegate, QStyleOptionButton, QStyle, QApplication
+)
+from PyQt5.QtGui import QPixmap, QImage
+from PyQt5.QtCore import (
+    Qt, QAbstractTableModel, QModelIndex, QObject, QThread, QEvent, pyqtSignal, pyqtSlot
+)
+from collections import OrderedDict
 import sqlite3
-import os
-import sys
+import database
+from thumbnail_cache import ThumbnailCache, THUMBNAIL_SIZE
+
+# Decoded thumbnails kept in memory; the on-disk cache holds the rest
+PIXMAP_CACHE_SIZE = 500
+
+
+class ThumbnailLoader(QObject):
+    """ Loads thumbnails from the on-disk cache (creating them on a miss) on a background thread. """
+
+    loaded = pyqtSignal(str, QImage)
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    @pyqtSlot(str)
+    def load(self, image_path):
+        self.loaded.emit(image_path, self.cache.thumbnail(image_path))
+
+
+class StudentTableModel(QAbstractTableModel):
+    """
+    Student rows from a single query. Thumbnails are only requested when the view asks for a
+    row's image, so just the rows scrolled into view are ever decoded.
+    """
+
+    request_thumbnail = pyqtSignal(str)
+
+    HEADERS = ["Matric Number", "Name", "Department", "Level", "Image", "Action"]
+    IMAGE_COLUMN = 4
+    ACTION_COLUMN = 5
+
+    def __init__(self, loader):
+        super().__init__()
+        self.rows = []
+        self.rows_by_image = {}
+        self.pixmaps = OrderedDict()
+        self.requested = set()
+        self.missing = set()
+
+        self.request_thumbnail.connect(loader.load)
+        loader.loaded.connect(self.thumbnail_loaded)
+
+    def load(self, conn):
+        # First image per student comes from the (matric_number, id, image_path) index, no per-row queries
+        rows = conn.execute("""
+            SELECT s.matric_number, s.name, s.department, s.level,
+                   (SELECT i.image_path FROM student_images i
+                    WHERE i.matric_number = s.matric_number ORDER BY i.id LIMIT 1)
+            FROM students s
+        """).fetchall()
+
+        self.beginResetModel()
+        self.rows = rows
+        self.rows_by_image = {}
+        for row_index, row in enumerate(rows):
+            if row[4]:
+                self.rows_by_image.setdefault(row[4], []).append(row_index)
+        # Photos may have been retaken since the last load
+        self.requested.clear()
+        self.missing.clear()
+        self.pixmaps.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        column = index.column()
+
+        if column == self.IMAGE_COLUMN:
+            image_path = row[4]
+            if role == Qt.DisplayRole:
+                return "No Image" if not image_path or image_path in self.missing else None
+            if role == Qt.DecorationRole and image_path and image_path not in self.missing:
+                pixmap = self.pixmaps.get(image_path)
+                if pixmap is not None:
+                    self.pixmaps.move_to_end(image_path)
+                    return pixmap
+                if image_path not in self.requested:
+                    self.requested.add(image_path)
+                    self.request_thumbnail.emit(image_path)
+            return None
+
+        if column == self.ACTION_COLUMN:
+            return "Delete" if role == Qt.DisplayRole else None
+
+        if role == Qt.DisplayRole:
+            return row[column]
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    @pyqtSlot(str, QImage)
+    def thumbnail_loaded(self, image_path, image):
+        self.requested.discard(image_path)
+        if image_path not in self.rows_by_image:
+            return
+        if image.isNull():
+            self.missing.add(image_path)
+        else:
+            # QPixmap may only be created on the GUI thread
+            self.pixmaps[image_path] = QPixmap.fromImage(image)
+            while len(self.pixmaps) > PIXMAP_CACHE_SIZE:
+                self.pixmaps.popitem(last=False)
+
+        for row_index in self.rows_by_image[image_path]:
+            cell = self.index(row_index, self.IMAGE_COLUMN)
+            self.dataChanged.emit(cell, cell)
+
+
+class ButtonDelegate(QStyledItemDelegate):
+    """ Paints a push button in each cell instead of creating a widget per row. """
+
+    clicked = pyqtSignal(QModelIndex)
+
+    def paint(self, painter, option, index):
+        button = QStyleOptionButton()
+        button.rect = option.rect.adjusted(4, 4, -4, -4)
+        button.text = index.data()
+        button.state = QStyle.State_Enabled | QStyle.State_Raised
+        QApplication.style().drawControl(QStyle.CE_PushButton, button, painter)
+
+    def editorEvent(self, event, model, option, index):
+        if event.type() == QEvent.MouseButtonRelease and option.rect.contains(event.pos()):
+            self.clicked.emit(index)
+            return True
+        return False
+
 
 class ViewStudents(QDialog):
     def __init__(self):
@@ -15,81 +158,62 @@ class ViewStudents(QDialog):
         # Layout setup
         layout = QVBoxLayout()
 
-        # Table Widget
-        self.table = QTableWidget()
-        self.table.setColumnCount(6)  # Extra column for delete button
-        self.table.setHorizontalHeaderLabels(["Matric Number", "Name", "Department", "Level", "Image", "Action"])
+        # Thumbnails are read (or generated) on a worker thread and handed back as QImages
+        self.thumbnail_thread = QThread(self)
+        self.thumbnail_loader = ThumbnailLoader(ThumbnailCache(database.resource_path('thumbnails')))
+        self.thumbnail_loader.moveToThread(self.thumbnail_thread)
+        self.thumbnail_thread.start()
+
+        # Table view
+        self.model = StudentTableModel(self.thumbnail_loader)
+        self.table = QTableView()
+        self.table.setModel(self.model)
         self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        # Fixed row height, so Qt never has to ask every row for its image to lay out the table
+        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(THUMBNAIL_SIZE + 4)
+
+        # Action button
+        self.delete_delegate = ButtonDelegate(self.table)
+        self.delete_delegate.clicked.connect(
+            lambda index: self.delete_student(self.model.rows[index.row()][0]))
+        self.table.setItemDelegateForColumn(StudentTableModel.ACTION_COLUMN, self.delete_delegate)
 
         layout.addWidget(self.table)
         self.setLayout(layout)
+        self.finished.connect(self.stop_thumbnail_thread)
 
         # Load data into the table
         self.load_student_data()
 
-    def resource_path(self, relative_path):
-        """ Get the absolute path to the resource, works for development and PyInstaller. """
-        base_path = getattr(sys, '_MEIPASS', os.path.dirname(os.path.abspath(__file__)))
-        return os.path.join(base_path, relative_path)
+    def stop_thumbnail_thread(self):
+        self.thumbnail_thread.quit()
+        self.thumbnail_thread.wait()
 
     def load_student_data(self):
         try:
             # Connect to the database using resource_path
-            db_path = self.resource_path('student_attendance.db')
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            # Fetch distinct student records
-            cursor.execute("SELECT matric_number, name, department, level FROM students")
-            student_rows = cursor.fetchall()
-
-            self.table.setRowCount(len(student_rows))
-
-            # Populate the table with data
-            for row_index, student in enumerate(student_rows):
-                matric_number, name, department, level = student
-
-                # Query to fetch the first image path associated with the student's matric number
-                cursor.execute("SELECT image_path FROM student_images WHERE matric_number = ? ORDER BY rowid LIMIT 1", (matric_number,))
-                image_row = cursor.fetchone()
-                image_path = image_row[0] if image_row else ""
-
-                # Add student details to table
-                self.table.setItem(row_index, 0, QTableWidgetItem(matric_number))
-                self.table.setItem(row_index, 1, QTableWidgetItem(name))
-                self.table.setItem(row_index, 2, QTableWidgetItem(department))
-                self.table.setItem(row_index, 3, QTableWidgetItem(level))
-
-                # Display the first image
-                if image_path and os.path.exists(image_path):
-                    pixmap = QPixmap(image_path)
-                    pixmap = pixmap.scaled(100, 100, Qt.KeepAspectRatio)
-                    image_label = QLabel()
-                    image_label.setPixmap(pixmap)
-                    self.table.setCellWidget(row_index, 4, image_label)
-                else:
-                    self.table.setItem(row_index, 4, QTableWidgetItem("No Image"))
-
-                # Action button
-                delete_button = QPushButton("Delete")
-                delete_button.clicked.connect(lambda _, matric_number=matric_number: self.delete_student(matric_number))
-                self.table.setCellWidget(row_index, 5, delete_button)
-
-            conn.close()
+            db_path = database.resource_path('student_attendance.db')
+            conn = database.connect(db_path)
+            try:
+                self.model.load(conn)
+            finally:
+                conn.close()
         except Exception as e:
             QMessageBox.critical(self, "Error", f"An error occurred while loading data: {str(e)}")
 
     def delete_student(self, matric_number):
         try:
             # Connect to the database using resource_path
-            db_path = self.resource_path('student_attendance.db')
+            db_path = database.resource_path('student_attendance.db')
             conn = sqlite3.connect(db_path)
             cursor = conn.cursor()
 
             # Delete the student record and associated images
             cursor.execute("DELETE FROM students WHERE matric_number = ?", (matric_number,))
             cursor.execute("DELETE FROM student_images WHERE matric_number = ?", (matric_number,))
+            cursor.execute("DELETE FROM face_encodings WHERE matric_number = ?", (matric_number,))
 
             conn.commit()
             conn.close()